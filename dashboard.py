@@ -11,6 +11,7 @@ import pandas as pd
 import streamlit as st
 
 from model_prediction import model_predictor as pr
+from support_modules.readers import log_store as ls
 
 # ----------------------------------------------------------------------------------
 # --                         Dashboard Global View                             -- #
@@ -152,6 +153,16 @@ def main(argv):
             # --Hard Coded Value
             parameters['is_single_exec'] = True
             parameters['rep'] = 1
+            parameters['seed'] = None  # seed of the random variants, None for a fresh one
+            parameters['workers'] = 1  # processes of the batch mode, cases are sharded above 1
+            parameters['inference_batch_size'] = 1024  # rows per model call in batch mode
+            parameters['inference_engine'] = 'numpy'  # numpy or keras (needs tensorflow), an inference server uses the engine it was started with
+            parameters['inference_server'] = None  # host:port or socket of inference_server.py, None to predict in process
+            parameters['prediction_table'] = True  # answer the test log prefixes from prediction_table.npz when built
+            parameters['stream_batch_size'] = None  # max events per group of cases sampled at once in batch mode (a longer case is a group on its own), bounds the samples but not the predictions, None for the whole log
+            parameters['sample_cache'] = False  # memory map the batch samples of the test log from output_files/<folder>/samples
+            parameters['sample_cache_size'] = 2 ** 30  # bytes of samples kept per output folder, the least recently used are evicted
+            parameters['role_discovery'] = 'full'  # roles of logs without them: full, cached (output_files/<folder>/parameters/roles) or incremental (opt in, new users join the cached roles)
 
             # --- Common Functions Used Across different sub-page
 
@@ -165,10 +176,11 @@ def main(argv):
                 with st.sidebar.expander('Variant'):
                     st.info("Select **Max Probability** for the most probable events,"
                             " **Multiple Prediction** for the prediction of the multiple events, "
-                            "and **Random Prediction** for prediction of random recommendation of events")
+                            "**Random Prediction** for prediction of random recommendation of events, "
+                            "and **Beam Search Prediction** for the most probable sequences of events")
                     variant_opt = st.selectbox("", (
                         'Max Probability', 'Multiple Prediction', 'Random Prediction',
-                        'Multiple Random Prediction'),
+                        'Multiple Random Prediction', 'Beam Search Prediction'),
                                                key='variant_opt', on_change=clear_cache)
 
                 if variant_opt == 'Max Probability':
@@ -177,11 +189,13 @@ def main(argv):
                 elif variant_opt == 'Random Prediction':
                     variant_opt = 'random_choice'
                     slider = 1
-                elif variant_opt in ['Multiple Prediction', 'Multiple Random Prediction']:
+                elif variant_opt in ['Multiple Prediction', 'Multiple Random Prediction', 'Beam Search Prediction']:
                     if variant_opt == 'Multiple Prediction':
                         variant_opt = 'multi_pred'
                     elif variant_opt == 'Multiple Random Prediction':
                         variant_opt = 'multi_pred_rand'
+                    elif variant_opt == 'Beam Search Prediction':
+                        variant_opt = 'beam'
                     # variant_opt = 'multi_pred'
 
                     if actcount > rolecount:
@@ -204,17 +218,15 @@ def main(argv):
                 input_file = os.path.join('output_files', parameters['folder'], 'parameters', 'test_log.csv')
                 parameter_file = os.path.join('output_files', parameters['folder'], 'parameters',
                                               'model_parameters.json')
-                filter_log = pd.read_csv(input_file, dtype={'user': str})
-                # Standard Code based on log_reader
-                filter_log = filter_log.rename(columns=column_names)
-                filter_log = filter_log.astype({'caseid': object})
-                filter_log = (
-                    filter_log[(filter_log.task != 'Start') & (filter_log.task != 'End')].reset_index(drop=True))
-                filter_log_columns = filter_log.columns
                 with open(parameter_file) as pfile:
                     parameter_data = json.load(pfile)
                     file_name = parameter_data["file_name"]
                     pfile.close()
+                # The log is parsed once by the store and shared with the predictor
+                filter_log = ls.LOG_STORE.get(input_file, parameter_data['read_options']).parsed_types()
+                # timestamps are displayed as in the csv file
+                filter_log['end_timestamp'] = filter_log.end_timestamp.astype(str)
+                filter_log_columns = filter_log.columns
                 return filter_log, filter_log_columns, file_name
 
             def next_columns(filter_log, display_columns, index=None, flag=None):
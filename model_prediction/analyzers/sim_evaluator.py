@@ -14,6 +14,7 @@ from scipy.optimize import linear_sum_assignment
 # from scipy.stats import wasserstein_distance
 
 from model_prediction.analyzers import alpha_oracle as ao
+from support_modules import features_manager as feat
 from model_prediction.analyzers.alpha_oracle import Rel
 
 
@@ -665,33 +666,22 @@ class Evaluator():
         Returns:
             Dataframe: The dataframe with the calculated features added.
         """
-        log['dur'] = 0
-        log = log.to_dict('records')
-        log = sorted(log, key=lambda x: x['caseid'])
-        for _, group in itertools.groupby(log, key=lambda x: x['caseid']):
-            events = list(group)
-            ordk = 'end_timestamp' if self.one_timestamp else 'start_timestamp'
-            events = sorted(events, key=itemgetter(ordk))
-            for i in range(0, len(events)):
-                # In one-timestamp approach the first activity of the trace
-                # is taken as instant since there is no previous timestamp
-                if self.one_timestamp:
-                    if i == 0:
-                        dur = 0
-                    else:
-                        dur = (events[i]['end_timestamp'] -
-                               events[i-1]['end_timestamp']).total_seconds()
-                else:
-                    dur = (events[i]['end_timestamp'] -
-                           events[i]['start_timestamp']).total_seconds()
-                    if i == 0:
-                        wit = 0
-                    else:
-                        wit = (events[i]['start_timestamp'] -
-                               events[i-1]['end_timestamp']).total_seconds()
-                    events[i]['wait'] = wit
-                events[i]['dur'] = dur
-        return pd.DataFrame.from_dict(log)
+        fm = feat.FeaturesMannager
+        ordk = 'end_timestamp' if self.one_timestamp else 'start_timestamp'
+        log = log.sort_values('caseid', kind='mergesort').reset_index(drop=True)
+        order, first = fm.case_time_order(log, ordk)
+        end = fm.nanoseconds(log['end_timestamp'], order)
+        # In one-timestamp approach the first activity of the trace
+        # is taken as instant since there is no previous timestamp
+        if self.one_timestamp:
+            log['dur'] = fm.restore_order(
+                np.where(first, 0, fm.seconds(end - np.roll(end, 1))), order)
+        else:
+            start = fm.nanoseconds(log['start_timestamp'], order)
+            log['dur'] = fm.restore_order(fm.seconds(end - start), order)
+            log['wait'] = fm.restore_order(
+                np.where(first, 0, fm.seconds(start - np.roll(end, 1))), order)
+        return log
 
     def scaling_data(self, data):
         """
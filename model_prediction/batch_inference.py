@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+import numpy as np
+
+
+class CaseStreams():
+    """
+    Random generators of the random variants, one stream per case. The
+    draws of a case don't depend on the other cases of the log, so a
+    shard of the log draws the same events as the whole log.
+    """
+
+    def __init__(self, seed=None):
+        """constructor, without seed the streams take fresh entropy"""
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self._streams = dict()
+
+    def get(self, caseid):
+        """Generator of a case"""
+        if caseid not in self._streams:
+            # stable across processes, unlike hash()
+            digest = int(hashlib.sha1(str(caseid).encode('utf-8')).hexdigest(), 16)
+            self._streams[caseid] = np.random.default_rng([self.entropy, digest])
+        return self._streams[caseid]
+
+    def rows(self, caseids):
+        """Generator of the case of every row"""
+        return [self.get(x) for x in caseids]
+
+
+def predict_batch(model, inputs, chunk_size):
+    """Runs the model over stacked inputs in chunks of fixed size. The
+    float32 outputs can differ in the last bits from the ones of one row
+    per call, which moves some rescaled times by 1s.
+    Args:
+        model: trained model.
+        inputs (list): stacked model inputs.
+        chunk_size (int): maximum number of rows per model call.
+    Returns:
+        list: activity probabilities, role probabilities and times.
+    """
+    num = len(inputs[0])
+    chunks = list()
+    for start in range(0, num, chunk_size):
+        chunk = [x[start:start + chunk_size] for x in inputs]
+        chunks.append(model.predict(chunk, batch_size=chunk_size))
+    if not chunks:
+        return [np.zeros((0, 0)), np.zeros((0, 0)), np.zeros((0, 1))]
+    return [np.concatenate([c[out] for c in chunks], axis=0)
+            for out in range(len(chunks[0]))]
+
+
+def predict_indexed(model, windows, chunk_size):
+    """Predicts the unique windows only and fans the outputs back out.
+    Args:
+        model: trained model.
+        windows (dict): unique inputs and inverse index of the prefixes.
+        chunk_size (int): maximum number of rows per model call.
+    Returns:
+        list: activity probabilities, role probabilities and times per prefix.
+    """
+    preds = predict_batch(model, windows['inputs'], chunk_size)
+    return [x[windows['inverse']] for x in preds]
+
+
+def select_next_events(preds, imp, nx, rng=None):
+    """Decodes the predicted activities and roles of all the rows.
+    Args:
+        preds (list): activity and role probabilities of shape (N, classes).
+        imp (str): method of next event selection.
+        nx (int): number of predictions in the multi variants.
+        rng (Generator): random generator of the random variants, or a
+            list with the generator of every row.
+    Returns:
+        list: (activity, role, activity prob, role prob) per row.
+    """
+    ac_probs, rl_probs = preds[0], preds[1]
+    selected = list()
+    if imp == 'arg_max':
+        pos = np.argmax(ac_probs, axis=1)
+        pos1 = np.argmax(rl_probs, axis=1)
+        for i in range(len(ac_probs)):
+            selected.append((pos[i], pos1[i],
+                             ac_probs[i][pos[i]], rl_probs[i][pos1[i]]))
+    elif imp == 'multi_pred':
+        pos = (-ac_probs).argsort(axis=1)[:, :nx]
+        pos1 = (-rl_probs).argsort(axis=1)[:, :nx]
+        for i in range(len(ac_probs)):
+            selected.append((pos[i].tolist(), pos1[i].tolist(),
+                             [ac_probs[i][x] for x in pos[i]],
+                             [rl_probs[i][x] for x in pos1[i]]))
+    elif imp == 'random_choice':
+        # Use this to get a random choice following as PDF
+        pos = gumbel_top_k(ac_probs, 1, rng)[:, 0]
+        pos1 = gumbel_top_k(rl_probs, 1, rng)[:, 0]
+        for i in range(len(ac_probs)):
+            selected.append((pos[i], pos1[i],
+                             ac_probs[i][pos[i]], rl_probs[i][pos1[i]]))
+    elif imp == 'multi_pred_rand':
+        pos = gumbel_top_k(ac_probs, nx, rng)
+        pos1 = gumbel_top_k(rl_probs, nx, rng)
+        for i in range(len(ac_probs)):
+            selected.append((pos[i].tolist(), pos1[i].tolist(),
+                             [ac_probs[i][x] for x in pos[i]],
+                             [rl_probs[i][x] for x in pos1[i]]))
+    elif imp == 'beam':
+        # Joint top nx of activity and role by log-probability
+        scores, pos, pos1 = expand_beams(preds, np.zeros((len(ac_probs), 1)), nx)[1:]
+        for i in range(len(ac_probs)):
+            selected.append((pos[i].tolist(), pos1[i].tolist(),
+                             [ac_probs[i][x] for x in pos[i]],
+                             [rl_probs[i][x] for x in pos1[i]]))
+    else:
+        raise ValueError(imp)
+    return selected
+
+
+def select_repetitions(preds, imp, nx, rep, rng=None):
+    """Decodes rep independent repetitions of the same predictions, the
+    random variants draw the rep x N samples at once.
+    Args:
+        preds (list): activity and role probabilities of shape (N, classes).
+        imp (str): method of next event selection.
+        nx (int): number of predictions in the multi variants.
+        rep (int): number of repetitions.
+        rng (Generator): random generator of the random variants, or a
+            list with the generator of every row.
+    Returns:
+        list: selected events of every repetition.
+    """
+    num = len(preds[0])
+    if imp in ['random_choice', 'multi_pred_rand']:
+        if isinstance(rng, list):
+            rng = rng * rep
+        selected = select_next_events(
+            [np.tile(x, (rep, 1)) for x in preds[:2]], imp, nx, rng)
+        return [selected[run * num:(run + 1) * num] for run in range(rep)]
+    # the rest of variants are deterministic
+    return [select_next_events(preds, imp, nx)] * rep
+
+
+def gumbel_top_k(probs, k, rng=None):
+    """Draws k classes of every row without replacement following its
+    probabilities, using the Gumbel-max trick.
+    Args:
+        probs (array): probabilities of shape (N, classes).
+        k (int): number of classes to draw.
+        rng (Generator): random generator, or a list with the generator
+            of every row.
+    Returns:
+        array: drawn classes of shape (N, k).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if isinstance(rng, list):
+        noise = np.array([x.gumbel(size=np.shape(probs)[1:]) for x in rng]).reshape(np.shape(probs))
+    else:
+        noise = rng.gumbel(size=np.shape(probs))
+    with np.errstate(divide='ignore'):
+        keys = np.log(probs) + noise
+    return np.argsort(-keys, axis=1, kind='stable')[:, :k]
+
+
+def expand_beams(preds, scores, nx):
+    """Expands every beam with all the activity and role pairs and keeps
+    the nx best joint sequences of each case.
+    Args:
+        preds (list): probabilities of shape (cases * beams, classes).
+        scores (array): cumulative log-probability of shape (cases, beams).
+        nx (int): number of beams to keep.
+    Returns:
+        tuple: parent beam, score, activity and role of the kept beams.
+    """
+    num, beams = scores.shape
+    ac_logp = np.log(np.clip(preds[0], 1e-12, 1.0)).reshape((num, beams, -1))
+    rl_logp = np.log(np.clip(preds[1], 1e-12, 1.0)).reshape((num, beams, -1))
+    joint = (scores[:, :, None, None] + ac_logp[:, :, :, None]
+             + rl_logp[:, :, None, :])
+    flat = joint.reshape((num, -1))
+    best = np.argsort(-flat, axis=1, kind='stable')[:, :nx]
+    parent, pos, pos1 = np.unravel_index(best, joint.shape[1:])
+    return parent, np.take_along_axis(flat, best, axis=1), pos, pos1
+
+
+def rollout(model, prefixes, parms, imp, generative=False):
+    """Predicts the events of every case in lockstep, one model call per
+    step for all the active cases instead of one per case and step. A
+    chain stops once it predicts the end activity or its trace reaches
+    max_trace_size events, its remaining prefixes repeat the end event
+    with probability 1 and no time, without calling the model.
+    Args:
+        model: trained model.
+        prefixes (PrefixStore): prefixes of the cases, grouped by case
+            and starting with the prefix of size batchprefixnum + 1.
+        parms (dict): batchprefixnum, multiprednum, inference_batch_size,
+            one_timestamp, index_ac, max_trace_size, caseid of every
+            prefix and the CaseStreams rng.
+        imp (str): method of next event selection.
+        generative (bool): feed the whole predicted suffix back to the
+            model instead of the last prediction only.
+    Returns:
+        list: [activity, role, time, activity prob, role prob] per prefix.
+    """
+    if imp not in ['arg_max', 'random_choice', 'multi_pred', 'multi_pred_rand', 'beam']:
+        raise ValueError(imp)
+    chunk_size = parms['inference_batch_size']
+    multi = imp in ['multi_pred', 'multi_pred_rand', 'beam']
+    # every case follows nx chains, each one fed with its own predictions,
+    # in beam search the chains are the nx best suffixes of the case
+    nx = parms['multiprednum'] if multi else 1
+    chain_imp = 'random_choice' if imp in ['random_choice', 'multi_pred_rand'] else 'arg_max'
+    end = [k for k, v in parms['index_ac'].items() if v == 'end'][0]
+    sizes = prefixes.sizes().astype(int)
+    steps = sizes - (parms['batchprefixnum'] + 1)
+    if len(steps) == 0:
+        return list()
+    cases = np.cumsum(steps == 0) - 1
+    # position of the prefix of every case and step, -1 once the case ended
+    rows = -np.ones((cases[-1] + 1, steps.max() + 1), dtype=int)
+    rows[cases, steps] = np.arange(len(steps))
+    results = [None] * len(steps)
+    # First step, the prefixes of the log
+    inputs = prefixes.inputs(rows[:, 0])
+    preds = predict_batch(model, inputs, chunk_size)
+    streams = parms['rng'].rows(np.asarray(parms['caseid'])[rows[:, 0]])
+    selected = select_next_events(preds, imp, nx, streams)
+    shapes = [(x.shape[1], x.dtype) for x in preds]
+    num_tm = shapes[2][0]
+    last_ac = np.zeros((len(rows), nx), dtype=int)
+    last_rl = np.zeros((len(rows), nx), dtype=int)
+    last_tm = np.zeros((len(rows), nx, num_tm))
+    if imp == 'beam':
+        scores = np.array([np.log(np.clip(np.array(x[2]) * np.array(x[3]), 1e-12, 1.0))
+                           for x in selected])
+    for case, i in enumerate(rows[:, 0]):
+        pos, pos1, pos_prob, pos1_prob = selected[case]
+        tm = preds[2][case][0]
+        results[i] = [pos, pos1, [tm] * nx if multi else tm, pos_prob, pos1_prob]
+        if not parms['one_timestamp']:
+            results[i].extend([preds[2][case][1]])
+        last_ac[case], last_rl[case], last_tm[case] = pos, pos1, preds[2][case]
+    done = (last_ac == end) | (sizes[rows[:, 0]] >= parms['max_trace_size'])[:, None]
+    if generative:
+        # Rolling windows of the predicted suffix of every chain
+        windows = [np.repeat(x, nx, axis=0) for x in inputs[:3]]
+    # Following steps, all the active chains in a single batch
+    for step in range(1, rows.shape[1]):
+        active = np.where(rows[:, step] >= 0)[0]
+        index = rows[active, step]
+        chains = (active[:, None] * nx + np.arange(nx)).ravel()
+        ended = done.ravel()[chains]
+        if generative:
+            for window, last in zip(windows, [last_ac, last_rl, last_tm]):
+                window[chains, :-1] = window[chains, 1:]
+                window[chains, -1] = last.reshape((len(window),) + window.shape[2:])[chains]
+        # the ended chains repeat the end event without calling the model
+        preds = [np.zeros((len(chains), x), dtype=dtype) for x, dtype in shapes]
+        preds[0][ended, end] = 1.0
+        preds[1][ended, last_rl.ravel()[chains[ended]]] = 1.0
+        live = np.where(~ended)[0]
+        if len(live) > 0:
+            if generative:
+                inputs = [x[chains[live]] for x in windows]
+                inputs.extend([np.repeat(x, nx, axis=0)[live]
+                               for x in prefixes.inputs(index)[3:]])
+            else:
+                # The last event of the prefix is replaced by the prediction
+                inputs = [np.repeat(x, nx, axis=0)[live] for x in prefixes.inputs(index)]
+                inputs[0][:, -1] = last_ac.ravel()[chains[live]]
+                inputs[1][:, -1] = last_rl.ravel()[chains[live]]
+                inputs[2][:, -1] = last_tm.reshape((-1, num_tm))[chains[live]]
+            for pred, value in zip(preds, predict_batch(model, inputs, chunk_size)):
+                pred[live] = value
+        if imp == 'beam':
+            parent, scores[active], pos, pos1 = expand_beams(
+                preds, scores[active], nx)
+            # the kept beams inherit the windows and outputs of their parents
+            parent = (np.arange(len(active))[:, None] * nx + parent).ravel()
+            if generative:
+                for window in windows:
+                    window[chains] = window[chains[parent]]
+            preds = [x[parent] for x in preds]
+            ended = ended[parent]
+            pos, pos1 = pos.ravel(), pos1.ravel()
+            selected = [(pos[x], pos1[x], preds[0][x][pos[x]], preds[1][x][pos1[x]])
+                        for x in range(len(pos))]
+        else:
+            selected = [(end, last_rl.ravel()[x], 1.0, 1.0) for x in chains]
+            live_selected = select_next_events(
+                [x[live] for x in preds[:2]], chain_imp, 1,
+                [streams[x] for x in chains[live] // nx])
+            for x, event in zip(live, live_selected):
+                selected[x] = event
+        for num, (case, i) in enumerate(zip(active, index)):
+            chain = selected[num * nx:(num + 1) * nx]
+            pos = [x[0] for x in chain]
+            pos1 = [x[1] for x in chain]
+            tm = [x[0] for x in preds[2][num * nx:(num + 1) * nx]]
+            if multi:
+                results[i] = [pos, pos1, tm,
+                              [x[2] for x in chain], [x[3] for x in chain]]
+            else:
+                results[i] = [pos[0], pos1[0], tm[0], chain[0][2], chain[0][3]]
+            if not parms['one_timestamp']:
+                results[i].extend([preds[2][(num + 1) * nx - 1][1]])
+            last_ac[case], last_rl[case] = pos, pos1
+            last_tm[case] = preds[2][num * nx:(num + 1) * nx]
+            done[case] = (ended[num * nx:(num + 1) * nx] | (last_ac[case] == end)
+                          | (sizes[i] >= parms['max_trace_size']))
+    return results
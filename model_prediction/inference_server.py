@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+Local inference daemon shared by the dashboard sessions, it owns the
+loaded models and predicts the prefix windows of all the sessions in
+micro-batches.
+
+    python -m model_prediction.inference_server -a 127.0.0.1:8765 -e numpy
+
+The address is a loopback host:port or the path of a unix socket.
+Messages are a json header followed by the raw float32 buffers of
+their arrays, so a client can only send data to the server. The
+engine is fixed when the server starts and the clients can only ask
+for the .h5 files of the folders of output_files.
+"""
+import os
+import sys
+import json
+import getopt
+import socket
+import struct
+import asyncio
+import ipaddress
+import threading
+
+from functools import partial
+
+import numpy as np
+
+from model_prediction import model_registry as mr
+
+HEADER = struct.Struct('!Q')
+MAX_HEADER_SIZE = 1 << 20
+OUTPUT_FILES = 'output_files'
+
+
+def encode_message(message):
+    """Frames a message as the size of its json header, the header and
+    the float32 buffers of the arrays listed in message['arrays']"""
+    arrays = [np.ascontiguousarray(x, dtype=np.float32)
+              for x in message.get('arrays', list())]
+    header = {k: v for k, v in message.items() if k != 'arrays'}
+    header['shapes'] = [list(x.shape) for x in arrays]
+    data = json.dumps(header).encode('utf-8')
+    return b''.join([HEADER.pack(len(data)), data] + [x.tobytes() for x in arrays])
+
+
+def decode_header(data):
+    """Reads the json header of a message, returns the header and the
+    shapes of the arrays that follow it"""
+    header = json.loads(data.decode('utf-8'))
+    if not isinstance(header, dict) or not isinstance(header.get('shapes'), list):
+        raise ValueError('invalid message header')
+    shapes = header.pop('shapes')
+    for shape in shapes:
+        if not (isinstance(shape, list)
+                and all(isinstance(x, int) and x >= 0 for x in shape)):
+            raise ValueError(shape)
+    return header, shapes
+
+
+def header_size(data):
+    size = HEADER.unpack(data)[0]
+    if size > MAX_HEADER_SIZE:
+        raise ValueError(size)
+    return size
+
+
+def array_size(shape):
+    return int(np.prod(shape, dtype=np.int64)) * np.dtype(np.float32).itemsize
+
+
+def check_limits(shapes, max_rows, max_bytes):
+    """Rejects the requests above max_rows rows per array or max_bytes
+    bytes in total, before their buffers are read"""
+    for shape in shapes:
+        if shape and shape[0] > max_rows:
+            raise ValueError('{} rows, the limit is {}'.format(shape[0], max_rows))
+    size = sum(array_size(x) for x in shapes)
+    if size > max_bytes:
+        raise ValueError('{} bytes, the limit is {}'.format(size, max_bytes))
+
+
+def resolve_model(model):
+    """Folder and file of a model requested by a client, the .h5 file must
+    exist in a folder of output_files.
+    Args:
+        model (list): folder and model file.
+    Returns:
+        tuple: folder and model file.
+    """
+    if not (isinstance(model, list) and len(model) == 2
+            and all(isinstance(x, str) and x for x in model)):
+        raise ValueError('invalid model')
+    root = os.path.realpath(OUTPUT_FILES)
+    folder = os.path.realpath(os.path.join(root, model[0]))
+    path = os.path.realpath(os.path.join(folder, model[1]))
+    if (os.path.dirname(folder) != root or os.path.dirname(path) != folder
+            or not path.endswith('.h5') or not os.path.isfile(path)):
+        raise ValueError('unknown model {}'.format(model))
+    return os.path.basename(folder), os.path.basename(path)
+
+
+async def read_message(reader, max_rows=np.inf, max_bytes=np.inf):
+    try:
+        size = header_size(await reader.readexactly(HEADER.size))
+        message, shapes = decode_header(await reader.readexactly(size))
+        check_limits(shapes, max_rows, max_bytes)
+        message['arrays'] = [
+            np.frombuffer(await reader.readexactly(array_size(x)),
+                          dtype=np.float32).reshape(x)
+            for x in shapes]
+        return message
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def write_message(writer, message):
+    writer.write(encode_message(message))
+    await writer.drain()
+
+
+def check_loopback(host, port):
+    """Rejects the hosts that resolve to an address of another interface"""
+    if not host:
+        raise ValueError('the inference server only listens on loopback addresses')
+    for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not address.is_loopback:
+            raise ValueError('the inference server only listens on loopback '
+                             'addresses, not ' + host)
+
+
+class MicroBatcher():
+    """
+    Queue of the prefix windows of one model, flushed as a single batch
+    once it reaches max_batch rows or its oldest request waited max_delay
+    """
+
+    def __init__(self, model, max_batch, max_delay, stats):
+        """constructor"""
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = stats
+        self.queue = asyncio.Queue()
+        self.pending_rows = 0
+
+    async def predict(self, inputs):
+        future = asyncio.get_running_loop().create_future()
+        self.pending_rows += len(inputs[0])
+        await self.queue.put((inputs, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            rows = len(items[0][0][0])
+            deadline = loop.time() + self.max_delay
+            while rows < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                rows += len(item[0][0])
+            self.pending_rows -= rows
+            inputs = [np.concatenate([x[0][i] for x in items], axis=0)
+                      for i in range(len(items[0][0]))]
+            try:
+                outputs = await loop.run_in_executor(
+                    None, partial(self.model.predict, inputs, batch_size=max(rows, 1)))
+            except Exception as error:
+                for _, future in items:
+                    # the requests of closed connections are cancelled
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.stats['batches'] += 1
+            self.stats['batched_rows'] += rows
+            self.stats['max_batch_size'] = max(self.stats['max_batch_size'], rows)
+            start = 0
+            for x, future in items:
+                end = start + len(x[0])
+                if not future.done():
+                    future.set_result([np.asarray(o)[start:end] for o in outputs])
+                start = end
+
+
+class InferenceServer():
+    """
+    Asyncio server that predicts the windows sent by the clients of all
+    the sessions with the models of the process registry
+    """
+
+    def __init__(self, engine='numpy', max_batch=1024, max_delay=0.005,
+                 max_rows=1 << 16, max_bytes=1 << 28):
+        """constructor"""
+        if engine not in ['numpy', 'keras']:
+            raise ValueError(engine)
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.batchers = dict()
+        self.stats = {'requests': 0, 'rows': 0, 'batches': 0,
+                      'batched_rows': 0, 'max_batch_size': 0}
+        self._dispatcher = {'predict': self._predict,
+                            'input_shape': self._input_shape,
+                            'stats': self._stats}
+
+    def serve(self, address):
+        asyncio.run(self._serve(address))
+
+    async def _serve(self, address):
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            check_loopback(host, int(port))
+            server = await asyncio.start_server(self._handle, host, int(port))
+        else:
+            server = await asyncio.start_unix_server(self._handle, address)
+        print('Inference server listening on', address)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                message = await read_message(reader, self.max_rows, self.max_bytes)
+                if message is None:
+                    break
+                try:
+                    handler = self._dispatcher.get(message['op'])
+                    if not handler:
+                        raise ValueError(message['op'])
+                    response = await handler(message)
+                except Exception as error:
+                    response = {'error': repr(error)}
+                await write_message(writer, response)
+        except ValueError:
+            # malformed or oversized request, the connection is dropped
+            pass
+        finally:
+            writer.close()
+
+    async def _get_batcher(self, model):
+        key = resolve_model(model)
+        if key not in self.batchers:
+            # Loading blocks for seconds, it runs out of the event loop
+            registered = await asyncio.get_running_loop().run_in_executor(
+                None, mr.MODEL_REGISTRY.get, *key, self.engine)
+            if key not in self.batchers:
+                batcher = MicroBatcher(registered['model'], self.max_batch,
+                                       self.max_delay, self.stats)
+                self.batchers[key] = batcher
+                asyncio.get_running_loop().create_task(batcher.run())
+        return self.batchers[key]
+
+    async def _predict(self, message):
+        batcher = await self._get_batcher(message.get('model'))
+        self.stats['requests'] += 1
+        self.stats['rows'] += len(message['arrays'][0])
+        return {'arrays': await batcher.predict(message['arrays'])}
+
+    async def _input_shape(self, message):
+        batcher = await self._get_batcher(message.get('model'))
+        return {'input_shape': [list(x) for x in batcher.model.input_shape]}
+
+    async def _stats(self, message):
+        stats = dict(self.stats)
+        stats['queue_depth'] = sum(x.queue.qsize() for x in self.batchers.values())
+        stats['pending_rows'] = sum(x.pending_rows for x in self.batchers.values())
+        stats['mean_batch_size'] = (stats['batched_rows'] / stats['batches']
+                                    if stats['batches'] > 0 else 0.0)
+        stats['models'] = len(self.batchers)
+        return {'stats': stats}
+
+
+class InferenceClient():
+    """
+    Thin client of the inference server, it exposes the predict and
+    input_shape interface of the models, run with the engine of the server
+    """
+
+    def __init__(self, address, folder, model_file):
+        """constructor"""
+        self.address = address
+        self.model = [folder, model_file]
+        # one connection per thread, so concurrent sessions are batched together
+        self._local = threading.local()
+
+    @property
+    def input_shape(self):
+        return [tuple(x) for x in self._request(
+            {'op': 'input_shape', 'model': self.model})['input_shape']]
+
+    def predict(self, inputs, batch_size=None):
+        """Predicts the windows through the micro-batches of the server.
+        Args:
+            inputs (list): one array per input layer.
+            batch_size (int): not used, the server decides the batches.
+        Returns:
+            list: one array per output layer.
+        """
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+        return self._request({'op': 'predict', 'model': self.model,
+                              'arrays': inputs})['arrays']
+
+    def stats(self):
+        return self._request({'op': 'stats'})['stats']
+
+    def _connect(self):
+        if ':' in self.address:
+            host, port = self.address.rsplit(':', 1)
+            return socket.create_connection((host, int(port)))
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self.address)
+        return connection
+
+    def _receive(self, connection, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError(self.address)
+            data.extend(chunk)
+        return data
+
+    def _request(self, message):
+        # forked processes do not share the connection of their parent
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        connection = self._local.connection
+        try:
+            connection.sendall(encode_message(message))
+            size = header_size(self._receive(connection, HEADER.size))
+            response, shapes = decode_header(self._receive(connection, size))
+            # the buffers are bytearrays, so the outputs are writable
+            response['arrays'] = [
+                np.frombuffer(self._receive(connection, array_size(x)),
+                              dtype=np.float32).reshape(x)
+                for x in shapes]
+        except (OSError, ValueError):
+            connection.close()
+            self._local.pid = None
+            raise
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+
+def main(argv):
+    address, engine, max_batch, max_delay = '127.0.0.1:8765', 'numpy', 1024, 5
+    try:
+        opts, _ = getopt.getopt(argv, "ha:e:b:d:",
+                                ['address=', 'engine=', 'max_batch=', 'max_delay='])
+        for opt, arg in opts:
+            if opt in ['-h']:
+                print('inference_server.py -a <host:port|socket> -e <numpy|keras> '
+                      '-b <max batch rows> -d <max delay ms>')
+                sys.exit(0)
+            elif opt in ['-a', '--address']:
+                address = arg
+            elif opt in ['-e', '--engine']:
+                engine = arg
+            elif opt in ['-b', '--max_batch']:
+                max_batch = int(arg)
+            elif opt in ['-d', '--max_delay']:
+                max_delay = float(arg)
+    except getopt.GetoptError:
+        print('Invalid option')
+        sys.exit(2)
+    InferenceServer(engine, max_batch, max_delay / 1000).serve(address)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -11,6 +11,10 @@ class SamplesCreator:
         sampler = self._get_samples_creator(activity)
         predictor.sampling(sampler)
 
+    def stream(self, predictor, activity):
+        sampler = self._get_samples_creator(activity)
+        return predictor.stream_sampling(sampler)
+
     def _get_samples_creator(self, activity):
         if activity == 'predict_next':
             return nesc.NextEventSamplesCreator()
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 import os
+import copy
+import glob
 import json
 
+from concurrent.futures import ProcessPoolExecutor
+
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -10,13 +14,16 @@ import matplotlib.pyplot as plt
 
 from num2words import num2words as nw
 from st_aggrid import AgGrid
-from tensorflow.keras.models import load_model
 
 
-from support_modules.readers import log_reader as lr
+from support_modules.readers import log_store as ls
 from support_modules import support as sup
 from support_modules import features_manager as feat
 from model_prediction import interfaces as it
+from model_prediction import model_registry as mr
+from model_prediction import prediction_table as pt
+from model_prediction import batch_inference as bi
+from model_prediction import sample_cache as sc
 from model_prediction.analyzers import sim_evaluator as ev
 
 pd.set_option('mode.chained_assignment', None) #supressing the warning of chained indexing
@@ -29,15 +36,18 @@ class ModelPredictor():
     def __init__(self, parms):
         self.output_route = os.path.join('output_files', parms['folder'])
         self.parms = parms
-        # load parameters
-        self.load_parameters()
+        # load model and parameters, shared across sessions
+        registered = mr.MODEL_REGISTRY.get(parms['folder'], parms['model_file'],
+                                           parms['inference_engine'],
+                                           parms['inference_server'])
+        self.load_parameters(registered)
         self.model_name, _ = os.path.splitext(parms['model_file'])
-        self.model = load_model(os.path.join(self.output_route,
-                                             parms['model_file']))
+        self.model = self.load_prediction_table(registered['model'], parms)
 
         self.log = self.load_log_test(self.output_route, self.parms)
 
         self.samples = dict()
+        self.window_stats = None
         self.predictions = None
         self.confirmation_results = None
         self.sim_values = list()
@@ -54,35 +64,14 @@ class ModelPredictor():
     def execute_predictive_task(self):
 
         # -- Adding the code block for going to feature manager to facilitate anyother test data which is not formated beforehand
-        feat_mannager = feat.FeaturesMannager(self.parms)
-        feat_mannager.register_scaler(self.parms['model_type'],
-                                      self.model_def['vectorizer'])
-        self.log, _ = feat_mannager.calculate(
-            self.log, self.parms['additional_columns'], 'predict')
+        self.calculate_features()
         # ---
-        sampler = it.SamplesCreator()
-        sampler.create(self, self.parms['activity'])
-
-        # create examples for next event and suffix
-        if self.parms['mode'] == 'batch':
-            self.parms['num_cases'] = len(self.log.caseid.unique())
-            #--logic for timestamp
-            _min_tm_df = self.log.groupby('caseid')['end_timestamp'].min().to_frame()
-            _min_tm_df.reset_index(level=0, inplace=True)
-            _min_tm_dict = _min_tm_df.to_dict('records')
-            # self.parms['min_time'] = self.log.end_timestamp.min()
-            self.parms['min_time'] = _min_tm_dict
-            if self.parms['batch_mode'] == 'pre_prefix':
-                self.parms['caseid'] = np.array(self.log.drop(self.log.sort_values(['caseid']).groupby('caseid').head(self.parms['batchprefixnum']).index).caseid)
-            else:
-                self.parms['caseid'] = np.array(self.log.caseid)  # adding caseid to the parms for batch mode
-        # predict
-        self.imp = self.parms['variant']  # passes value arg_max and random_choice
-        self.run_num = 0
-        #prediction call
-        for i in range(0, self.parms['rep']):
-            self.predict_values()
-            self.run_num += 1
+        if self.parms['mode'] == 'batch' and self.parms['workers'] > 1:
+            self.predict_parallel()
+        else:
+            self.predict_log()
+        if self.window_stats:
+            self.write_window_stats(self.window_stats)
         # export predictions
         # if self.parms['mode'] == 'batch':
             # self.export_predictions()
@@ -110,6 +99,114 @@ class ModelPredictor():
         # elif self.parms['mode'] == 'batch':
         evaluator.evaluate(self.parms, self.predictions)
 
+    def predict_log(self):
+        sampler = it.SamplesCreator()
+        streaming = self.parms['mode'] == 'batch' and self.parms['stream_batch_size']
+        if not streaming:
+            sampler.create(self, self.parms['activity'])
+
+        # create examples for next event and suffix
+        if self.parms['mode'] == 'batch':
+            self.parms['num_cases'] = len(self.log.caseid.unique())
+            #--logic for timestamp
+            _min_tm_df = self.log.groupby('caseid')['end_timestamp'].min().to_frame()
+            _min_tm_df.reset_index(level=0, inplace=True)
+            _min_tm_dict = _min_tm_df.to_dict('records')
+            # self.parms['min_time'] = self.log.end_timestamp.min()
+            self.parms['min_time'] = _min_tm_dict
+        # predict
+        self.imp = self.parms['variant']  # passes value arg_max and random_choice
+        self.run_num = 0
+        # one random stream per case, independent of the shards
+        self.parms['rng'] = bi.CaseStreams(self.parms['seed'])
+        # SME inputs come from the log, so the batch predictor draws every
+        # repetition from a single inference and fills run_num itself
+        sme_inputs = self.parms['mode'] == 'batch' and (
+            self.parms['batch_mode'] == 'base_batch' or self.parms['batchpredchoice'] == 'SME')
+        if streaming:
+            self.predict_stream(sampler, 1 if sme_inputs else self.parms['rep'])
+            return
+        #prediction call
+        for i in range(0, 1 if sme_inputs else self.parms['rep']):
+            self.predict_values()
+            self.run_num += 1
+
+    def predict_stream(self, sampler, runs):
+        """Samples and predicts the log by groups of complete cases. Only
+        the samples of one group are kept in memory, at most
+        stream_batch_size events or a single longer case, while the
+        predictions of every group are kept for the dashboard, so they
+        still grow with the log.
+        Args:
+            sampler (SamplesCreator): creator of the samples.
+            runs (int): predictions of every group.
+        """
+        log = self.log
+        stats = list()
+        for chunk, samples in sampler.stream(self, self.parms['activity']):
+            self.log, self.samples = chunk, samples
+            self.parms['caseid'] = self.batch_caseids(self.log, self.parms)
+            stats.append(self.window_stats)
+            self.run_num = 0
+            for i in range(0, runs):
+                self.predict_values()
+                self.run_num += 1
+        self.log = log
+        self.samples = dict()
+        self.parms['caseid'] = self.batch_caseids(self.log, self.parms)
+        # the runs of every group are interleaved back as in a single pass
+        self.predictions = (self.predictions
+                            .sort_values('run_num', kind='mergesort')
+                            .reset_index(drop=True))
+        self.window_stats = self.merge_window_stats(stats)
+
+    @staticmethod
+    def batch_caseids(log, parms):
+        # caseid of every prefix of the batch samples
+        if parms['batch_mode'] == 'pre_prefix':
+            return np.array(log.drop(log.sort_values(['caseid']).groupby('caseid').head(parms['batchprefixnum']).index).caseid)
+        return np.array(log.caseid)  # adding caseid to the parms for batch mode
+
+    @staticmethod
+    def merge_window_stats(stats):
+        stats = [x for x in stats if x]
+        if not stats:
+            return None
+        merged = {k: sum(x[k] for x in stats)
+                  for k in ['windows', 'unique_windows', 'calls_saved']}
+        merged['dedup_ratio'] = (merged['windows'] / merged['unique_windows']
+                                 if merged['unique_windows'] > 0 else 1.0)
+        return merged
+
+    def predict_parallel(self):
+        """Shards the cases of the log in contiguous blocks of caseid and
+        predicts every shard in a different process, the merge keeps the
+        order of a single process run.
+        """
+        self.imp = self.parms['variant']
+        caseids = np.array_split(np.sort(self.log.caseid.unique()), self.parms['workers'])
+        parms = {k: v for k, v in self.parms.items() if k != 'rng'}
+        # the shards share the entropy, even without seed
+        parms['seed'] = np.random.SeedSequence(self.parms['seed']).entropy
+        with ProcessPoolExecutor(max_workers=self.parms['workers']) as executor:
+            futures = list()
+            for shard in caseids:
+                if len(shard) == 0:
+                    continue
+                shard_parms = dict(parms)
+                # the samples of a shard are not those of the folder log
+                shard_parms['sample_cache'] = False
+                futures.append(executor.submit(
+                    predict_shard, shard_parms,
+                    self.log[self.log.caseid.isin(shard)], self.model_def))
+            shards = [future.result() for future in futures]
+        self.predictions = pd.concat([x[0] for x in shards], ignore_index=True)
+        # the runs of every shard are interleaved back as in a single process
+        self.predictions = (self.predictions
+                            .sort_values('run_num', kind='mergesort')
+                            .reset_index(drop=True))
+        self.window_stats = self.merge_window_stats([x[1] for x in shards])
+
     def predict_values(self):
         # Predict values
         executioner = it.PredictionTasksExecutioner()
@@ -117,62 +214,111 @@ class ModelPredictor():
 
     @staticmethod
     def load_log_test(output_route, parms):
-        df_test = lr.LogReader(
+        # views of the test log of the process store, parsed only once
+        stored = ls.LOG_STORE.get(
             os.path.join(output_route, 'parameters', 'test_log.csv'),
             parms['read_options'])
         if parms['mode'] == 'next':
-            df_test = pd.DataFrame(df_test.data)
-            df_test = df_test[~df_test.task.isin(['Start', 'End']) & df_test.caseid.isin([parms['nextcaseid']])]
+            df_test = stored.case(parms['nextcaseid'])
         elif parms['mode'] == 'batch':
-            df_test = pd.DataFrame(df_test.data)
-            df_test = df_test[~df_test.task.isin(['Start', 'End'])]
-            df_test = df_test.groupby("caseid").filter(
-                lambda x: len(x) >= min(parms['batchlogrange']) and len(x) <= max(parms['batchlogrange']))
+            df_test = stored.size_range(min(parms['batchlogrange']), max(parms['batchlogrange']))
 
             if df_test.empty is True:
                 st.error("The Range of Event Number doesn't have any Case Id's")
                 raise ValueError(output_route)
-            _count = df_test['caseid'].value_counts().to_frame()
-            _count.reset_index(level=0, inplace=True)
-            _count.sort_values(by=['caseid'], inplace=True)
-            # print("Count of respective Case Id")
-            # print(_count)
         return df_test
 
-    def load_parameters(self):
-        # Loading of parameters from training
-        path = os.path.join(self.output_route,
-                            'parameters',
-                            'model_parameters.json')
-        with open(path) as file:
-            data = json.load(file)
-            if 'activity' in data:
-                del data['activity']
-            self.parms = {**self.parms, **{k: v for k, v in data.items()}}
-            self.parms['dim'] = {k: int(v) for k, v in data['dim'].items()}
-            if self.parms['one_timestamp']:
-                self.parms['scale_args'] = {
-                    k: float(v) for k, v in data['scale_args'].items()}
-            else:
-                for key in data['scale_args'].keys():
-                    self.parms['scale_args'][key] = {
-                        k: float(v) for k, v in data['scale_args'][key].items()}
-            self.parms['index_ac'] = {int(k): v
-                                      for k, v in data['index_ac'].items()}
-            self.parms['index_rl'] = {int(k): v
-                                      for k, v in data['index_rl'].items()}
-
-            file.close()
-            self.ac_index = {v: k for k, v in self.parms['index_ac'].items()}
-            self.rl_index = {v: k for k, v in self.parms['index_rl'].items()}
+    def calculate_features(self):
+        """Adds the features of the model to the test log, they are
+        calculated once per view of the stored log and shared"""
+        stored = ls.LOG_STORE.get(
+            os.path.join(self.output_route, 'parameters', 'test_log.csv'),
+            self.parms['read_options'])
+        if self.parms['mode'] == 'next':
+            view = ('next', self.parms['nextcaseid'])
+        else:
+            view = ('batch', min(self.parms['batchlogrange']), max(self.parms['batchlogrange']))
+        feat_mannager = feat.FeaturesMannager(self.parms)
+        # the categories are taken from the whole test log, not the view
+        feat_mannager.fit_encoders(stored.events, self.parms['additional_columns'])
+        # the features also depend on the training parameters and on the
+        # stored encoders and roles
+        parameters = os.path.join(self.output_route, 'parameters')
+        state = sc.SampleCache.files_state(
+            [os.path.join(parameters, x) for x in ['model_parameters.json', 'encoders.json']]
+            + glob.glob(os.path.join(parameters, 'roles', '*.json')))
+        key = (view, self.parms['model_type'], self.model_def['vectorizer'],
+               tuple(self.parms['additional_columns']), self.parms['norm_method'],
+               self.parms['rp_sim'], self.parms.get('role_discovery', 'full'),
+               json.dumps(state))
+
+        def calculate():
+            feat_mannager.register_scaler(self.parms['model_type'],
+                                          self.model_def['vectorizer'])
+            # the manager edits the columns of its log, the view is shared
+            log, _ = feat_mannager.calculate(
+                self.log.copy(), self.parms['additional_columns'], 'predict')
+            return log
+        self.log = stored.derived(key, calculate)
+
+    def load_parameters(self, registered):
+        # Loading of parameters from training, copied since the
+        # parameters of the registry are shared by every session
+        data = copy.deepcopy(registered['parameters'])
+        self.parms = {**self.parms, **{k: v for k, v in data.items()}}
+        self.ac_index = dict(registered['ac_index'])
+        self.rl_index = dict(registered['rl_index'])
+
+    @staticmethod
+    def load_prediction_table(model, parms):
+        """Answers the prefixes of the test log from its precomputed
+        prediction table, if there is one for the current .h5 file"""
+        if not parms['prediction_table']:
+            return model
+        table = pt.PredictionTable.load(parms['folder'], parms['model_file'])
+        if table is None:
+            return model
+        print("Prediction table found for", parms['model_file'])
+        return pt.TableModel(model, table)
 
     def sampling(self, sampler):
         # print("Model Type : ", self.parms['model_type'])
         # print("Model Def : ", self.model_def['vectorizer'])
         sampler.register_sampler(self.parms['model_type'],
                                  self.model_def['vectorizer'])
-        self.samples = sampler.create_samples(
-            self.parms, self.log, self.ac_index, self.rl_index, self.model_def['additional_columns'])
+        if self.parms['mode'] == 'batch' and self.parms['sample_cache']:
+            cache = sc.SampleCache(self.output_route, self.parms)
+            cached = cache.load(self.parms) if cache.exists() else None
+            if cached is not None:
+                self.samples, self.parms['caseid'] = cached
+            else:
+                self.samples = sampler.create_samples(
+                    self.parms, self.log, self.ac_index, self.rl_index, self.model_def['additional_columns'])
+                self.parms['caseid'] = self.batch_caseids(self.log, self.parms)
+                cache.save(self.samples, self.parms['caseid'])
+        else:
+            self.samples = sampler.create_samples(
+                self.parms, self.log, self.ac_index, self.rl_index, self.model_def['additional_columns'])
+            if self.parms['mode'] == 'batch':
+                self.parms['caseid'] = self.batch_caseids(self.log, self.parms)
+        if 'windows' in self.samples:
+            self.window_stats = self.samples['windows']['stats']
+
+    def stream_sampling(self, sampler):
+        """Yields the log and samples of every group of complete cases"""
+        sampler.register_sampler(self.parms['model_type'],
+                                 self.model_def['vectorizer'])
+        for log, samples in sampler.stream_samples(
+                self.parms, self.log, self.ac_index, self.rl_index,
+                self.model_def['additional_columns'], self.parms['stream_batch_size']):
+            self.window_stats = samples['windows']['stats']
+            yield log, samples
+
+    @staticmethod
+    def write_window_stats(stats):
+        st.sidebar.write("Unique Prefix Windows : ", stats['unique_windows'], " of ", stats['windows'])
+        st.sidebar.write("Model Inferences Saved : ", stats['calls_saved'],
+                         " (", round(stats['dedup_ratio'], 2), "x)")
     #
     def predict(self, executioner, mode):
         # if mode == 'next':
@@ -204,7 +350,8 @@ class ModelPredictor():
                                                 self.model_def['vectorizer'])
 
         results = pd.DataFrame(results)
-        results['run_num'] = self.run_num
+        if 'run_num' not in results:
+            results['run_num'] = self.run_num
         results['implementation'] = self.imp
         if self.predictions is None:
             self.predictions = results
@@ -362,7 +509,7 @@ class ModelPredictor():
     @staticmethod
     def dashboard_prediction_batch(results_dash, parms):
         #All the results has to be displayed in Tabular form i.e DataFrame
-        if parms['variant'] in ['multi_pred', 'multi_pred_rand']:
+        if parms['variant'] in ['multi_pred', 'multi_pred_rand', 'beam']:
             #converting the values to it's actual name from parms
             #--For Activity and Role
             ModelPredictor.dashboard_multiprediction_acrl(results_dash, parms)
@@ -484,7 +631,7 @@ class ModelPredictor():
                                                          index=results_dash.index)
 
         if parms['next_mode'] == 'next_action' or (parms['mode'] == 'batch' and parms['batchpredchoice'] in ['Prediction', 'Generative'] and parms['batch_mode'] == 'pre_prefix' and parms[
-                    'variant'] in ['multi_pred', 'multi_pred_rand']):
+                    'variant'] in ['multi_pred', 'multi_pred_rand', 'beam']):
             # --------------------results_dash['tm_pred']
             for ix in range(len(results_dash['tm_pred'])):
                 results_dash[multipreddict["tm_pred"]] = pd.DataFrame(results_dash.tm_pred.tolist(),
@@ -1155,7 +1302,7 @@ class ModelPredictor():
         rl_prob_lst = []
 
         if parms['next_mode'] == 'next_action' or (parms['mode'] == 'batch' and parms['batchpredchoice'] in ['Prediction', 'Generative'] and parms['batch_mode'] == 'pre_prefix' and parms[
-                    'variant'] in ['multi_pred', 'multi_pred_rand']):
+                    'variant'] in ['multi_pred', 'multi_pred_rand', 'beam']):
             tm_pred_lst = []
             if parms['next_mode'] == 'next_action':
                 _numofcols = parms['multiprednum'] + 1
@@ -1173,14 +1320,14 @@ class ModelPredictor():
             rl_pred_lst.append("rl_pred" + str(zx))
             rl_prob_lst.append("rl_prob" + str(zx))
             if parms['next_mode'] == 'next_action' or (parms['mode'] == 'batch' and parms['batchpredchoice'] in ['Prediction', 'Generative'] and parms['batch_mode'] == 'pre_prefix' and parms[
-                    'variant'] in ['multi_pred', 'multi_pred_rand']):
+                    'variant'] in ['multi_pred', 'multi_pred_rand', 'beam']):
                 tm_pred_lst.append("tm_pred" + str(zx))
         multipreddict["ac_pred"] = ac_pred_lst
         multipreddict["ac_prob"] = ac_prob_lst
         multipreddict["rl_pred"] = rl_pred_lst
         multipreddict["rl_prob"] = rl_prob_lst
         if parms['next_mode'] == 'next_action'or (parms['mode'] == 'batch' and parms['batchpredchoice'] in ['Prediction', 'Generative'] and parms['batch_mode'] == 'pre_prefix' and parms[
-                    'variant'] in ['multi_pred', 'multi_pred_rand']):
+                    'variant'] in ['multi_pred', 'multi_pred_rand', 'beam']):
             multipreddict["tm_pred"] = tm_pred_lst
 
         return multipreddict
@@ -1246,6 +1393,78 @@ class ModelPredictor():
     #                      self.parms['model_file'].split('.')[0]+'.csv'),
     #         index=False)
 
+class ShardPredictor(ModelPredictor):
+    """
+    Predictor of one shard of the batch log, run inside the worker
+    processes of the parallel batch mode
+    """
+
+    def __init__(self, parms, log, model_def):
+        # the registry keeps the model loaded for the life of the worker
+        registered = mr.MODEL_REGISTRY.get(parms['folder'], parms['model_file'],
+                                           parms['inference_engine'],
+                                           parms['inference_server'])
+        self.parms = parms
+        self.ac_index = dict(registered['ac_index'])
+        self.rl_index = dict(registered['rl_index'])
+        self.model = self.load_prediction_table(registered['model'], parms)
+        self.model_def = model_def
+        self.log = log
+        self.samples = dict()
+        self.window_stats = None
+        self.predictions = None
+        self.confirmation_results = None
+        self.run_num = 0
+
+
+def predict_shard(parms, log, model_def):
+    """Creates the samples and predicts the cases of one shard.
+    Args:
+        parms (dict): parameters of the predictor.
+        log (dataframe): events of the cases of the shard, with features.
+        model_def (dict): model definition.
+    Returns:
+        tuple: predictions of the shard and stats of its input windows.
+    """
+    predictor = ShardPredictor(parms, log, model_def)
+    predictor.predict_log()
+    return predictor.predictions, predictor.window_stats
+
+
+class TablePredictor(ModelPredictor):
+    """
+    Predictor of every SME prefix of the test log, it precomputes the
+    prediction table of a model
+    """
+
+    def __init__(self, folder, model_file, engine='numpy'):
+        self.output_route = os.path.join('output_files', folder)
+        self.parms = {'folder': folder, 'model_file': model_file,
+                      'activity': 'predict_next', 'mode': 'batch',
+                      'batch_mode': 'base_batch', 'batchlogrange': (1, np.inf),
+                      'sample_cache': False}
+        registered = mr.MODEL_REGISTRY.get(folder, model_file, engine)
+        self.load_parameters(registered)
+        # the table stores the raw outputs, never the ones of another table
+        self.model = registered['model']
+        self.log = self.load_log_test(self.output_route, self.parms)
+        self.samples = dict()
+        self.window_stats = None
+        self.model_def = dict()
+        self.read_model_definition(self.parms['model_type'])
+        self.parms['additional_columns'] = self.model_def['additional_columns']
+
+    def build(self, batch_size=1024):
+        self.calculate_features()
+        it.SamplesCreator().create(self, self.parms['activity'])
+        windows = self.samples['windows']
+        preds = bi.predict_batch(self.model, windows['inputs'], batch_size)
+        if pt.save_table(self.parms['folder'], self.parms['model_file'],
+                         windows['inputs'], preds):
+            print("Prediction table of", len(windows['inverse']), "prefixes saved in",
+                  pt.table_path(self.parms['folder']))
+
+
 class EvaluateTask():
 
     def evaluate(self, parms, data):
@@ -1340,7 +1559,7 @@ class EvaluateTask():
                    'pref_size', 'run_num', 'implementation']
         eval_data = eval_data[req_columns]
 
-        if parms['variant'] in ['multi_pred', 'multi_pred_rand']:
+        if parms['variant'] in ['multi_pred', 'multi_pred_rand', 'beam']:
             eval_ac_index = {v: k for k, v in parms['index_ac'].items()}
             eval_rl_index = {v: k for k, v in parms['index_rl'].items()}
 
@@ -1369,7 +1588,7 @@ class EvaluateTask():
                 data['ac_pred'] = eval_data['ac_pred'].str[i]
                 data['rl_pred'] = eval_data['rl_pred'].str[i]
                 if parms['batchpredchoice'] in ['Prediction', 'Generative'] and parms['batch_mode'] == 'pre_prefix' and parms[
-                    'variant'] in ['multi_pred', 'multi_pred_rand']:
+                    'variant'] in ['multi_pred', 'multi_pred_rand', 'beam']:
                     data['tm_pred'] = eval_data['tm_pred'].str[i]
                 # print("Data After")
                 # print(data)
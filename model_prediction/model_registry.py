@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+from model_prediction import numpy_model as nm
+
+
+class ModelRegistry():
+    """
+    Process wide cache of the loaded models and their training parameters,
+    shared by every dashboard session
+    """
+
+    def __init__(self, max_size=3):
+        """constructor"""
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._loading = dict()
+        self._lock = threading.Lock()
+
+    def get(self, folder, model_file, engine='numpy', server=None):
+        """Returns the model, parameters and indexes of a trained model.
+        Args:
+            folder (str): folder of the model inside output_files.
+            model_file (str): name of the .h5 file.
+            engine (str): numpy or keras forward pass.
+            server (str): address of an inference server that owns the
+                model, the model is loaded in process if None.
+        Returns:
+            dict: model, parameters, ac_index and rl_index.
+        """
+        output_route = os.path.join('output_files', folder)
+        model_path = os.path.join(output_route, model_file)
+        parms_path = os.path.join(output_route, 'parameters',
+                                  'model_parameters.json')
+        key = (folder, model_file, engine, server,
+               os.path.getmtime(model_path), os.path.getmtime(parms_path))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        # Only one session loads a given model, the others wait for it
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+            try:
+                entry = self._load(folder, model_file, engine, server)
+                with self._lock:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+            finally:
+                # a failed load isn't kept, the next session tries again
+                with self._lock:
+                    self._loading.pop(key, None)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _load(self, folder, model_file, engine, server):
+        output_route = os.path.join('output_files', folder)
+        parameters = self.load_parameters(
+            os.path.join(output_route, 'parameters', 'model_parameters.json'))
+        if server:
+            # Imported here since the server module uses this registry
+            from model_prediction import inference_server as isv
+            # the server predicts with the engine it was started with
+            model = isv.InferenceClient(server, folder, model_file)
+        else:
+            model = self.load_model(os.path.join(output_route, model_file), engine)
+        self.warm_up(model)
+        return {'model': model,
+                'parameters': parameters,
+                'ac_index': {v: k for k, v in parameters['index_ac'].items()},
+                'rl_index': {v: k for k, v in parameters['index_rl'].items()}}
+
+    @staticmethod
+    def load_model(path, engine):
+        if engine == 'numpy':
+            return nm.load_numpy_model(path)
+        elif engine == 'keras':
+            # Tensorflow is only imported when explicitly requested
+            try:
+                from tensorflow.keras.models import load_model
+            except ImportError:
+                raise ImportError('the keras engine needs the packages of '
+                                  'requirements-keras.txt')
+            return load_model(path)
+        else:
+            raise ValueError(engine)
+
+    @staticmethod
+    def load_parameters(path):
+        # Loading of parameters from training
+        with open(path) as file:
+            data = json.load(file)
+            file.close()
+        if 'activity' in data:
+            del data['activity']
+        data['dim'] = {k: int(v) for k, v in data['dim'].items()}
+        if data['one_timestamp']:
+            data['scale_args'] = {
+                k: float(v) for k, v in data['scale_args'].items()}
+        else:
+            for key in data['scale_args'].keys():
+                data['scale_args'][key] = {
+                    k: float(v) for k, v in data['scale_args'][key].items()}
+        data['index_ac'] = {int(k): v for k, v in data['index_ac'].items()}
+        data['index_rl'] = {int(k): v for k, v in data['index_rl'].items()}
+        return data
+
+    @staticmethod
+    def warm_up(model):
+        """Builds the prediction graph with a dummy batch of one row"""
+        shapes = model.input_shape
+        if not isinstance(shapes, list):
+            shapes = [shapes]
+        model.predict([np.zeros((1,) + tuple(shape[1:])) for shape in shapes])
+
+
+MODEL_REGISTRY = ModelRegistry()
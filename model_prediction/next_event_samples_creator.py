@@ -1,8 +1,7 @@
-import itertools
-
 import pandas as pd
 import numpy as np
-import keras.utils as ku
+
+from model_prediction import prefix_store as ps
 
 
 class NextEventSamplesCreator():
@@ -24,7 +23,41 @@ class NextEventSamplesCreator():
         self.rl_index = rl_index
         columns = self.define_columns(add_cols, params['one_timestamp'])
         sampler = self._get_model_specific_sampler(params['model_type'])
-        return sampler(columns, params)
+        vec = sampler(columns, params)
+        if params['mode'] == 'batch':
+            vec['windows'] = self.index_windows(vec['prefixes'].inputs())
+        return vec
+
+    def stream_samples(self, params, log, ac_index, rl_index, add_cols, batch_size):
+        """Creates the samples of the log by groups of complete cases.
+        Args:
+            params (dict): parameters of the predictor.
+            log (dataframe): events of the log.
+            ac_index (dict): index of activities.
+            rl_index (dict): index of roles.
+            add_cols (list): additional columns of the model.
+            batch_size (int): maximum events per group, a case is never
+                split so a longer case makes a group on its own.
+        Returns:
+            generator: events and samples of every group.
+        """
+        for group in self.case_groups(log, batch_size):
+            yield group, self.create_samples(params, group, ac_index, rl_index, add_cols)
+
+    @staticmethod
+    def case_groups(log, batch_size):
+        """Splits the log, sorted by case, in groups of whole cases of at
+        most batch_size events, or of a single longer case"""
+        log = log.sort_values('caseid', kind='mergesort')
+        ends = np.cumsum(log.groupby('caseid', sort=True).size().values)
+        start = 0
+        while start < len(log):
+            # the first case always fits, the next ones up to batch_size
+            first = np.searchsorted(ends, start, side='right')
+            last = max(np.searchsorted(ends, start + batch_size, side='right') - 1, first)
+            end = ends[last]
+            yield log.iloc[start:end]
+            start = end
 
     @staticmethod
     def define_columns(add_cols, one_timestamp):
@@ -52,282 +85,176 @@ class NextEventSamplesCreator():
         """
         Extraction of prefixes and expected suffixes from event log.
         Args:
-            df_test (dataframe): testing dataframe in pandas format.
-            ac_index (dict): index of activities.
-            rl_index (dict): index of roles.
-            pref_size (int): size of the prefixes to extract.
+            columns (list): columns of the events to extract.
+            parms (dict): mode, batch_mode, batchprefixnum, one_timestamp
+                and dim of the model.
         Returns:
-            list: list of prefixes and expected sufixes.
+            dict: prefix store and expected next events.
         """
-
-        # print(self.log)
-        times = ['dur_norm'] if parms['one_timestamp'] else ['dur_norm', 'wait_norm']
-        equi = {'ac_index': 'activities', 'rl_index': 'roles'}
-        vec = {'prefixes': dict(),
-               'next_evt': dict()}
-        #times
-        x_times_dict = dict()
-        y_times_dict = dict()
-        self.log = self.reformat_events(columns, parms['one_timestamp'])
-        for i, _ in enumerate(self.log):
-            #print("Enumerate Log (i) :", i)
-            for x in columns:
-                serie = [self.log[i][x][:idx]
-                         for idx in range(1, len(self.log[i][x]))] #range starts with 1 to avoid blank state
-                y_serie = [x[-1] for x in serie] #selecting the last value from each list of list
-                if parms['mode'] == 'batch' and parms['batch_mode'] == 'pre_prefix':
-                    serie = serie[parms['batchprefixnum']:-1]
-                    y_serie = y_serie[parms['batchprefixnum']+1:]  # to avoid start value i.e 0
-                else:
-                    serie = serie[:-1] #to avoid end value that is max value
-                    y_serie = y_serie[1:] #to avoid start value i.e 0
-
-                if x in list(equi.keys()): #lists out ['ac_index', 'rl_index']
-                    vec['prefixes'][equi[x]] = (
-                        vec['prefixes'][equi[x]] + serie
-                        if i > 0 else serie)
-                    vec['next_evt'][equi[x]] = (
-                        vec['next_evt'][equi[x]] + y_serie
-                        if i > 0 else y_serie)
-                elif x in times:
-                    x_times_dict[x] = (
-                        x_times_dict[x] + serie if i > 0 else serie)
-                    y_times_dict[x] = (
-                        y_times_dict[x] + y_serie if i > 0 else y_serie)
-        vec['prefixes']['times'] = list()
-        x_times_dict = pd.DataFrame(x_times_dict)
-        for row in x_times_dict.values:
-            new_row = [np.array(x) for x in row]
-            new_row = np.dstack(new_row)
-            new_row = new_row.reshape((new_row.shape[1], new_row.shape[2]))
-            vec['prefixes']['times'].append(new_row)
-        # Reshape intercase expected attributes (prefixes, # attributes)
-        vec['next_evt']['times'] = list()
-        y_times_dict = pd.DataFrame(y_times_dict)
-        for row in y_times_dict.values:
-            new_row = [np.array(x) for x in row]
-            new_row = np.dstack(new_row)
-            new_row = new_row.reshape((new_row.shape[2]))
-            vec['next_evt']['times'].append(new_row)
-
-        return vec
+        buffers, _, _, case_start, prefix_end = self.create_vectors(columns, parms)
+        return self.create_store(buffers, case_start, prefix_end, parms)
 
     def _sample_next_event_inter(self, columns, parms):
         """
         Extraction of prefixes and expected suffixes from event log.
         Args:
-            df_test (dataframe): testing dataframe in pandas format.
-            ac_index (dict): index of activities.
-            rl_index (dict): index of roles.
-            pref_size (int): size of the prefixes to extract.
+            columns (list): columns of the events to extract.
+            parms (dict): mode, batch_mode, batchprefixnum, one_timestamp
+                and dim of the model.
         Returns:
-            list: list of prefixes and expected sufixes.
+            dict: prefix store and expected next events.
         """
         print(self.log.dtypes)
         print("Columns : ", columns)
 
-        times = ['dur_norm'] if parms['one_timestamp'] else ['dur_norm', 'wait_norm']
-        equi = {'ac_index': 'activities', 'rl_index': 'roles'}
-        vec = {'prefixes': dict(),
-               'next_evt': dict()}
-        #week
-        x_weekday = list()
-        y_weekday = list()
-        #diagonose
-        x_diagnose = list()
-        y_diagnose = list()
-        #times
-        x_times_dict = dict()
-        y_times_dict = dict()
-        # intercases
-        x_inter_dict, y_inter_dict = dict(), dict()
-        self.log = self.reformat_events(columns, parms['one_timestamp'])
-        # n-gram definition
-        for i, _ in enumerate(self.log):
-            for x in columns:
-                serie = [self.log[i][x][:idx]
-                         for idx in range(1, len(self.log[i][x]))] #range starts with 1 to avoid blank state
-                y_serie = [x[-1] for x in serie] #selecting the last value from each list of list
-                if parms['mode'] == 'batch' and parms['batch_mode'] == 'pre_prefix':
-                    serie = serie[parms['batchprefixnum']:-1]
-                    y_serie = y_serie[parms['batchprefixnum']+1:]  # to avoid start value i.e 0
-                else:
-                    serie = serie[:-1] #to avoid end value that is max value
-                    y_serie = y_serie[1:] #to avoid start value i.e 0
-
-                if x in list(equi.keys()): #lists out ['ac_index', 'rl_index']
-                    vec['prefixes'][equi[x]] = (
-                        vec['prefixes'][equi[x]] + serie
-                        if i > 0 else serie)
-                    vec['next_evt'][equi[x]] = (
-                        vec['next_evt'][equi[x]] + y_serie
-                        if i > 0 else y_serie)
+        buffers, events, position, case_start, prefix_end = self.create_vectors(columns, parms)
+        # Intercase features, the weekday and diagnose are kept as class
+        # codes and one hot encoded by the store when the windows are built
+        inter = [x for x in columns if x not in ['ac_index', 'rl_index', 'weekday',
+                                                 'Diagnose_ohe'] + self.time_columns(parms)]
+        inter = (np.column_stack([np.array(events[x], dtype=float) for x in inter])
+                 if inter else np.zeros((len(events['ac_index']), 0)))
+        size = len(buffers['activities'])
+        buffers['inter_attr'] = self.pad_events(inter, position, size)
+        categories = list()
+        for x, num_classes in [('weekday', 7), ('Diagnose_ohe', 135)]:
+            if x in columns:
+                codes = self.pad_events(np.array(events[x], dtype=int), position, size, -1)
+                categories.append((codes, num_classes))
+        return self.create_store(buffers, case_start, prefix_end, parms,
+                                 {'inter_attr': categories})
 
-                elif x in times:
-                    x_times_dict[x] = (
-                        x_times_dict[x] + serie if i > 0 else serie)
-                    y_times_dict[x] = (
-                        y_times_dict[x] + y_serie if i > 0 else y_serie)
-                # elif 'sepsis' in params['file_name']: -- Can be parameterrized
-                elif x == 'weekday':
-                    x_weekday = (
-                        x_weekday + serie if i > 0 else serie)
-                    y_weekday = (
-                        y_weekday + y_serie if i > 0 else y_serie)
-                elif x == 'Diagnose_ohe':
-                    x_diagnose = (
-                        x_diagnose + serie if i > 0 else serie)
-                    y_diagnose = (
-                        y_diagnose + y_serie if i > 0 else y_serie)
-                #Intercase Features
-                else:
-                    x_inter_dict[x] = (x_inter_dict[x] + serie
-                                        if i > 0 else serie)
-                    y_inter_dict[x] = (y_inter_dict[x] + y_serie
-                                        if i > 0 else y_serie)
-
-        vec['prefixes']['times'] = list()
-        x_times_dict = pd.DataFrame(x_times_dict)
-        for row in x_times_dict.values:
-            new_row = [np.array(x) for x in row]
-            new_row = np.dstack(new_row)
-            new_row = new_row.reshape((new_row.shape[1], new_row.shape[2]))
-            vec['prefixes']['times'].append(new_row)
+    @staticmethod
+    def time_columns(parms):
+        return ['dur_norm'] if parms['one_timestamp'] else ['dur_norm', 'wait_norm']
 
-        # Reshape intercase expected attributes (prefixes, # attributes)
-        vec['next_evt']['times'] = list()
-        y_times_dict = pd.DataFrame(y_times_dict)
-        for row in y_times_dict.values:
-            new_row = [np.array(x) for x in row]
-            new_row = np.dstack(new_row)
-            new_row = new_row.reshape((new_row.shape[2]))
-            vec['next_evt']['times'].append(new_row)
+    def create_vectors(self, columns, parms):
+        """Lays the events of the log out in flat buffers, every trace
+        preceded by time_dim - 1 zero rows, in a single pass.
+        Args:
+            columns (list): columns of the events to extract.
+            parms (dict): mode, batch_mode, batchprefixnum, one_timestamp
+                and dim of the model.
+        Returns:
+            tuple: activity, role and time buffers, stacked events per
+            column, position of every stacked event in the buffers and
+            the case start and prefix end offsets of every prefix.
+        """
+        events, trace_len = self.reformat_events(columns, parms['one_timestamp'])
+        gap = parms['dim']['time_dim'] - 1
+        trace_start = np.cumsum(trace_len + gap) - trace_len
+        size = int(trace_start[-1] + trace_len[-1]) if len(trace_len) > 0 else 0
+        position = (np.repeat(trace_start - (np.cumsum(trace_len) - trace_len), trace_len)
+                     + np.arange(trace_len.sum()))
+        times = np.column_stack([np.array(events[x], dtype=float)
+                                 for x in self.time_columns(parms)])
+        buffers = {'activities': self.pad_events(np.array(events['ac_index'], dtype=int), position, size),
+                   'roles': self.pad_events(np.array(events['rl_index'], dtype=int), position, size),
+                   'times': self.pad_events(times, position, size)}
+        case_start, prefix_end = self.prefix_rows(trace_start, trace_len, parms)
+        return buffers, events, position, case_start, prefix_end
 
-        x_inter_dict = pd.DataFrame(x_inter_dict)
-        #*
-        y_inter_dict = pd.DataFrame(y_inter_dict)
+    @staticmethod
+    def pad_events(values, position, size, fill=0):
+        buffer = np.full((size,) + values.shape[1:], fill, dtype=values.dtype)
+        buffer[position] = values
+        return buffer
 
-        vec['prefixes']['inter_attr'], vec['next_evt']['inter_attr'] = self.intercasesequence(columns, x_inter_dict,
-                                                                                              x_weekday, x_diagnose,
-                                                                                              y_inter_dict, y_weekday,
-                                                                                              y_diagnose)
+    @staticmethod
+    def prefix_rows(trace_start, trace_len, parms):
+        """Offsets of every prefix in the buffers, prefixes of the same
+        trace are consecutive.
+        Args:
+            trace_start (array): position of the start event of every trace.
+            trace_len (array): events per trace, start and end included.
+            parms (dict): mode, batch_mode and batchprefixnum.
+        Returns:
+            tuple: case start and prefix end, exclusive, per prefix.
+        """
+        # prefixes go from the start event to the event before the end one
+        first_size = 1
+        if parms['mode'] == 'batch' and parms['batch_mode'] == 'pre_prefix':
+            first_size += parms['batchprefixnum']
+        counts = np.maximum(trace_len - 1 - first_size, 0)
+        case_start = np.repeat(trace_start, counts)
+        size = (np.arange(counts.sum())
+                - np.repeat(np.cumsum(counts) - counts, counts) + first_size)
+        return case_start, case_start + size
 
+    @staticmethod
+    def create_store(buffers, case_start, prefix_end, parms, categories=None):
+        vec = {'prefixes': ps.PrefixStore(buffers, case_start, prefix_end,
+                                          parms['dim']['time_dim'], categories),
+               'next_evt': dict()}
+        # the next event of a prefix is the one right after its end
+        vec['next_evt']['activities'] = buffers['activities'][prefix_end].tolist()
+        vec['next_evt']['roles'] = buffers['roles'][prefix_end].tolist()
+        vec['next_evt']['times'] = list(buffers['times'][prefix_end])
         return vec
 
+    @staticmethod
+    def index_windows(inputs):
+        """Index of the unique padded input windows, shared prefixes
+        of different cases are only inferred once.
+        Args:
+            inputs (list): padded windows of every prefix, one array per
+                input of the model.
+        Returns:
+            dict: inputs of the unique windows, position of every prefix
+            among them and the deduplication stats.
+        """
+        num = len(inputs[0])
+        # the bytes of every window as a single void scalar
+        rows = np.concatenate(
+            [np.ascontiguousarray(x).reshape((num, int(np.prod(x.shape[1:])))).view(np.uint8)
+             for x in inputs], axis=1)
+        keys = np.ascontiguousarray(rows).view(np.dtype((np.void, rows.shape[1]))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # the unique windows in order of first appearance
+        order = np.argsort(first, kind='stable')
+        rank = np.empty(len(order), dtype=int)
+        rank[order] = np.arange(len(order))
+        unique = first[order]
+        inverse = rank[inverse.ravel()]
+        num_unique = len(unique)
+        stats = {'windows': num,
+                 'unique_windows': num_unique,
+                 'calls_saved': num - num_unique,
+                 'dedup_ratio': (num / num_unique) if num_unique > 0 else 1.0}
+        return {'inputs': [x[unique] for x in inputs],
+                'inverse': inverse,
+                'stats': stats}
 
     def reformat_events(self, columns, one_timestamp):
-        """Creates series of activities, roles and relative times per trace.
+        """Stacks the events of all the traces sorted by case and timestamp,
+        every trace between its start and end events.
         Args:
-            log_df: dataframe.
-            ac_index (dict): index of activities.
-            rl_index (dict): index of roles.
+            columns (list): columns of the events to extract.
+            one_timestamp (bool): sort by end_timestamp, or start_timestamp.
         Returns:
-            list: lists of activities, roles and relative times.
+            tuple: stacked events per column and events per trace, start
+            and end included.
         """
-        temp_data = list()
-        log_df = self.log.to_dict('records')
         key = 'end_timestamp' if one_timestamp else 'start_timestamp'
-        log_df = sorted(log_df, key=lambda x: (x['caseid'], key))
-        for key, group in itertools.groupby(log_df, key=lambda x: x['caseid']):
-            trace = list(group)
-            temp_dict = dict()
-            for x in columns:
-                serie = [y[x] for y in trace]
-                if x == 'ac_index':
-                    serie.insert(0, self.ac_index[('start')])
-                    serie.append(self.ac_index[('end')])
-                elif x == 'rl_index':
-                    serie.insert(0, self.rl_index[('start')])
-                    serie.append(self.rl_index[('end')])
-                else:
-                    serie.insert(0, 0)
-                    serie.append(0)
-                temp_dict = {**{x: serie}, **temp_dict}
-            temp_dict = {**{'caseid': key}, **temp_dict}
-            temp_data.append(temp_dict)
-        return temp_data
-
-    def intercasesequence(self, columns, x_inter_dict, x_weekday, x_diagnose, y_inter_dict, y_weekday, y_diagnose):
-        vec_prefix_inter_attr = list()
-        vec_next_evt_inter_attr = list()
-        if 'weekday' in columns and 'Diagnose_ohe' in columns:
-            for row, wd, dg in zip(x_inter_dict.values, x_weekday, x_diagnose):
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[1], new_row.shape[2]))
-                new_wd = ku.to_categorical(wd, num_classes=7)
-                new_dg = ku.to_categorical(dg, num_classes=135)
-                new_row = np.concatenate([new_row, new_wd, new_dg], axis=1)
-                vec_prefix_inter_attr.append(new_row)
-
-            for row, wd, dg in zip(y_inter_dict.values, y_weekday, y_diagnose):
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[2]))
-                new_wd = ku.to_categorical(wd, num_classes=7)
-                new_dg = ku.to_categorical(dg, num_classes=135)
-                new_row = np.concatenate([new_row, new_wd, new_dg], axis=0)
-                vec_next_evt_inter_attr.append(new_row)
-
-        elif 'weekday' in columns and 'Diagnose_ohe' not in columns:
-            for row, wd in zip(x_inter_dict.values, x_weekday):
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[1], new_row.shape[2]))
-                new_wd = ku.to_categorical(wd, num_classes=7)
-                new_row = np.concatenate([new_row, new_wd], axis=1)
-                vec_prefix_inter_attr.append(new_row)
-
-            for row, wd in zip(y_inter_dict.values, y_weekday):
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[2]))
-                new_wd = ku.to_categorical(wd, num_classes=7)
-                new_row = np.concatenate([new_row, new_wd], axis=0)
-                vec_next_evt_inter_attr.append(new_row)
-
-        elif 'weekday' not in columns and 'Diagnose_ohe' in columns:
-            for row, dg in zip(x_inter_dict.values, x_diagnose):
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[1], new_row.shape[2]))
-                new_dg = ku.to_categorical(dg, num_classes=135)
-                new_row = np.concatenate([new_row, new_dg], axis=1)
-                vec_prefix_inter_attr.append(new_row)
-
-            for row, dg in zip(y_inter_dict.values, y_diagnose):
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[2]))
-                new_dg = ku.to_categorical(dg, num_classes=135)
-                new_row = np.concatenate([new_row, new_dg], axis=0)
-                vec_next_evt_inter_attr.append(new_row)
-
-        elif 'weekday' not in columns and 'Diagnose_ohe' not in columns:
-            # for row in zip(x_inter_dict.values):
-            #     new_row = [np.array(x) for x in row]
-            #     new_row = np.dstack(new_row)
-            #     new_row = new_row.reshape((new_row.shape[1], new_row.shape[2]))
-            #     new_row = np.concatenate([new_row], axis=1)
-            #     vec_prefix_inter_attr.append(new_row)
-            #
-            # for row in zip(y_inter_dict.values):
-            #     new_row = [np.array(x) for x in row]
-            #     new_row = np.dstack(new_row)
-            #     new_row = new_row.reshape((new_row.shape[2]))
-            #     new_row = np.concatenate([new_row], axis=0)
-            #     vec_next_evt_inter_attr.append(new_row)
-
-            for row in x_inter_dict.values:
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[1], new_row.shape[2]))
-                vec_prefix_inter_attr.append(new_row)
-
-            for row in y_inter_dict.values:
-                new_row = [np.array(x) for x in row]
-                new_row = np.dstack(new_row)
-                new_row = new_row.reshape((new_row.shape[2]))
-                vec_next_evt_inter_attr.append(new_row)
-
-        return vec_prefix_inter_attr, vec_next_evt_inter_attr
+        codes, caseids = pd.factorize(self.log['caseid'], sort=True)
+        order = np.lexsort((self.log[key].values, codes))
+        trace_len = np.bincount(codes, minlength=len(caseids)) + 2
+        trace_start = np.cumsum(trace_len) - trace_len
+        # every event moves past the start and end events of the previous
+        # traces and the start event of its own
+        position = np.arange(len(order)) + 2 * codes[order] + 1
+        events = dict()
+        for x in columns:
+            if x == 'ac_index':
+                start, end = self.ac_index['start'], self.ac_index['end']
+            elif x == 'rl_index':
+                start, end = self.rl_index['start'], self.rl_index['end']
+            else:
+                start, end = 0, 0
+            values = self.log[x].values[order]
+            serie = np.empty(trace_len.sum(), dtype=values.dtype)
+            serie[position] = values
+            serie[trace_start] = start
+            serie[trace_start + trace_len - 1] = end
+            events[x] = serie
+        return events, trace_len
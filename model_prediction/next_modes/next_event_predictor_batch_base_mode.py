@@ -3,6 +3,7 @@ import numpy as np
 from datetime import timedelta
 
 from support_modules import support as sup
+from model_prediction import batch_inference as bi
 
 
 class NextEventPredictor():
@@ -30,7 +31,7 @@ class NextEventPredictor():
         #     st.table(spl_df_next)
             #print("spl :", spl_df)
         # print("Vectorizer : ", vectorizer)
-        if params['variant'] in ['multi_pred', 'multi_pred_rand']:
+        if params['variant'] in ['multi_pred', 'multi_pred_rand', 'beam']:
             self.nx = params['multiprednum']
         predictor = self._get_predictor(params['model_type'], params['mode'], params['next_mode'])
         sup.print_performed_task('Predicting next events')
@@ -53,124 +54,26 @@ class NextEventPredictor():
             imp (str): method of next event selection.
         """
         results = list()
-        for i, _ in enumerate(self.spl['prefixes']['activities']):
-            # Activities and roles input shape(1,5)
-            x_ac_ngram = (np.append(
-                    np.zeros(parameters['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['activities'][i]),
-                    axis=0)[-parameters['dim']['time_dim']:]
-                .reshape((1, parameters['dim']['time_dim'])))
-
-            x_rl_ngram = (np.append(
-                    np.zeros(parameters['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['roles'][i]),
-                    axis=0)[-parameters['dim']['time_dim']:]
-                .reshape((1, parameters['dim']['time_dim'])))
-
-            # times input shape(1,5,1)
-            times_attr_num = (self.spl['prefixes']['times'][i].shape[1])
-            x_t_ngram = np.array(
-                [np.append(np.zeros(
-                    (parameters['dim']['time_dim'], times_attr_num)),
-                    self.spl['prefixes']['times'][i], axis=0)
-                    [-parameters['dim']['time_dim']:]
-                    .reshape((parameters['dim']['time_dim'], times_attr_num))]
-                )
-
-            # intercase features if necessary
-            if vectorizer in ['basic']:
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
-            elif vectorizer in ['inter']:
-                inter_attr_num = (self.spl['prefixes']['inter_attr'][i].shape[1])
-                x_inter_ngram = np.array(
-                    [np.append(np.zeros((
-                        parameters['dim']['time_dim'], inter_attr_num)),
-                        self.spl['prefixes']['inter_attr'][i], axis=0)
-                        [-parameters['dim']['time_dim']:]
-                        .reshape((parameters['dim']['time_dim'], inter_attr_num))]
-                    )
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
-
-            pref_size = len(self.spl['prefixes']['activities'][i])
-            #print("input_time : ", x_t_ngram)
-            # predict
-            preds = self.model.predict(inputs)
-            #print("Predictions :", preds)
-            if self.imp == 'random_choice':
-                # Use this to get a random choice following as PDF
-                pos = np.random.choice(np.arange(0, len(preds[0][0])),
-                                       p=preds[0][0])
-                pos_prob = preds[0][0][pos]
-                pos1 = np.random.choice(np.arange(0, len(preds[1][0])),
-                                        p=preds[1][0])
-                pos1_prob = preds[1][0][pos1]
-
-            elif self.imp == 'arg_max':
-                # Use this to get the max prediction
-                pos = np.argmax(preds[0][0])
-                pos_prob = preds[0][0][pos]
-
-                pos1 = np.argmax(preds[1][0])
-                pos1_prob = preds[1][0][pos1]
-
-
-
-            elif self.imp == 'multi_pred':
-
-                # print("Executing Max Random")
-
-                #changing array to numpy
-                acx = np.array(preds[0][0])
-                rlx = np.array(preds[1][0])
-
-                pos = (-acx).argsort()[:self.nx].tolist()
-                pos1 = (-rlx).argsort()[:self.nx].tolist()
-
-                pos_prob = []
-                pos1_prob = []
-
-                for ix in range(len(pos)):
-                    # probability of activity
-                    pos_prob.append(acx[pos[ix]])
-                for jx in range(len(pos1)):
-                    # probability of role
-                    pos1_prob.append(rlx[pos1[jx]])
-
-            elif self.imp == 'multi_pred_rand':
-
-                # print("Executing Multi Random")
-
-                acx = np.array(preds[0][0])
-                rlx = np.array(preds[1][0])
-
-                pos = np.random.choice(np.arange(0, len(preds[0][0])), self.nx, replace=False,
-                                       p=preds[0][0]).tolist()
-
-                pos1 = np.random.choice(np.arange(0, len(preds[1][0])), self.nx, replace=False,
-                                        p=preds[1][0]).tolist()
-
-                pos_prob = []
-                pos1_prob = []
-
-                for ix in range(len(pos)):
-                    # probability of activity
-                    pos_prob.append(acx[pos[ix]])
-                for jx in range(len(pos1)):
-                    # probability of role
-                    pos1_prob.append(rlx[pos1[jx]])
-
-                #print("activity = ", posac)
-                #print("activity probability = ", pos_probac)
-
-                #print("role = ", pos1rl)
-                #print("role probability = ", pos1_probrl)
-
-            # save results
-            predictions = [pos, pos1, preds[2][0][0], pos_prob, pos1_prob]
-
-            if not parameters['one_timestamp']:
-                predictions.extend([preds[2][0][1]])
-            results.append(self.create_result_record_batch(i, self.spl, predictions, parameters, pref_size, results))
+        # Predicts each unique prefix window once, in chunks
+        preds = bi.predict_indexed(self.model, self.spl['windows'],
+                                   parameters['inference_batch_size'])
+        # All the repetitions are drawn from the same probabilities
+        runs = bi.select_repetitions(preds, self.imp, parameters['multiprednum'],
+                                     parameters['rep'],
+                                     parameters['rng'].rows(parameters['caseid']))
+        for run_num, selected in enumerate(runs):
+            run_results = list()
+            for i in range(len(self.spl['prefixes'])):
+                pos, pos1, pos_prob, pos1_prob = selected[i]
+                pref_size = int(self.spl['prefixes'].sizes(i))
+                # save results
+                predictions = [pos, pos1, preds[2][i][0], pos_prob, pos1_prob]
+
+                if not parameters['one_timestamp']:
+                    predictions.extend([preds[2][i][1]])
+                run_results.append(self.create_result_record_batch(i, self.spl, predictions, parameters, pref_size, run_results))
+                run_results[-1]['run_num'] = run_num
+            results.extend(run_results)
         sup.print_done_task()
         return results
 
@@ -178,11 +81,11 @@ class NextEventPredictor():
         record = dict()
 
         record['caseid'] = parms['caseid'][index]
-        record['ac_prefix'] = spl['prefixes']['activities'][index]
+        record['ac_prefix'] = spl['prefixes'].prefix('activities', index).tolist()
         record['ac_expect'] = spl['next_evt']['activities'][index]
         record['ac_pred'] = preds[0]
         record['ac_prob'] = preds[3]
-        record['rl_prefix'] = spl['prefixes']['roles'][index]
+        record['rl_prefix'] = spl['prefixes'].prefix('roles', index).tolist()
         record['rl_expect'] = spl['next_evt']['roles'][index]
         record['rl_pred'] = preds[1]
         record['rl_prob'] = preds[4]
@@ -196,7 +99,7 @@ class NextEventPredictor():
         if parms['one_timestamp']:
             record['tm_prefix'] = [self.rescale(
                x, parms, parms['scale_args'])
-               for x in spl['prefixes']['times'][index]]
+               for x in spl['prefixes'].prefix('times', index)]
             record['tm_expect'] = self.rescale(
                 spl['next_evt']['times'][index][0],
                 parms, parms['scale_args'])
@@ -225,7 +128,7 @@ class NextEventPredictor():
             # Duration
             record['dur_prefix'] = [self.rescale(
                 x[0], parms, parms['scale_args']['dur'])
-                for x in spl['prefixes']['times'][index]]
+                for x in spl['prefixes'].prefix('times', index)]
             record['dur_expect'] = self.rescale(
                 spl['next_evt']['times'][index][0], parms,
                 parms['scale_args']['dur'])
@@ -234,7 +137,7 @@ class NextEventPredictor():
             # Waiting
             record['wait_prefix'] = [self.rescale(
                 x[1], parms, parms['scale_args']['wait'])
-                for x in spl['prefixes']['times'][index]]
+                for x in spl['prefixes'].prefix('times', index)]
             record['wait_expect'] = self.rescale(
                 spl['next_evt']['times'][index][1], parms,
                 parms['scale_args']['wait'])
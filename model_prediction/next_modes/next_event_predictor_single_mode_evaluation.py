@@ -27,8 +27,6 @@ class NextEventPredictor():
         self.imp = imp
         if params['mode'] == 'next':
             fltr_idx = params['nextcaseid_attr']["filter_index"]
-            spl_df_prefx = pd.DataFrame(self.spl['prefixes'])[fltr_idx:]
-            spl_df_next = pd.DataFrame(self.spl['next_evt'])[fltr_idx:]
         self.nx = params['multiprednum']
         predictor = self._get_predictor(params['model_type'], params['mode'], params['next_mode'])
         sup.print_performed_task('Predicting next events')
@@ -61,7 +59,7 @@ class NextEventPredictor():
         for i, _ in enumerate(self.spl['prefixes']['activities'][pred_fltr_idx:]):
             if i == 0:
 
-                serie_predict_ac = [self.spl['prefixes']['activities'][pred_fltr_idx:][i][:idx]
+                serie_predict_ac = [self.spl['prefixes']['activities'][pred_fltr_idx:][i][:idx].tolist()
                     for idx in range(1, pred_fltr_idx + 2)]  # range starts with 1 to avoid start
 
                 y_serie_predict_ac = [x[-1] for x in
@@ -70,7 +68,7 @@ class NextEventPredictor():
                 serie_predict_ac = serie_predict_ac[:-1]  # to avoid end value that is max value
                 y_serie_predict_ac = y_serie_predict_ac[1:]  # to avoid start value i.e 0
 
-                serie_predict_rl = [self.spl['prefixes']['roles'][pred_fltr_idx:][i][:idx]
+                serie_predict_rl = [self.spl['prefixes']['roles'][pred_fltr_idx:][i][:idx].tolist()
                     for idx in range(1, pred_fltr_idx + 2)]  # range starts with 1 to avoid start
 
                 y_serie_predict_rl = [x[-1] for x in
@@ -116,39 +114,8 @@ class NextEventPredictor():
 
                 # print(pd.DataFrame(conf_results))
 
-                # Activities and roles input shape(1,5)
-                x_ac_ngram = (np.append(
-                        np.zeros(parameters['dim']['time_dim']),
-                        np.array(self.spl['prefixes']['activities'][pred_fltr_idx:][i]),
-                        axis=0)[-parameters['dim']['time_dim']:]
-                    .reshape((1, parameters['dim']['time_dim'])))
-                x_rl_ngram = (np.append(
-                        np.zeros(parameters['dim']['time_dim']),
-                        np.array(self.spl['prefixes']['roles'][pred_fltr_idx:][i]),
-                        axis=0)[-parameters['dim']['time_dim']:]
-                    .reshape((1, parameters['dim']['time_dim'])))
-                # times input shape(1,5,1)
-                times_attr_num = (self.spl['prefixes']['times'][pred_fltr_idx:][i].shape[1])
-                x_t_ngram = np.array(
-                    [np.append(np.zeros(
-                        (parameters['dim']['time_dim'], times_attr_num)),
-                        self.spl['prefixes']['times'][pred_fltr_idx:][i], axis=0)
-                        [-parameters['dim']['time_dim']:]
-                        .reshape((parameters['dim']['time_dim'], times_attr_num))]
-                    )
-                # intercase features if necessary
-                if vectorizer in ['basic']:
-                    inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
-                elif vectorizer in ['inter']:
-                    inter_attr_num = (self.spl['prefixes']['inter_attr'][pred_fltr_idx:][i].shape[1])
-                    x_inter_ngram = np.array(
-                        [np.append(np.zeros((
-                            parameters['dim']['time_dim'], inter_attr_num)),
-                            self.spl['prefixes']['inter_attr'][pred_fltr_idx:][i], axis=0)
-                            [-parameters['dim']['time_dim']:]
-                            .reshape((parameters['dim']['time_dim'], inter_attr_num))]
-                        )
-                    inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
+                # padded windows of the prefix, shape (1, time_dim) and (1, time_dim, k)
+                inputs = self.spl['prefixes'].inputs([pred_fltr_idx + i])
                 # predict
                 preds = self.model.predict(inputs)
 
@@ -366,11 +333,11 @@ class NextEventPredictor():
         _fltr_idx = parms['nextcaseid_attr']["filter_index"] + 1
         record = dict()
         #record['caseid'] = parms['caseid'][_fltr_idx:][index]
-        record['ac_prefix'] = spl['prefixes']['activities'][_fltr_idx:][index]
+        record['ac_prefix'] = spl['prefixes']['activities'][_fltr_idx:][index].tolist()
         record['ac_expect'] = spl['next_evt']['activities'][_fltr_idx:][index]
         record['ac_pred'] = preds[0]
         record['ac_prob'] = preds[3]
-        record['rl_prefix'] = spl['prefixes']['roles'][_fltr_idx:][index]
+        record['rl_prefix'] = spl['prefixes']['roles'][_fltr_idx:][index].tolist()
         record['rl_expect'] = spl['next_evt']['roles'][_fltr_idx:][index]
         record['rl_pred'] = preds[1]
         record['rl_prob'] = preds[4]
@@ -120,38 +120,8 @@ class NextEventPredictor():
         # print("Initial Session STate : ", st.session_state)
         for i, _ in enumerate(self.spl['prefixes']['activities'][:pred_fltr_idx]):
 
-            x_ac_ngram = (np.append(
-                    np.zeros(parameters['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['activities'][:pred_fltr_idx][i]),
-                    axis=0)[-parameters['dim']['time_dim']:]
-                .reshape((1, parameters['dim']['time_dim'])))
-
-            x_rl_ngram = (np.append(
-                    np.zeros(parameters['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['roles'][:pred_fltr_idx][i]),
-                    axis=0)[-parameters['dim']['time_dim']:]
-                .reshape((1, parameters['dim']['time_dim'])))
-
-            # times input shape(1,5,1)
-            times_attr_num = (self.spl['prefixes']['times'][:pred_fltr_idx][i].shape[1])
-            x_t_ngram = np.array(
-                [np.append(np.zeros(
-                    (parameters['dim']['time_dim'], times_attr_num)),
-                    self.spl['prefixes']['times'][:pred_fltr_idx][i], axis=0)
-                    [-parameters['dim']['time_dim']:]
-                    .reshape((parameters['dim']['time_dim'], times_attr_num))])
-            # add intercase features if necessary
-            if vectorizer in ['basic']:
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
-            elif vectorizer in ['inter']:
-                inter_attr_num = (self.spl['prefixes']['inter_attr'][:pred_fltr_idx][i].shape[1])
-                x_inter_ngram = np.array(
-                    [np.append(np.zeros((
-                        parameters['dim']['time_dim'], inter_attr_num)),
-                        self.spl['prefixes']['inter_attr'][:pred_fltr_idx][i], axis=0)
-                        [-parameters['dim']['time_dim']:]
-                        .reshape((parameters['dim']['time_dim'], inter_attr_num))])
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
+            # padded windows of the prefix, shape (1, time_dim) and (1, time_dim, k)
+            inputs = self.spl['prefixes'].inputs([i])
             # predict
             preds = self.model.predict(inputs)
 
@@ -236,11 +206,11 @@ class NextEventPredictor():
     def _create_result_record_next(self, index, spl, preds, parms):
         _fltr_idx = parms['nextcaseid_attr']["filter_index"] + 1
         record = dict()
-        record['ac_prefix'] = spl['prefixes']['activities'][:_fltr_idx][index]
+        record['ac_prefix'] = spl['prefixes']['activities'][:_fltr_idx][index].tolist()
         record['ac_expect'] = spl['next_evt']['activities'][:_fltr_idx][index]
         record['ac_pred'] = preds[0]
         record['ac_prob'] = preds[3]
-        record['rl_prefix'] = spl['prefixes']['roles'][:_fltr_idx][index]
+        record['rl_prefix'] = spl['prefixes']['roles'][:_fltr_idx][index].tolist()
         record['rl_expect'] = spl['next_evt']['roles'][:_fltr_idx][index]
         record['rl_pred'] = preds[1]
         record['rl_prob'] = preds[4]
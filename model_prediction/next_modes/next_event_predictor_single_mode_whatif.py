@@ -24,7 +24,8 @@ class NextEventPredictor():
     def predict(self, params, model, spl, imp, vectorizer):
         self.model = model
         #print("spl :", spl)
-        self.spl = spl
+        # the what-if choices edit the prefixes, so they get their own lists
+        self.spl = {**spl, 'prefixes': spl['prefixes'].to_lists()}
         self.imp = imp
         if params['mode'] == 'next':
             fltr_idx = params['nextcaseid_attr']["filter_index"]
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import json
+
+import h5py
+import numpy as np
+
+
+def load_numpy_model(path):
+    """Reads the architecture and weights of a keras .h5 model.
+    Args:
+        path (str): route of the .h5 file.
+    Returns:
+        NumpyModel: forward pass engine of the model.
+    """
+    with h5py.File(path, 'r') as file:
+        config = file.attrs['model_config']
+        if isinstance(config, bytes):
+            config = config.decode('utf-8')
+        config = json.loads(config)
+        weights = dict()
+        group = file['model_weights']
+        for layer_name in group.attrs['layer_names']:
+            layer_name = (layer_name.decode('utf-8')
+                          if isinstance(layer_name, bytes) else layer_name)
+            names = group[layer_name].attrs['weight_names']
+            weights[layer_name] = [
+                np.array(group[layer_name][x.decode('utf-8') if isinstance(x, bytes) else x],
+                         dtype=np.float32)
+                for x in names]
+    return NumpyModel(config, weights)
+
+
+class NumpyModel():
+    """
+    Pure numpy forward pass of the keras functional models used by
+    the shared_cat and concatenated architectures
+    """
+
+    def __init__(self, config, weights):
+        """constructor"""
+        if config['class_name'] not in ['Functional', 'Model']:
+            raise ValueError(config['class_name'])
+        self.layers = {x['name']: x for x in config['config']['layers']}
+        self.input_layers = [x[0] for x in config['config']['input_layers']]
+        self.output_layers = [x[0] for x in config['config']['output_layers']]
+        self.weights = weights
+        self._dispatcher = {'InputLayer': self._input,
+                            'Embedding': self._embedding,
+                            'Concatenate': self._concatenate,
+                            'LSTM': self._lstm,
+                            'BatchNormalization': self._batch_normalization,
+                            'Dense': self._dense,
+                            'Dropout': self._identity,
+                            'SpatialDropout1D': self._identity,
+                            'Activation': self._activation_layer}
+        for layer in self.layers.values():
+            if layer['class_name'] not in self._dispatcher:
+                raise ValueError(layer['class_name'])
+
+    @property
+    def input_shape(self):
+        return [tuple(self.layers[x]['config']['batch_input_shape'])
+                for x in self.input_layers]
+
+    def predict(self, inputs, batch_size=None):
+        """Predicts the outputs of the model.
+        Args:
+            inputs (list): one array per input layer.
+            batch_size (int): maximum number of rows per forward pass.
+        Returns:
+            list: one array per output layer.
+        """
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+        num = len(inputs[0])
+        batch_size = batch_size if batch_size else max(num, 1)
+        chunks = list()
+        for start in range(0, num, batch_size):
+            chunks.append(self._forward(
+                [np.asarray(x[start:start + batch_size], dtype=np.float32)
+                 for x in inputs]))
+        if not chunks:
+            chunks.append(self._forward(
+                [np.zeros((0,) + tuple(x.shape[1:]), dtype=np.float32)
+                 for x in inputs]))
+        return [np.concatenate([c[i] for c in chunks], axis=0)
+                for i in range(len(self.output_layers))]
+
+    def _forward(self, inputs):
+        values = dict(zip(self.input_layers, inputs))
+        return [self._evaluate(name, values) for name in self.output_layers]
+
+    def _evaluate(self, name, values):
+        if name not in values:
+            layer = self.layers[name]
+            inbound = [self._evaluate(x[0], values)
+                       for x in layer['inbound_nodes'][0]]
+            values[name] = self._dispatcher[layer['class_name']](
+                layer['config'], self.weights.get(name, list()), inbound)
+        return values[name]
+
+    # =========================================================================
+    # Layers
+    # =========================================================================
+    @staticmethod
+    def _input(config, weights, inbound):
+        raise ValueError(config['name'])
+
+    @staticmethod
+    def _identity(config, weights, inbound):
+        return inbound[0]
+
+    def _activation_layer(self, config, weights, inbound):
+        return self._activation(config['activation'], inbound[0])
+
+    @staticmethod
+    def _embedding(config, weights, inbound):
+        return weights[0][inbound[0].astype(np.int64)]
+
+    @staticmethod
+    def _concatenate(config, weights, inbound):
+        return np.concatenate(inbound, axis=config['axis'])
+
+    def _dense(self, config, weights, inbound):
+        outputs = np.matmul(inbound[0], weights[0])
+        if config['use_bias']:
+            outputs = outputs + weights[1]
+        return self._activation(config['activation'], outputs)
+
+    @staticmethod
+    def _batch_normalization(config, weights, inbound):
+        weights = list(weights)
+        gamma = weights.pop(0) if config['scale'] else 1.0
+        beta = weights.pop(0) if config['center'] else 0.0
+        mean, variance = weights
+        return ((inbound[0] - mean) / np.sqrt(variance + config['epsilon'])
+                * gamma + beta)
+
+    def _lstm(self, config, weights, inbound):
+        if config['go_backwards'] or config['stateful']:
+            raise ValueError(config['name'])
+        kernel, recurrent_kernel = weights[0], weights[1]
+        bias = weights[2] if config['use_bias'] else 0.0
+        units = config['units']
+        sequence = inbound[0]
+        h = np.zeros((len(sequence), units), dtype=np.float32)
+        c = np.zeros((len(sequence), units), dtype=np.float32)
+        # Input projections of every timestep in a single product
+        projected = np.matmul(sequence, kernel) + bias
+        outputs = list()
+        for step in range(sequence.shape[1]):
+            z = projected[:, step] + np.matmul(h, recurrent_kernel)
+            i = self._activation(config['recurrent_activation'], z[:, :units])
+            f = self._activation(config['recurrent_activation'], z[:, units:2 * units])
+            g = self._activation(config['activation'], z[:, 2 * units:3 * units])
+            o = self._activation(config['recurrent_activation'], z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * self._activation(config['activation'], c)
+            if config['return_sequences']:
+                outputs.append(h)
+        if config['return_sequences']:
+            return np.stack(outputs, axis=1)
+        return h
+
+    @staticmethod
+    def _activation(name, x):
+        if name in ['linear', None]:
+            return x
+        elif name == 'tanh':
+            return np.tanh(x)
+        elif name == 'sigmoid':
+            return 0.5 * (np.tanh(0.5 * x) + 1.0)
+        elif name == 'hard_sigmoid':
+            return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+        elif name == 'relu':
+            return np.maximum(x, 0.0)
+        elif name == 'softmax':
+            e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+            return e / np.sum(e, axis=-1, keepdims=True)
+        else:
+            raise ValueError(name)
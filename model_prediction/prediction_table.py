@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed outputs of every SME prefix of the test log of a model, the
+batch SME and evaluation modes answer those prefixes without inferences.
+
+    python -m model_prediction.prediction_table -f <folder> -m <model .h5>
+
+The table is stored next to model_parameters.json and is ignored once
+the .h5 file changes. The windows are looked up by a 64 bits digest and
+a hit is only taken if the stored window is the same.
+"""
+import os
+import sys
+import getopt
+
+import numpy as np
+
+from support_modules import support as sup
+
+_TABLES = dict()
+# digest of the stored windows, the tables of other digests are rebuilt
+DIGEST = 'fnv64'
+
+
+def table_path(folder):
+    return os.path.join('output_files', folder, 'parameters', 'prediction_table.npz')
+
+
+def window_rows(inputs):
+    """Every row of the model inputs flattened, as the model sees them in
+    float32"""
+    num = len(inputs[0])
+    return np.concatenate(
+        [np.asarray(x, dtype=np.float32).reshape((num, int(np.prod(np.shape(x)[1:]))))
+         for x in inputs], axis=1)
+
+
+def window_digests(inputs):
+    """64 bits digest of every row of the model inputs, as the model sees
+    them in float32. The rows are mixed as 64 bits words, one column of
+    words at a time for all the rows.
+    Args:
+        inputs (list): one array per input layer.
+    Returns:
+        array: digest per row.
+    """
+    rows = window_rows(inputs)
+    if rows.shape[1] % 2:
+        rows = np.concatenate([rows, np.zeros((len(rows), 1), dtype=np.float32)], axis=1)
+    num = len(rows)
+    words = np.ascontiguousarray(rows).view(np.uint64).reshape((num, rows.shape[1] // 2))
+    digests = np.full(num, 0xcbf29ce484222325, dtype=np.uint64)
+    for column in words.T:
+        digests = (digests ^ column) * np.uint64(0x100000001b3)
+        digests ^= digests >> np.uint64(29)
+    return digests
+
+
+def save_table(folder, model_file, inputs, outputs):
+    """Stores the outputs of the unique windows of the test log.
+    Args:
+        folder (str): folder of the model inside output_files.
+        model_file (str): name of the .h5 file.
+        inputs (list): unique input windows.
+        outputs (list): activity, role and time outputs of the windows.
+    Returns:
+        bool: whether the table was written.
+    """
+    path = table_path(folder)
+    temp = '{}.{}.tmp.npz'.format(path[:-len('.npz')], os.getpid())
+    try:
+        np.savez_compressed(
+            temp,
+            model_hash=np.array(sup.file_hash(os.path.join('output_files', folder, model_file))),
+            digest=np.array(DIGEST),
+            digests=window_digests(inputs),
+            windows=window_rows(inputs),
+            ac_probs=np.asarray(outputs[0], dtype=np.float32),
+            rl_probs=np.asarray(outputs[1], dtype=np.float32),
+            times=np.asarray(outputs[2], dtype=np.float32))
+        os.replace(temp, path)
+    except OSError as e:
+        # read only deployments predict without table
+        print('The prediction table could not be written:', e)
+        if os.path.exists(temp):
+            os.remove(temp)
+        return False
+    return True
+
+
+class PredictionTable():
+    """
+    Precomputed outputs of every SME prefix of the test log
+    """
+
+    def __init__(self, data):
+        """constructor"""
+        self.outputs = [data['ac_probs'], data['rl_probs'], data['times']]
+        self.windows = data['windows']
+        # sorted digests, searched for every window of a batch at once
+        self.order = np.argsort(data['digests'], kind='stable')
+        self.digests = data['digests'][self.order]
+
+    def __len__(self):
+        return len(self.digests)
+
+    @staticmethod
+    def load(folder, model_file):
+        """Reads the table of a model, None if there is no table or it was
+        computed with a different .h5 file.
+        """
+        path = table_path(folder)
+        if not os.path.exists(path):
+            return None
+        key = (path, os.path.getmtime(path))
+        if key not in _TABLES:
+            with np.load(path) as data:
+                if ('digest' not in data.files or str(data['digest']) != DIGEST
+                        or 'windows' not in data.files):
+                    _TABLES[key] = (None, None)
+                else:
+                    _TABLES[key] = (str(data['model_hash']), PredictionTable(data))
+        model_hash, table = _TABLES[key]
+        if model_hash != sup.file_hash(os.path.join('output_files', folder, model_file)):
+            return None
+        return table
+
+    def rows(self, inputs):
+        """Row of the table of every window, -1 for the missing ones. The
+        windows of a digest collision are missing"""
+        digests = window_digests(inputs)
+        if not len(self.digests):
+            return np.full(len(digests), -1)
+        positions = np.minimum(np.searchsorted(self.digests, digests),
+                               len(self.digests) - 1)
+        rows = np.where(self.digests[positions] == digests, self.order[positions], -1)
+        found = np.where(rows >= 0)[0]
+        same = (self.windows[rows[found]] == window_rows(inputs)[found]).all(axis=1)
+        rows[found[~same]] = -1
+        return rows
+
+
+class TableModel():
+    """
+    Model that answers the windows found in a prediction table and only
+    calls the wrapped model for the rest
+    """
+
+    def __init__(self, model, table):
+        """constructor"""
+        self.model = model
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def input_shape(self):
+        return self.model.input_shape
+
+    def predict(self, inputs, batch_size=None):
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+        rows = self.table.rows(inputs)
+        found = rows >= 0
+        if not found.any():
+            # also the windows of an empty table
+            self.misses += len(rows)
+            return self.model.predict(inputs, batch_size=batch_size)
+        outputs = [x[np.maximum(rows, 0)] for x in self.table.outputs]
+        if not found.all():
+            missing = np.where(~found)[0]
+            preds = self.model.predict([np.asarray(x)[missing] for x in inputs],
+                                       batch_size=batch_size)
+            for output, pred in zip(outputs, preds):
+                output[missing] = pred
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        return outputs
+
+
+def main(argv):
+    folder, model_file, engine, batch_size = None, None, 'numpy', 1024
+    try:
+        opts, _ = getopt.getopt(argv, "hf:m:e:b:",
+                                ['folder=', 'model_file=', 'engine=', 'batch_size='])
+        for opt, arg in opts:
+            if opt in ['-h']:
+                print('prediction_table.py -f <folder> -m <model file> '
+                      '-e <numpy|keras> -b <batch rows>')
+                sys.exit(0)
+            elif opt in ['-f', '--folder']:
+                folder = arg
+            elif opt in ['-m', '--model_file']:
+                model_file = arg
+            elif opt in ['-e', '--engine']:
+                engine = arg
+            elif opt in ['-b', '--batch_size']:
+                batch_size = int(arg)
+    except getopt.GetoptError:
+        print('Invalid option')
+        sys.exit(2)
+    if not folder or not model_file:
+        print('Invalid option')
+        sys.exit(2)
+    # Imported here since the predictor module uses this one
+    from model_prediction import model_predictor as pr
+    pr.TablePredictor(folder, model_file, engine).build(batch_size)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from numpy.lib.stride_tricks import as_strided
+
+
+class PrefixStore():
+    """
+    Prefixes of a log as (case_start, prefix_end) offsets over one flat
+    event buffer per feature. Every trace of the buffer is preceded by
+    time_dim - 1 zero rows, so the left padded window of any prefix is
+    a view of the buffer. One hot columns are kept as class codes and
+    only expanded when the prefixes or windows are materialized.
+    """
+
+    def __init__(self, events, case_start, prefix_end, time_dim, categories=None):
+        """constructor
+        Args:
+            events (dict): buffer of every feature, activities, roles,
+                times and optionally inter_attr.
+            case_start (array): position of the start event of the trace
+                of every prefix.
+            prefix_end (array): position after the last event of every prefix.
+            time_dim (int): size of the window expected by the model.
+            categories (dict): (codes buffer, number of classes) pairs
+                appended one hot to the columns of a feature, the codes
+                are -1 out of the traces.
+        """
+        self.events = events
+        self.categories = categories if categories else dict()
+        self.case_start = np.asarray(case_start, dtype=np.int32)
+        self.prefix_end = np.asarray(prefix_end, dtype=np.int32)
+        self.time_dim = time_dim
+        # features in the order of the inputs of the model
+        self.features = [x for x in ['activities', 'roles', 'times', 'inter_attr']
+                         if x in events]
+
+    def __len__(self):
+        return len(self.prefix_end)
+
+    def __contains__(self, feature):
+        return feature in self.events
+
+    def __getitem__(self, feature):
+        if feature not in self.events:
+            raise KeyError(feature)
+        return PrefixSeries(self, feature, np.arange(len(self)))
+
+    def keys(self):
+        return list(self.features)
+
+    def sizes(self, index=None):
+        index = slice(None) if index is None else index
+        return self.prefix_end[index] - self.case_start[index]
+
+    def prefix(self, feature, i):
+        """Events of the prefix i, a view of the buffer unless the
+        feature has one hot columns"""
+        values = self.events[feature][self.case_start[i]:self.prefix_end[i]]
+        if feature in self.categories:
+            values = self.one_hot(feature, values,
+                                  np.arange(self.case_start[i], self.prefix_end[i]))
+        return values
+
+    def window(self, feature, i):
+        """Left zero padded window of the prefix i, a view of the buffer
+        unless the feature has one hot columns"""
+        values = self.events[feature][self.prefix_end[i] - self.time_dim:self.prefix_end[i]]
+        if feature in self.categories:
+            values = self.one_hot(feature, values,
+                                  np.arange(self.prefix_end[i] - self.time_dim, self.prefix_end[i]))
+        return values
+
+    def windows(self, feature, index=None):
+        """Stacked windows of many prefixes, the only copy is the
+        gather of the requested rows.
+        Args:
+            feature (str): activities, roles, times or inter_attr.
+            index (list): positions of the prefixes, all by default.
+        Returns:
+            array: windows of shape (N, time_dim) or (N, time_dim, k).
+        """
+        ends = self.prefix_end if index is None else self.prefix_end[np.asarray(index, dtype=int)]
+        buffer = self.events[feature]
+        if len(ends) == 0:
+            return np.zeros((0, self.time_dim) + buffer.shape[1:])
+        # row j of the view is the window that ends before position j + time_dim
+        view = as_strided(buffer,
+                          shape=(len(buffer) - self.time_dim + 1, self.time_dim) + buffer.shape[1:],
+                          strides=(buffer.strides[0],) + buffer.strides,
+                          writeable=False)
+        windows = np.asarray(view[ends - self.time_dim], dtype=float)
+        if feature in self.categories:
+            windows = self.one_hot(feature, windows,
+                                   ends[:, None] - self.time_dim + np.arange(self.time_dim))
+        return windows
+
+    def one_hot(self, feature, values, positions):
+        """Appends the one hot columns of a feature to its values.
+        Args:
+            feature (str): feature with categories.
+            values (array): values of the events, shape (..., k).
+            positions (array): position of the events in the buffers,
+                shape (...).
+        Returns:
+            array: values followed by the one hot columns.
+        """
+        categories = self.categories[feature]
+        width = values.shape[-1] + sum(x[1] for x in categories)
+        encoded = np.zeros(values.shape[:-1] + (width,))
+        encoded[..., :values.shape[-1]] = values
+        offset = values.shape[-1]
+        for codes, num_classes in categories:
+            codes = codes[positions]
+            rows = np.nonzero(codes >= 0)
+            encoded[rows + (offset + codes[rows],)] = 1.0
+            offset += num_classes
+        return encoded
+
+    def inputs(self, index=None):
+        """Windows of every input of the model"""
+        return [self.windows(x, index) for x in self.features]
+
+    def to_lists(self):
+        """Prefixes as independent lists, for the callers that edit them"""
+        prefixes = {x: [self.prefix(x, i).tolist() for i in range(len(self))]
+                    for x in ['activities', 'roles']}
+        for x in self.features[2:]:
+            prefixes[x] = [self.prefix(x, i).copy() for i in range(len(self))]
+        return prefixes
+
+
+class PrefixSeries():
+    """
+    Sequence of the prefixes of one feature of a store, slicing it only
+    slices the offsets
+    """
+
+    def __init__(self, store, feature, rows):
+        """constructor"""
+        self.store = store
+        self.feature = feature
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for i in self.rows:
+            yield self.store.prefix(self.feature, i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return PrefixSeries(self.store, self.feature, self.rows[i])
+        return self.store.prefix(self.feature, self.rows[i])
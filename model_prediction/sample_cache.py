@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+from support_modules import support as sup
+from model_prediction import next_event_samples_creator as nesc
+
+
+class SampleCache():
+    """
+    Batch samples of the test log of an output folder stored as .npy
+    files, the later runs open them memory mapped so the dashboard
+    processes share their pages through the page cache. The least
+    recently used samples are evicted above max_size bytes per folder.
+    """
+
+    def __init__(self, output_route, parms):
+        """constructor"""
+        parameters = os.path.join(output_route, 'parameters')
+        settings = [sup.file_hash(os.path.join(parameters, x))
+                    for x in ['test_log.csv', 'model_parameters.json']]
+        # the features also depend on the stored encoders and roles
+        settings += [self.files_state([os.path.join(parameters, 'encoders.json')]),
+                     self.files_state(glob.glob(os.path.join(parameters, 'roles', '*.json')))]
+        settings += [parms['model_type'], parms['additional_columns'],
+                    parms.get('role_discovery', 'full'), parms['batch_mode'],
+                    parms['batchprefixnum'] if parms['batch_mode'] == 'pre_prefix' else '',
+                    parms['dim']['time_dim'], min(parms['batchlogrange']),
+                    max(parms['batchlogrange'])]
+        key = hashlib.sha1(json.dumps(settings, default=str).encode('utf-8')).hexdigest()
+        self.folder = os.path.join(output_route, 'samples')
+        self.path = os.path.join(self.folder, key)
+        self.max_size = parms['sample_cache_size']
+
+    @staticmethod
+    def files_state(paths):
+        """Name, size and mtime of the existing files"""
+        return sorted([os.path.basename(x), os.path.getsize(x), os.path.getmtime(x)]
+                      for x in paths if os.path.exists(x))
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, 'meta.json'))
+
+    def save(self, samples, caseid):
+        """Writes the samples of the log, the folder only appears once
+        it is complete.
+        Args:
+            samples (dict): prefix store, next events and windows.
+            caseid (array): caseid of every prefix.
+        """
+        store = samples['prefixes']
+        temp = '{}.{}.tmp'.format(self.path, os.getpid())
+        os.makedirs(temp, exist_ok=True)
+        caseid = np.asarray(caseid)
+        arrays = {'case_start': store.case_start,
+                  'prefix_end': store.prefix_end,
+                  # string caseids are stored fixed width to be mapped
+                  'caseid': caseid.astype(str) if caseid.dtype == object else caseid,
+                  'inverse': samples['windows']['inverse']}
+        arrays.update({'events_' + x: store.events[x] for x in store.features})
+        arrays.update({'input_{}'.format(i): x
+                       for i, x in enumerate(samples['windows']['inputs'])})
+        categories = dict()
+        for feature, columns in store.categories.items():
+            categories[feature] = [x[1] for x in columns]
+            arrays.update({'codes_{}_{}'.format(feature, i): x[0]
+                           for i, x in enumerate(columns)})
+        for name, array in arrays.items():
+            np.save(os.path.join(temp, name + '.npy'), array)
+        meta = {'features': store.features,
+                'inputs': len(samples['windows']['inputs']),
+                'categories': categories,
+                'stats': samples['windows']['stats'],
+                'caseid_object': bool(caseid.dtype == object)}
+        with open(os.path.join(temp, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+        try:
+            os.replace(temp, self.path)
+        except OSError:
+            # another process stored the same samples first
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used samples of the folder until
+        they fit in max_size, the current ones are always kept"""
+        entries = list()
+        for path in glob.glob(os.path.join(self.folder, '*')):
+            meta = os.path.join(path, 'meta.json')
+            # the samples being written are only complete once renamed
+            if path == self.path or path.endswith('.tmp') or not os.path.exists(meta):
+                continue
+            size = sum(os.path.getsize(x) for x in glob.glob(os.path.join(path, '*')))
+            entries.append((os.path.getmtime(meta), size, path))
+        total = sum(x[1] for x in entries) + sum(
+            os.path.getsize(x) for x in glob.glob(os.path.join(self.path, '*')))
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def load(self, parms):
+        """Opens the stored samples memory mapped.
+        Args:
+            parms (dict): parameters of the predictor.
+        Returns:
+            tuple: samples and caseid of every prefix, None if they
+            were evicted meanwhile.
+        """
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as file:
+                meta = json.load(file)
+            # the modification time of meta.json marks the last use
+            os.utime(os.path.join(self.path, 'meta.json'))
+            return self.open_samples(meta, parms)
+        except FileNotFoundError:
+            return None
+
+    def open_samples(self, meta, parms):
+        def read(name):
+            return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+        buffers = {x: read('events_' + x) for x in meta['features']}
+        categories = {feature: [(read('codes_{}_{}'.format(feature, i)), num_classes)
+                                for i, num_classes in enumerate(columns)]
+                      for feature, columns in meta['categories'].items()}
+        samples = nesc.NextEventSamplesCreator.create_store(
+            buffers, read('case_start'), read('prefix_end'), parms, categories)
+        samples['windows'] = {'inputs': [read('input_{}'.format(i))
+                                         for i in range(meta['inputs'])],
+                              'inverse': read('inverse'),
+                              'stats': meta['stats']}
+        print("Samples loaded from", self.path)
+        caseid = np.array(read('caseid'))
+        return samples, caseid.astype(object) if meta['caseid_object'] else caseid
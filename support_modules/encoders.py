@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+
+class OrdinalEncoders():
+    """
+    Ordinal codes of the categorical attributes, 1 to n in the sorted
+    order of the categories and 0 for the unseen ones. The categories are
+    fitted on the whole test log and kept in encoders.json next to
+    model_parameters.json, so every log of a model gets the same codes.
+    """
+
+    def __init__(self, folder=None):
+        """constructor, without folder the categories are only kept in
+        memory"""
+        self.path = (None if folder is None else
+                     os.path.join('output_files', folder, 'parameters', 'encoders.json'))
+        self.categories = dict()
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path) as file:
+                self.categories = json.load(file)
+
+    def fit(self, log, features):
+        """Takes the categories of the features without stored ones from a
+        whole log, never from a view of some of its cases, and stores them.
+        Args:
+            log (DataFrame): events of the whole log.
+            features (list): names of the categorical features.
+        """
+        new = [x for x in features if x not in self.categories and x in log.columns]
+        for feature in new:
+            self.categories[feature] = sorted(log[feature].dropna().unique().tolist())
+        if new:
+            self.save()
+
+    def encode(self, values, feature):
+        """Codes of the values of a feature. A feature that wasn't fitted
+        takes its categories from the values, only kept in memory.
+        Args:
+            values (Series): values of the feature.
+            feature (str): name of the feature.
+        Returns:
+            array: code of every value.
+        """
+        if feature not in self.categories:
+            self.categories[feature] = sorted(values.dropna().unique().tolist())
+        codes = pd.Categorical(values, categories=self.categories[feature]).codes
+        return codes.astype(np.int64) + 1
+
+    def save(self):
+        if self.path is None:
+            return
+        temp = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp, 'w') as file:
+                json.dump(self.categories, file)
+            os.replace(temp, self.path)
+        except OSError as error:
+            # the categories are still used for the logs of this manager
+            print('Encoders not stored:', error)
+            if os.path.exists(temp):
+                os.remove(temp)
@@ -7,10 +7,8 @@ Created on Sat Mar 14 19:18:18 2020
 import pandas as pd
 import numpy as np
 
-import itertools
-from operator import itemgetter
-
-from support_modules import role_discovery as rl
+from support_modules import role_cache as rc
+from support_modules import encoders as enc
 class FeaturesMannager():
 
 
@@ -23,9 +21,17 @@ class FeaturesMannager():
         self.norm_method = params['norm_method']
         self.filename = params['file_name']
         self.activity = params['activity']
+        # the training parameters don't set the role cache nor the
+        # folder of the encoders
+        self.folder = params.get('folder')
+        self.role_discovery = params.get('role_discovery', 'full')
+        self.encoders = enc.OrdinalEncoders(self.folder)
         self._scalers = dict()
         self.scale_dispatcher = {'basic': self._scale_base,
                                  'inter': self._scale_inter}
+        self.role_dispatcher = {'full': self._discover_roles,
+                                'cached': self._cached_roles,
+                                'incremental': self._incremental_roles}
         # self.scale_dispatcher = {'basic': self._scale_base} #since only inter case feature models are being trained the configuration file is renamed in such a way
 
     def calculate(self, log, add_cols, type_call):
@@ -40,9 +46,13 @@ class FeaturesMannager():
 
     def add_resources(self, log):
         # Resource pool discovery
-        res_analyzer = rl.ResourcePoolAnalyser(log, sim_threshold=self.rp_sim)
+        try:
+            discover = self.role_dispatcher[self.role_discovery]
+        except KeyError:
+            raise ValueError(self.role_discovery)
+        resource_table = discover(log)
         # Role discovery
-        self.resources = pd.DataFrame.from_records(res_analyzer.resource_table)
+        self.resources = pd.DataFrame.from_records(resource_table)
         self.resources = self.resources.rename(index=str,
                                                columns={"resource": "user"})
         # Add roles information
@@ -51,6 +61,16 @@ class FeaturesMannager():
         log = log.reset_index(drop=True)
         return log
 
+    def _discover_roles(self, log):
+        return rc.discover_resources(log, self.rp_sim)
+
+    def _cached_roles(self, log):
+        return rc.discover_resources(log, self.rp_sim, self.folder)
+
+    def _incremental_roles(self, log):
+        return rc.discover_resources(log, self.rp_sim, self.folder,
+                                     incremental=True)
+
     def filter_features(self, log, add_cols):
         # print("Log Properties : ", log.dtypes, log.columns)
         # Add intercase features
@@ -69,46 +89,63 @@ class FeaturesMannager():
         Returns:
             Dataframe: The dataframe with the calculated features added.
         """
-        log['dur'] = 0
-        log['acc_cycle'] = 0
-        log['daytime'] = 0
-        log = log.to_dict('records')
-        log = sorted(log, key=lambda x: x['caseid'])
-        for _, group in itertools.groupby(log, key=lambda x: x['caseid']):
-            events = list(group)
-            ordk = 'end_timestamp' if self.one_timestamp else 'start_timestamp'
-            events = sorted(events, key=itemgetter(ordk))
-            for i in range(0, len(events)):
-                # In one-timestamp approach the first activity of the trace
-                # is taken as instantsince there is no previous timestamp
-                # to find a range
-                if self.one_timestamp:
-                    if i == 0:
-                        dur = 0
-                        acc = 0
-                    else:
-                        dur = (events[i]['end_timestamp'] -
-                               events[i-1]['end_timestamp']).total_seconds()
-                        acc = (events[i]['end_timestamp'] -
-                               events[0]['end_timestamp']).total_seconds()
-                else:
-                    dur = (events[i]['end_timestamp'] -
-                           events[i]['start_timestamp']).total_seconds()
-                    acc = (events[i]['end_timestamp'] -
-                           events[0]['start_timestamp']).total_seconds()
-                    if i == 0:
-                        wit = 0
-                    else:
-                        wit = (events[i]['start_timestamp'] -
-                               events[i-1]['end_timestamp']).total_seconds()
-                    events[i]['wait'] = wit if wit >= 0 else 0
-                events[i]['dur'] = dur
-                events[i]['acc_cycle'] = acc
-                time = events[i][ordk].time()
-                time = time.second + time.minute*60 + time.hour*3600
-                events[i]['daytime'] = time
-                events[i]['weekday'] = events[i]['end_timestamp'].weekday()
-        return pd.DataFrame.from_dict(log)
+        ordk = 'end_timestamp' if self.one_timestamp else 'start_timestamp'
+        # the events keep their order within the cases, the times are
+        # calculated over the events sorted by timestamp
+        log = log.sort_values('caseid', kind='mergesort').reset_index(drop=True)
+        order, first = self.case_time_order(log, ordk)
+        end = self.nanoseconds(log['end_timestamp'], order)
+        if self.one_timestamp:
+            # In one-timestamp approach the first activity of the trace
+            # is taken as instant since there is no previous timestamp
+            # to find a range
+            dur = np.where(first, 0, self.seconds(end - np.roll(end, 1)))
+            acc = self.seconds(end - end[self.first_positions(first)])
+        else:
+            start = self.nanoseconds(log['start_timestamp'], order)
+            dur = self.seconds(end - start)
+            acc = self.seconds(end - start[self.first_positions(first)])
+            wait = np.where(first, 0, self.seconds(start - np.roll(end, 1)))
+        times = log[ordk].dt
+        log['dur'] = self.restore_order(dur, order)
+        log['acc_cycle'] = self.restore_order(acc, order)
+        log['daytime'] = (times.second + times.minute*60 + times.hour*3600).values
+        if not self.one_timestamp:
+            log['wait'] = self.restore_order(np.maximum(wait, 0), order)
+        log['weekday'] = log['end_timestamp'].dt.weekday.values
+        return log
+
+    @staticmethod
+    def case_time_order(log, ordk):
+        """Positions of the events of a caseid sorted log sorted by
+        timestamp within every case, and the first event of every case
+        in that order"""
+        codes = pd.factorize(log['caseid'])[0]
+        order = np.lexsort((log[ordk].values, codes))
+        sorted_codes = codes[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_codes[1:] != sorted_codes[:-1]
+        return order, first
+
+    @staticmethod
+    def first_positions(first):
+        # position of the first event of the case of every event
+        return np.maximum.accumulate(np.where(first, np.arange(len(first)), 0))
+
+    @staticmethod
+    def nanoseconds(timestamps, order):
+        return timestamps.values[order].astype('datetime64[ns]').astype(np.int64)
+
+    @staticmethod
+    def seconds(nanoseconds):
+        # as Timedelta.total_seconds, with microsecond precision
+        return (nanoseconds // 1000) / 1e6
+
+    @staticmethod
+    def restore_order(values, order):
+        restored = np.empty(len(values), dtype=values.dtype)
+        restored[order] = values
+        return restored
 
     def scale_features(self, log, add_cols):
         scaler = self._get_scaler(self.model_type)
@@ -160,13 +197,16 @@ class FeaturesMannager():
                         log, _ = self.scale_feature(log, 'open_cases', 'max')
                 elif col == 'weekday':
                         log, _ = self.scale_feature(log, 'weekday', None)
+                elif col.endswith('_ord'):
+                        feature = col[:-len('_ord')]
+                        log = self.ordinal_encoder(log, feature)
+                        # scaled by the stored categories, not by the codes
+                        # present in this log, so every log gets the same values
+                        log[col + '_norm'] = log[col] / max(len(self.encoders.categories[feature]), 1)
                 elif 'sepsis' in self.filename: #Log specific Logic
                     #-- Variables which change during the case use lognorm
                     #-- Variables which don't change during the case use max
-                    if col == 'Diagnose_ord': #because of large number of catagorical variable
-                            log = self.ordinal_encoder(log, 'Diagnose')
-                            log, _ = self.scale_feature(log, 'Diagnose_ord', 'max')
-                    elif col == 'CRP':
+                    if col == 'CRP':
                             log, _ = self.scale_feature(log, 'CRP', self.norm_method)
                     elif col == 'LacticAcid':
                             log, _ = self.scale_feature(log, 'LacticAcid', self.norm_method)
@@ -235,29 +275,16 @@ class FeaturesMannager():
             log = log.drop(feature, axis=1)
         return log, scale_args
 
-    @staticmethod
-    def ordinal_encoder(log, feature, replace=False):
-        for i in range(len([feature])):
-
-            cat_label = feature
-
-            temp_list = log[[cat_label]].values.tolist()
+    def fit_encoders(self, log, add_cols):
+        """Fits the categories of the ordinal features on the whole log"""
+        self.encoders.fit(log, [x[:-len('_ord')] for x in add_cols if x.endswith('_ord')])
 
-            subsec_set = {(x[0]) for x in temp_list}
-
-            subsec_set = sorted(list(subsec_set))
-
-            _index = dict()
-
-            for ix, _ in enumerate(subsec_set):
-                _index[subsec_set[ix]] = ix + 1
-
-            _idx = lambda x: _index[x[cat_label]]
-
-            log[cat_label + '_ord'] = log.apply(_idx, axis=1)
-
-            if replace:
-                log = log.drop(feature, axis=1)
+    def ordinal_encoder(self, log, feature, replace=False):
+        """Adds the ordinal codes of a categorical feature as feature_ord,
+        with the categories stored for the model"""
+        log[feature + '_ord'] = self.encoders.encode(log[feature], feature)
+        if replace:
+            log = log.drop(feature, axis=1)
         return log
 
     # @staticmethod
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import glob
+import hashlib
+
+import pandas as pd
+
+# columns stored as categories, the callers expect them as objects
+CATEGORICAL_COLUMNS = ['caseid', 'task', 'user', 'role']
+
+
+def cache_path(input, settings):
+    """
+    path of the parsed log of a source file, named by the digest of the
+    settings of the parse and by the digest of the size and mtime of the
+    source
+    """
+    stat = os.stat(input)
+    folder, name = os.path.split(input)
+    return os.path.join(folder, 'parsed_logs', '{}.{}.{}.feather'.format(
+        name, digest(settings), digest([stat.st_size, stat.st_mtime_ns])))
+
+
+def digest(value):
+    text = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def read_cached(input, settings, parse):
+    """Reads the parsed log of a source file from its feather copy, the
+    log is parsed and stored the first time.
+    Args:
+        input (str): path of the source log.
+        settings (dict): options of the parse, part of the key.
+        parse (function): parser of the source log, returns a DataFrame.
+    Returns:
+        DataFrame: parsed log.
+    """
+    path = cache_path(input, settings)
+    if os.path.exists(path):
+        log = pd.read_feather(path)
+        for column in [x for x in CATEGORICAL_COLUMNS if x in log.columns]:
+            log[column] = log[column].astype(object)
+        return log
+    log = parse()
+    write_cache(path, log)
+    return log
+
+
+def write_cache(path, log):
+    folder, name = os.path.split(path)
+    stored = log.reset_index(drop=True)
+    for column in [x for x in CATEGORICAL_COLUMNS if x in stored.columns]:
+        stored[column] = stored[column].astype('category')
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(folder, exist_ok=True)
+        # the copies parsed from previous versions of the source are dropped
+        pattern = glob.escape(name.rsplit('.', 2)[0]) + '.*.feather'
+        for old in glob.glob(os.path.join(folder, pattern)):
+            os.remove(old)
+        stored.to_feather(temp)
+        os.replace(temp, path)
+    except (ImportError, ValueError, TypeError, OSError) as error:
+        # without pyarrow, with columns of mixed types or next to a read
+        # only source the log is parsed every time
+        print('Parsed log not cached:', error)
+        if os.path.exists(temp):
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 import datetime
 import gzip
-import itertools as it
 import os
 import zipfile as zf
+import xml.etree.ElementTree as et
 from operator import itemgetter
 
+import numpy as np
 import pandas as pd
 
 from support_modules import support as sup
+from support_modules.readers import log_cache as lc
+
+# xes keys of the events as the columns of the csv exports
+_XES_COLUMNS = {'concept:name': 'Activity',
+                'org:resource': 'Resource',
+                'time:timestamp': 'Complete Timestamp'}
 
 
 class LogReader(object):
@@ -29,10 +36,34 @@ class LogReader(object):
         self.filter_d_attrib = settings['filter_d_attrib']
         self.ns_include = settings['ns_include']
 
-        self.data = list()
-        self.raw_data = list()
+        # the log is kept as a DataFrame, the records are only built
+        # when data or raw_data are requested
+        self.log = pd.DataFrame()
+        # types of the parsed events, the Start and End events turn the
+        # integer columns into floats
+        self.dtypes = pd.Series(dtype=object)
+        self._data = None
+        self._raw_data = None
         self.load_data_from_file()
 
+    @property
+    def data(self):
+        """events of the log as a list of dicts"""
+        if self._data is None:
+            self._data = self.log.to_dict('records')
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self.set_data(data)
+
+    @property
+    def raw_data(self):
+        """start and complete transitions of the events as a list of dicts"""
+        if self._raw_data is None:
+            self._raw_data = self.split_event_transitions().to_dict('records')
+        return self._raw_data
+
     def load_data_from_file(self):
         """
         reads all the data from the log depending
@@ -40,33 +71,57 @@ class LogReader(object):
         """
         if self.file_extension == '.csv':
             self.get_csv_events_data()
+        elif self.file_extension == '.xes':
+            self.get_xes_events_data()
 
 # =============================================================================
 # csv methods
 # =============================================================================
     def get_csv_events_data(self):
         """
-        reads and parse all the events information from a csv file
+        reads and parse all the events information from a csv file, the
+        parsed events are read from their feather copy when it exists
         """
         sup.print_performed_task('Reading log traces ')
-        log = pd.read_csv(self.input, dtype={'user': str})
+        log = lc.read_cached(self.input, self.parse_settings(), self.read_csv_log)
+        self.dtypes = log.dtypes
+        self.log = self.append_csv_start_end(log)
+        sup.print_done_task()
+
+    def parse_settings(self):
+        """
+        maps the timestamp columns and returns the options of the parse
+        of the csv and xes files
+        """
+        if not self.one_timestamp:
+            self.column_names['Start Timestamp'] = 'start_timestamp'
+        self.column_names['Complete Timestamp'] = 'end_timestamp'
+        return {'timeformat': self.timeformat,
+                'column_names': self.column_names,
+                'one_timestamp': self.one_timestamp,
+                'filter_d_attrib': self.filter_d_attrib}
+
+    def read_csv_log(self):
+        """
+        parses the events of the csv file, without Start and End events
+        """
+        with self.open_input() as file:
+            return self.parse_csv_events(pd.read_csv(file, dtype={'user': str}))
+
+    def parse_csv_events(self, log):
+        """
+        renames, filters and types the events read from a csv file
+        """
+        log = log.rename(columns=self.column_names)
+        log = log.astype({'caseid': object})
+        log = (log[(log.task != 'Start') & (log.task != 'End')]
+               .reset_index(drop=True))
         if self.one_timestamp:
-            self.column_names['Complete Timestamp'] = 'end_timestamp'
-            log = log.rename(columns=self.column_names)
-            log = log.astype({'caseid': object})
-            log = (log[(log.task != 'Start') & (log.task != 'End')]
-                   .reset_index(drop=True))
             if self.filter_d_attrib:
                 log = log[['caseid', 'task', 'user', 'end_timestamp']]
             log['end_timestamp'] = pd.to_datetime(log['end_timestamp'],
                                                   format=self.timeformat)
         else:
-            self.column_names['Start Timestamp'] = 'start_timestamp'
-            self.column_names['Complete Timestamp'] = 'end_timestamp'
-            log = log.rename(columns=self.column_names)
-            log = log.astype({'caseid': object})
-            log = (log[(log.task != 'Start') & (log.task != 'End')]
-                   .reset_index(drop=True))
             if self.filter_d_attrib:
                 log = log[['caseid', 'task', 'user',
                            'start_timestamp', 'end_timestamp']]
@@ -74,58 +129,162 @@ class LogReader(object):
                                                     format=self.timeformat)
             log['end_timestamp'] = pd.to_datetime(log['end_timestamp'],
                                                   format=self.timeformat)
-
         log['user'].fillna('SYS', inplace=True)
-        self.data = log.to_dict('records')
-        self.append_csv_start_end()
-        self.split_event_transitions()
+        return log
+
+# =============================================================================
+# xes methods
+# =============================================================================
+    def get_xes_events_data(self):
+        """
+        reads and parse all the events information from a xes file, the
+        parsed events are read from their feather copy when it exists
+        """
+        sup.print_performed_task('Reading log traces ')
+        log = lc.read_cached(self.input, self.parse_settings(), self.read_xes_log)
+        self.dtypes = log.dtypes
+        self.log = self.append_csv_start_end(log)
         sup.print_done_task()
 
+    def read_xes_log(self, batch_size=100000):
+        """
+        parses the events of the xes file with iterparse, the elements
+        are cleared once read. The events get the column names of the
+        csv exports, so they follow the same renaming and typing.
+        """
+        frames, records = list(), list()
+        for trace in self.iter_xes_traces():
+            records.extend(trace)
+            if len(records) >= batch_size:
+                frames.append(self.xes_frame(records))
+                records = list()
+        if records or not frames:
+            frames.append(self.xes_frame(records))
+        log = pd.concat(frames, ignore_index=True)
+        log = log.reindex(columns=list(dict.fromkeys(
+            ['Case ID', 'Activity', 'Resource'] + list(log.columns))))
+        return self.parse_csv_events(log)
+
+    @staticmethod
+    def xes_frame(records):
+        # timestamps are parsed by batch, they may carry different offsets,
+        # and kept as naive UTC times like the ones of the csv files
+        frame = pd.DataFrame(records)
+        for column in ['Start Timestamp', 'Complete Timestamp']:
+            if column in frame:
+                frame[column] = pd.to_datetime(frame[column], utc=True).dt.tz_convert(None)
+        return frame
+
+    def iter_xes_traces(self):
+        """
+        yields the events of every trace of the xes file as records
+        """
+        with self.open_input() as file:
+            tags, root = list(), None
+            events, trace_attrib, event_attrib = list(), dict(), dict()
+            for action, element in et.iterparse(file, events=('start', 'end')):
+                tag = element.tag.rsplit('}', 1)[-1]
+                if action == 'start':
+                    if root is None:
+                        root = element
+                    tags.append(tag)
+                    continue
+                tags.pop()
+                parent = tags[-1] if tags else None
+                if tag == 'event':
+                    events.append(event_attrib)
+                    event_attrib = dict()
+                    element.clear()
+                elif tag == 'trace':
+                    yield self.xes_trace_events(events, trace_attrib)
+                    events, trace_attrib = list(), dict()
+                    root.clear()
+                elif parent in ['event', 'trace'] and 'key' in element.attrib:
+                    attrib = event_attrib if parent == 'event' else trace_attrib
+                    attrib[element.attrib['key']] = self.xes_value(tag, element.attrib.get('value'))
+
+    def xes_trace_events(self, events, trace_attrib):
+        """
+        joins the transitions of the events of a trace, the start of an
+        activity is paired with its next completion
+        """
+        caseid = trace_attrib.pop('concept:name', None)
+        records, started = list(), dict()
+        for event in events:
+            transition = str(event.get('lifecycle:transition', 'complete')).lower()
+            task = event.get('concept:name')
+            if transition == 'start':
+                started.setdefault(task, list()).append(event.get('time:timestamp'))
+            elif transition == 'complete':
+                record = {**trace_attrib,
+                          **{_XES_COLUMNS.get(k, k): v for k, v in event.items()}}
+                record['Case ID'] = caseid
+                if not self.one_timestamp:
+                    starts = started.get(task)
+                    record['Start Timestamp'] = (starts.pop(0) if starts
+                                                 else record['Complete Timestamp'])
+                records.append(record)
+        return records
+
+    @staticmethod
+    def xes_value(tag, value):
+        if tag == 'int':
+            return int(value)
+        elif tag == 'float':
+            return float(value)
+        elif tag == 'boolean':
+            return value == 'true'
+        return value
+
     def split_event_transitions(self):
-        temp_raw = list()
+        """
+        returns the start and complete transitions of every event
+        """
+        columns = [x for x in self.log.columns
+                   if x not in ['start_timestamp', 'end_timestamp']]
+        # columns in the order of the records of the Start events first
+        columns = columns[:3] + ['timestamp', 'event_type'] + columns[3:]
         if self.one_timestamp:
-            for event in self.data:
-                temp_event = event.copy()
-                temp_event['timestamp'] = temp_event.pop('end_timestamp')
-                temp_event['event_type'] = 'complete'
-                temp_raw.append(temp_event)
-        else:
-            for event in self.data:
-                start_event = event.copy()
-                complete_event = event.copy()
-                start_event.pop('end_timestamp')
-                complete_event.pop('start_timestamp')
-                start_event['timestamp'] = start_event.pop('start_timestamp')
-                complete_event['timestamp'] = complete_event.pop('end_timestamp')
-                start_event['event_type'] = 'start'
-                complete_event['event_type'] = 'complete'
-                temp_raw.append(start_event)
-                temp_raw.append(complete_event)
-        self.raw_data = temp_raw
-
-    def append_csv_start_end(self):
-        new_data = list()
-        data = sorted(self.data, key=lambda x: x['caseid'])
-        for key, group in it.groupby(data, key=lambda x: x['caseid']):
-            trace = list(group)
-            for new_event in ['Start', 'End']:
-                idx = 0 if new_event == 'Start' else -1
-                t_key = 'end_timestamp'
-                if not self.one_timestamp and new_event == 'Start':
-                    t_key = 'start_timestamp'
-                temp_event = dict()
-                temp_event['caseid'] = trace[idx]['caseid']
-                temp_event['task'] = new_event
-                temp_event['user'] = new_event
-                temp_event['end_timestamp'] = trace[idx][t_key]
-                if not self.one_timestamp:
-                    temp_event['start_timestamp'] = trace[idx][t_key]
-                if new_event == 'Start':
-                    trace.insert(0, temp_event)
-                else:
-                    trace.append(temp_event)
-            new_data.extend(trace)
-        self.data = new_data
+            raw = self.log.rename(columns={'end_timestamp': 'timestamp'})
+            raw['event_type'] = 'complete'
+            return raw[columns]
+        start = self.log.assign(timestamp=self.log.start_timestamp.array,
+                                event_type='start')
+        complete = self.log.assign(timestamp=self.log.end_timestamp.array,
+                                   event_type='complete')
+        # the start transition of every event right before its completion
+        raw = pd.concat([start[columns], complete[columns]], ignore_index=True)
+        order = np.argsort(np.tile(np.arange(len(self.log)), 2), kind='mergesort')
+        return raw.iloc[order].reset_index(drop=True)
+
+    def append_csv_start_end(self, log):
+        """
+        sorts the events by caseid and adds the Start and End events of
+        every trace, taken from its first and last events
+        """
+        log = log.sort_values('caseid', kind='mergesort')
+        first = log.drop_duplicates('caseid', keep='first')
+        last = log.drop_duplicates('caseid', keep='last')
+        bounds = list()
+        for new_event, trace in [('Start', first), ('End', last)]:
+            t_key = 'end_timestamp'
+            if not self.one_timestamp and new_event == 'Start':
+                t_key = 'start_timestamp'
+            event = pd.DataFrame({'caseid': trace.caseid.values,
+                                  'task': new_event,
+                                  'user': new_event,
+                                  'end_timestamp': trace[t_key].array})
+            if not self.one_timestamp:
+                event['start_timestamp'] = trace[t_key].array
+            bounds.append(event)
+        columns = list(bounds[0].columns)
+        columns += [x for x in log.columns if x not in columns]
+        log = pd.concat([bounds[0], log, bounds[1]], ignore_index=True)[columns]
+        # Start, the events in their order and End within every trace
+        position = np.concatenate([np.zeros(len(first)), np.ones(len(log) - len(first) - len(last)),
+                                   np.full(len(last), 2)])
+        codes = pd.factorize(log.caseid, sort=True)[0]
+        return log.iloc[np.lexsort((position, codes))].reset_index(drop=True)
 
 # =============================================================================
 # Accesssor methods
@@ -161,39 +320,155 @@ class LogReader(object):
         """
         seting method for the data attribute
         """
-        self.data = data
+        self._data = data
+        self._raw_data = None
+        self.log = pd.DataFrame(data)
+
+    def get_dataframe(self):
+        """
+        returns the events of the log with its Start and End events
+        """
+        return self.log
 
 # =============================================================================
 # Support Method
 # =============================================================================
     def define_ftype(self):
         filename, file_extension = os.path.splitext(self.input)
+        self.compression = None
         # if file_extension in ['.xes', '.csv', '.mxml']:
+        if file_extension in ['.gz', '.zip']:
+            # archives are read in stream, the format is the one of the log inside
+            self.compression = file_extension
+            if file_extension == '.zip':
+                filename = self.zip_member()
+            filename, file_extension = os.path.splitext(filename)
         if file_extension in ['.xes', '.csv']:
             filename = filename + file_extension
-            file_extension = file_extension
-        elif file_extension == '.gz':
-            outFileName = filename
-            filename, file_extension = self.decompress_file_gzip(outFileName)
-        elif file_extension == '.zip':
-            filename, file_extension = self.decompress_file_zip(filename)
         else:
             raise IOError('file type not supported')
         return filename, file_extension
 
-    # Decompress .gz files
-    def decompress_file_gzip(self, outFileName):
-        inFile = gzip.open(self.input, 'rb')
-        outFile = open(outFileName, 'wb')
-        outFile.write(inFile.read())
-        inFile.close()
-        outFile.close()
-        _, fileExtension = os.path.splitext(outFileName)
-        return outFileName, fileExtension
-
-    # Decompress .zip files
-    def decompress_file_zip(self, outfilename):
-        with zf.ZipFile(self.input, "r") as zip_ref:
-            zip_ref.extractall("../inputs/")
-        _, fileExtension = os.path.splitext(outfilename)
-        return outfilename, fileExtension
+    def zip_member(self):
+        """
+        name of the log inside a zip file, the one named as the archive or
+        its only csv or xes member
+        """
+        with zf.ZipFile(self.input, 'r') as archive:
+            members = [x for x in archive.namelist()
+                       if os.path.splitext(x)[1] in ['.xes', '.csv']]
+        name = os.path.splitext(os.path.basename(self.input))[0]
+        if name in members:
+            return name
+        if len(members) != 1:
+            raise IOError('zip file without a single log: ' + self.input)
+        return members[0]
+
+    def open_input(self):
+        """
+        binary file object of the log, decompressed while it is read
+        """
+        if self.compression == '.gz':
+            return gzip.open(self.input, 'rb')
+        elif self.compression == '.zip':
+            archive = zf.ZipFile(self.input, 'r')
+            member = archive.open(self.file_name)
+            # the member keeps its own reference to the archive file
+            archive.close()
+            return member
+        return open(self.input, 'rb')
+
+
+class ChunkedLogReader(LogReader):
+    """
+    Reads a csv log by chunks of rows and yields its traces once they are
+    complete, so logs larger than the memory can be processed by groups
+    of cases. A trace is complete when the next case starts, for logs
+    sorted by caseid, or when its End event is read, for logs with end of
+    case markers. Only the events of the open traces are kept.
+    """
+
+    def __init__(self, input, settings, chunksize=100000, end_marker=False):
+        """constructor"""
+        self.chunksize = chunksize
+        self.end_marker = end_marker
+        super().__init__(input, settings)
+
+    def load_data_from_file(self):
+        # the events are only read while iterating
+        if self.file_extension != '.csv':
+            raise IOError('file type not supported')
+        self.parse_settings()
+
+    def __iter__(self):
+        return self.iter_traces()
+
+    def iter_traces(self):
+        """
+        yields every trace of the log with its Start and End events, in
+        the order in which the traces are completed
+        """
+        for log in self.iter_complete_events():
+            for _, trace in log.groupby('caseid', sort=False):
+                yield self.append_csv_start_end(trace)
+
+    def iter_batches(self, batch_size):
+        """
+        yields groups of complete traces of about batch_size events, with
+        their Start and End events
+        """
+        batch, size = list(), 0
+        for log in self.iter_complete_events():
+            batch.append(log)
+            size += len(log)
+            if size >= batch_size:
+                yield self.append_csv_start_end(pd.concat(batch, ignore_index=True))
+                batch, size = list(), 0
+        if batch:
+            yield self.append_csv_start_end(pd.concat(batch, ignore_index=True))
+
+    def iter_complete_events(self):
+        """
+        yields the parsed events of the traces completed by every chunk,
+        the events of the open traces are kept until they are complete
+        """
+        with self.open_input() as file:
+            pending = pd.DataFrame()
+            for chunk in pd.read_csv(file, dtype={'user': str},
+                                     chunksize=self.chunksize):
+                if self.end_marker:
+                    tasks = chunk.rename(columns=self.column_names)
+                    # every event read of these traces is yielded below
+                    finished = set(tasks[tasks.task == 'End'].caseid)
+                log = self.parse_csv_events(chunk)
+                if not pending.empty:
+                    log = pd.concat([pending, log], ignore_index=True)
+                if log.empty:
+                    continue
+                if self.end_marker:
+                    complete = log.caseid.isin(finished)
+                else:
+                    self.check_sorted(log.caseid.values)
+                    # only the last case of a sorted log may continue
+                    complete = log.caseid != log.caseid.iloc[-1]
+                pending = log[~complete].reset_index(drop=True)
+                if complete.any():
+                    yield log[complete].reset_index(drop=True)
+            if not pending.empty:
+                yield pending
+
+    @staticmethod
+    def check_sorted(caseids):
+        """
+        raises ValueError when the caseids decrease, a case that comes
+        back after a later one would be split in several traces
+        """
+        try:
+            decreasing = np.flatnonzero(caseids[1:] < caseids[:-1])
+        except TypeError:
+            raise ValueError('caseids of mixed types, the log cannot be '
+                             'checked to be sorted by case')
+        if len(decreasing):
+            raise ValueError('the log is not sorted by caseid, {} comes after {}. '
+                             'Sort it or read it with end_marker'.format(
+                                 caseids[decreasing[0] + 1], caseids[decreasing[0]]))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from support_modules.readers import log_reader as lr
+
+
+class LogStore():
+    """
+    Process wide store of the parsed logs, every log is parsed once and
+    shared by the dashboard and the predictors of every session
+    """
+
+    def __init__(self, max_size=3):
+        """constructor"""
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, input, settings):
+        """Returns the stored log of a file, parsed on the first request.
+        Args:
+            input (str): path of the log.
+            settings (dict): read options of the LogReader.
+        Returns:
+            StoredLog: events of the log.
+        """
+        stat = os.stat(input)
+        key = (input, stat.st_size, stat.st_mtime_ns,
+               json.dumps(settings, sort_keys=True, default=str))
+
+        def parse():
+            # the readers rename the columns through their own copy
+            reader = lr.LogReader(input, json.loads(json.dumps(settings)))
+            return StoredLog(reader.get_dataframe(), reader.dtypes)
+        return compute_once(self._entries, self._lock, key, parse, self.max_size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class StoredLog():
+    """
+    Events of a log without its Start and End events, grouped by case.
+    The views it hands out are shared, so they must be read only.
+    """
+
+    def __init__(self, log, dtypes, max_derived=8):
+        """constructor"""
+        self.dtypes = dtypes
+        self.events = (log[~log.task.isin(['Start', 'End'])]
+                       .reset_index(drop=True))
+        # the reader keeps the events of every case together
+        codes, caseids = pd.factorize(self.events.caseid)
+        sizes = np.bincount(codes, minlength=len(caseids))
+        starts = np.cumsum(sizes) - sizes
+        self.cases = {c: (s, s + n) for c, s, n in zip(caseids, starts, sizes)}
+        # number of events of the case of every event
+        self.case_sizes = sizes[codes]
+        self.max_derived = max_derived
+        self._derived = OrderedDict()
+        self._lock = threading.Lock()
+
+    def case(self, caseid):
+        """Events of a case, a slice of the stored events"""
+        if caseid not in self.cases:
+            return self.events.iloc[0:0]
+        start, end = self.cases[caseid]
+        return self.events.iloc[start:end]
+
+    def size_range(self, low, high):
+        """Events of the cases with between low and high events, the
+        stored events themselves when every case is in the range"""
+        selected = (self.case_sizes >= low) & (self.case_sizes <= high)
+        if selected.all():
+            return self.events
+        return self.events[selected]
+
+    def parsed_types(self):
+        """Copy of the events with the types of the parsed file"""
+        return self.events.astype({k: v for k, v in self.dtypes.items()
+                                   if k in self.events and self.events[k].dtype != v})
+
+    def derived(self, key, calculate):
+        """Frame computed from the events, calculated once per key and
+        kept for the max_derived most recently used keys.
+        Args:
+            key (tuple): view of the events and options of the calculation.
+            calculate (function): calculation of the frame.
+        Returns:
+            DataFrame: shared frame, read only.
+        """
+        return compute_once(self._derived, self._lock, key, calculate, self.max_derived)
+
+
+def compute_once(entries, lock, key, calculate, max_size):
+    """Value of a key of an LRU store, calculated by the first caller.
+    The calculation runs outside the lock, so other keys aren't blocked,
+    and the concurrent callers of the same key wait for its future.
+    Args:
+        entries (OrderedDict): futures of the store by key.
+        lock (Lock): lock of the entries.
+        key (tuple): key of the value.
+        calculate (function): calculation of the value.
+        max_size (int): number of keys kept.
+    Returns:
+        value of the key.
+    """
+    with lock:
+        future = entries.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            entries[key] = future
+        else:
+            entries.move_to_end(key)
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+    if owner:
+        try:
+            future.set_result(calculate())
+        except BaseException as e:
+            # the failure isn't kept, the next caller calculates again
+            with lock:
+                if entries.get(key) is future:
+                    del entries[key]
+            future.set_exception(e)
+            raise
+    return future.result()
+
+
+LOG_STORE = LogStore()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+
+import pandas as pd
+
+from support_modules import role_discovery as rl
+
+
+def cache_path(folder, key):
+    return os.path.join('output_files', folder, 'parameters', 'roles',
+                        key + '.json')
+
+
+def entry_key(fingerprint, sim_threshold, incremental=False):
+    """
+    name of the entry of a discovery, the assignments to the known roles
+    are kept apart from the full discoveries
+    """
+    kind = 'incremental' if incremental else 'full'
+    return '{}.{}.{}'.format(fingerprint, kind, sim_threshold)
+
+
+def base_key(sim_threshold):
+    """name of the discovery the new users of the incremental mode join"""
+    return 'base.{}'.format(sim_threshold)
+
+
+def fingerprint(data):
+    """
+    digest of the (task, user) frequency matrix of a log, in order of
+    appearance since the names of the roles depend on it
+    """
+    freq = data.groupby(['user', 'task'], sort=False).size().reset_index()
+    hashes = pd.util.hash_pandas_object(freq, index=False)
+    return hashlib.sha1(hashes.values.tobytes()).hexdigest()
+
+
+def discover_resources(log, sim_threshold, folder=None, incremental=False):
+    """Resource table of a log, read from the role cache of the output
+    folder when the same frequency matrix was already analysed.
+    Args:
+        log (DataFrame): events of the log.
+        sim_threshold (float): similarity threshold of the roles.
+        folder (str): output folder of the model, None to not cache.
+        incremental (bool): assign the new users to the roles of the
+            first full discovery of the folder with the same threshold
+            instead of discovering them again.
+    Returns:
+        list: role of every resource.
+    """
+    data = rl.ResourcePoolAnalyser.read_resource_pool(log)
+    if folder is None:
+        return rl.ResourcePoolAnalyser(data, sim_threshold=sim_threshold).resource_table
+    known = read_entry(cache_path(folder, base_key(sim_threshold))) if incremental else None
+    path = cache_path(folder, entry_key(fingerprint(data), sim_threshold,
+                                        known is not None))
+    entry = read_entry(path)
+    if entry is not None:
+        return entry['resource_table']
+    analyser = rl.ResourcePoolAnalyser(data, sim_threshold=sim_threshold,
+                                       known=known)
+    entry = {'rp_sim': sim_threshold,
+             'users': list(analyser.users),
+             'tasks': list(analyser.tasks),
+             'profiles': analyser.profiles.astype(int).tolist(),
+             'roles': analyser.roles,
+             'resource_table': analyser.resource_table}
+    write_entry(path, entry)
+    base = cache_path(folder, base_key(sim_threshold))
+    if known is None and not os.path.exists(base):
+        # the first full discovery is the base of the next assignments
+        write_entry(base, entry)
+    return analyser.resource_table
+
+
+def read_entry(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_entry(path, entry):
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp, 'w') as file:
+            # the names of the users can be numpy scalars
+            json.dump(entry, file, default=lambda x: x.item())
+        os.replace(temp, path)
+    except OSError as error:
+        # without a writable output folder the roles are discovered
+        # every time
+        print('Roles not cached:', error)
+        if os.path.exists(temp):
+            os.remove(temp)
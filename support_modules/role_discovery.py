@@ -1,8 +1,9 @@
-﻿# -*- coding: utf-8 -*-
-import scipy
-from scipy.stats import pearsonr
-import networkx as nx
+# -*- coding: utf-8 -*-
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
 from support_modules import support as sup
+from support_modules.readers import log_reader as lr
 from operator import itemgetter
 import pandas as pd
 
@@ -12,88 +13,142 @@ class ResourcePoolAnalyser():
         This class evaluates the tasks durations and associates resources to it
      """
 
-    def __init__(self, log, drawing=False, sim_threshold=0.7):
-        """constructor"""
+    def __init__(self, log, sim_threshold=0.7, known=None):
+        """constructor, with the roles of a previous discovery as known
+        the new users are only assigned to them"""
         self.data = self.read_resource_pool(log)
-        self.drawing = drawing
         self.sim_threshold = sim_threshold
         
         self.tasks = {val: i for i, val in enumerate(self.data.task.unique())}
         self.users = {val: i for i, val in enumerate(self.data.user.unique())}
         
-        self.roles, self.resource_table = self.discover_roles()
+        self.profiles = self.build_profile()
+        if known is None:
+            self.roles, self.resource_table = self.discover_roles()
+        else:
+            self.roles, self.resource_table = self.assign_roles(known)
 
-    def read_resource_pool(self, log):
+    @staticmethod
+    def read_resource_pool(log):
         if isinstance(log, pd.DataFrame):
             filtered_list = log[['task', 'user']]
+        elif isinstance(log, lr.ChunkedLogReader):
+            # only the columns of the pool are kept from every chunk
+            filtered_list = pd.concat([x[['task', 'user']]
+                                       for x in log.iter_complete_events()],
+                                      ignore_index=True)
         else:
-            filtered_list = pd.DataFrame(log.data)[['task', 'user']]
+            filtered_list = log.get_dataframe()[['task', 'user']]
         filtered_list = filtered_list[~filtered_list.task.isin(['Start', 'End'])]
         filtered_list = filtered_list[filtered_list.user != 'AUTO']
         return filtered_list
 
 
     def discover_roles(self):
-        associations = lambda x: (self.tasks[x['task']], self.users[x['user']])
-        self.data['ac_rl'] = self.data.apply(associations, axis=1)
-    
-        freq_matrix = (self.data.groupby(by='ac_rl')['task']
-                       .count()
-                       .reset_index()
-                       .rename(columns={'task': 'freq'}))
-        freq_matrix = {x['ac_rl']: x['freq'] for x in freq_matrix.to_dict('records')}
-        
-        profiles = self.build_profile(freq_matrix)
-    
         sup.print_progress(((20 / 100)* 100),'Analysing resource pool ')
         # building of a correl matrix between resouces profiles
-        correl_matrix = self.det_correl_matrix(profiles)
+        correl_matrix = self.det_correl_matrix(self.profiles)
         sup.print_progress(((40 / 100)* 100),'Analysing resource pool ')
-        # creation of a rel network between resouces
-        g = nx.Graph()
-        for user in self.users.values():
-            g.add_node(user)
-        for rel in correl_matrix:
-            # creation of edges between nodes excluding the same elements
-            # and those below the similarity threshold 
-            if rel['distance'] > self.sim_threshold and rel['x'] != rel['y']:
-                g.add_edge(rel['x'],
-                           rel['y'],
-                           weight=rel['distance'])
+        # creation of a rel network between resouces, excluding the same
+        # elements and those below the similarity threshold
+        with np.errstate(invalid='ignore'):
+            adjacency = correl_matrix > self.sim_threshold
+        np.fill_diagonal(adjacency, False)
+        g = sparse.csr_matrix(adjacency)
         sup.print_progress(((60 / 100) * 100),'Analysing resource pool ')
         # extraction of fully conected subgraphs as roles
-        sub_graphs = list(nx.connected_components(g))
+        sub_graphs = self.connected_components(g)
         sup.print_progress(((80 / 100) * 100),'Analysing resource pool ')
         # role definition from graph
         roles = self.role_definition(sub_graphs)
-        # plot creation (optional)
-        # if drawing == True:
-        #     graph_network(g, sub_graphs)
         sup.print_progress(((100 / 100)* 100),'Analysing resource pool ')
         sup.print_done_task()
         return roles
-    
-    def build_profile(self, freq_matrix):
-        profiles=list()
-        for user, idx in self.users.items():
-            profile = [0,] * len(self.tasks)
-            for ac_rl, freq in freq_matrix.items():
-                if idx == ac_rl[1]:
-                    profile[ac_rl[0]] = freq
-            profiles.append({'user': idx, 'profile': profile})
-        return profiles
 
-    def det_correl_matrix(self, profiles):
-        correl_matrix = list()
-        for profile_x in profiles:
-            for profile_y in profiles:
-                x = scipy.array(profile_x['profile'])
-                y = scipy.array(profile_y['profile'])
-                r_row, p_value = pearsonr(x, y)
-                correl_matrix.append(({'x': profile_x['user'],
-                                            'y': profile_y['user'],
-                                            'distance': r_row}))
-        return correl_matrix
+    def assign_roles(self, known):
+        """Keeps the roles of a previous discovery, every new user joins
+        the role of the known user with the most correlated profile and
+        the unrelated ones form new roles among them.
+        Args:
+            known (dict): users, tasks, profiles and roles of the discovery.
+        Returns:
+            tuple: role records and resource table.
+        """
+        sup.print_performed_task('Assigning new resources to roles ')
+        known_tasks = set(known['tasks'])
+        tasks = list(known['tasks']) + [x for x in self.tasks if x not in known_tasks]
+        task_index = {val: i for i, val in enumerate(tasks)}
+        known_users = set(known['users'])
+        new_users = [x for x in self.users if x not in known_users]
+        users = list(known['users']) + new_users
+        n_known = len(known['users'])
+        # profiles over the tasks of both, the known ones are kept
+        profiles = np.zeros((len(users), len(tasks)))
+        profiles[:n_known, :len(known['tasks'])] = np.reshape(
+            known['profiles'], (n_known, len(known['tasks'])))
+        profiles[np.ix_(np.arange(n_known, len(users)),
+                        [task_index[x] for x in self.tasks])] = (
+            self.profiles[[self.users[x] for x in new_users]])
+        correl_matrix = self.det_correl_matrix(profiles)[n_known:]
+        with np.errstate(invalid='ignore'):
+            similar = correl_matrix > self.sim_threshold
+        np.fill_diagonal(similar[:, n_known:], False)
+        records = [{'role': x['role'], 'quantity': x['quantity'],
+                    'members': list(x['members'])} for x in known['roles']]
+        role_index = {member: record
+                      for record in records for member in record['members']}
+        unrelated = list()
+        for i, user in enumerate(new_users):
+            if similar[i, :n_known].any():
+                best = np.nanargmax(correl_matrix[i, :n_known])
+                record = role_index[users[best]]
+                record['members'].append(user)
+                record['quantity'] += 1
+            else:
+                unrelated.append(i)
+        unrelated = np.array(unrelated, dtype=int)
+        g = sparse.csr_matrix(similar[np.ix_(unrelated, n_known + unrelated)])
+        sub_graphs = self.connected_components(g)
+        new_roles = [[new_users[unrelated[x]] for x in sub_graph]
+                     for sub_graph in sub_graphs]
+        for members in sorted(new_roles, key=len, reverse=True):
+            records.append({'role': 'Role '+ str(len(records) + 1),
+                            'quantity': len(members),
+                            'members': members})
+        self.users = {val: i for i, val in enumerate(users)}
+        self.tasks = task_index
+        self.profiles = profiles
+        sup.print_done_task()
+        return records, self.build_resource_table(records)
+
+    def build_profile(self):
+        """Matrix of the number of executions of every task (columns) by
+        every user (rows), indexed as self.users and self.tasks"""
+        # the codes follow the order of appearance, as the indexes
+        users, _ = pd.factorize(self.data.user)
+        tasks, _ = pd.factorize(self.data.task)
+        shape = (len(self.users), len(self.tasks))
+        freq = np.bincount(users * shape[1] + tasks,
+                           minlength=shape[0] * shape[1])
+        return freq.reshape(shape).astype(float)
+
+    @staticmethod
+    def det_correl_matrix(profiles):
+        """Pearson correlation between the profiles of every pair of users,
+        NaN for the users with a constant profile"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correl_matrix = np.corrcoef(profiles)
+        return np.clip(correl_matrix, -1, 1)
+
+    @staticmethod
+    def connected_components(g):
+        """Lists of connected users, ordered by their appearance in the log"""
+        _, labels = csgraph.connected_components(g, directed=False)
+        _, first, sizes = np.unique(labels, return_index=True,
+                                    return_counts=True)
+        members = np.split(np.argsort(labels, kind='stable'),
+                           np.cumsum(sizes)[:-1])
+        return [members[x].tolist() for x in np.argsort(first)]
 
     def role_definition(self, sub_graphs):
         user_index = {v: k for k, v in self.users.items()}
@@ -107,30 +162,13 @@ class ResourcePoolAnalyser():
         records = sorted(records, key=itemgetter('quantity'), reverse=True)
         for i in range(0,len(records)):
             records[i]['role']='Role '+ str(i + 1)
+        return records, self.build_resource_table(records)
+
+    @staticmethod
+    def build_resource_table(records):
         resource_table = list()
         for record in records:
             for member in record['members']:
                 resource_table.append({'role': record['role'],
                                        'resource': member})
-        return records, resource_table
-
-    # # == support
-    # def random_color(size):
-    #     number_of_colors = size
-    #     color = ["#"+''.join([random.choice('0123456789ABCDEF')
-    #                           for j in range(6)]) for i in range(number_of_colors)]
-    #     return color
-    
-    # def graph_network(g, sub_graphs):
-    #     pos = nx.spring_layout(g, k=0.5,scale=10)
-    #     color = random_color(len(sub_graphs))
-    #     for i in range(0,len(sub_graphs)):
-    #         subgraph = sub_graphs[i]
-    #         nx.draw_networkx_nodes(g,pos, nodelist=list(subgraph),
-    #                                node_color=color[i], node_size=200, alpha=0.8)
-    #         nx.draw_networkx_edges(g,pos,width=1.0,alpha=0.5)
-    #         nx.draw_networkx_edges(g,pos, edgelist=subgraph.edges,
-    #                                width=8,alpha=0.5,edge_color=color[i])
-    #     plt.draw()
-    #     plt.show() # display
-
+        return resource_table
@@ -6,6 +6,7 @@ import csv
 import uuid
 import json
 import time
+import hashlib
 
 #Utilities used for pre-processing of event logs
 
@@ -30,6 +31,19 @@ def print_done_task():
     stdout.flush()
     stdout.write("\n")
 
+_FILE_HASHES = dict()
+
+def file_hash(path):
+    """sha1 of a file, cached while its size and mtime don't change"""
+    key = (path, os.path.getsize(path), os.path.getmtime(path))
+    if key not in _FILE_HASHES:
+        sha = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        _FILE_HASHES[key] = sha.hexdigest()
+    return _FILE_HASHES[key]
+
 #reduce list of lists with no repetitions
 def reduce_list(input, dtype='int'):
     text = str(input).replace('[', '').replace(']', '')
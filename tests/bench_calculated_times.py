@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Times add_calculated_times of the features manager and of the evaluator
+against their former case by case versions, over a synthetic log.
+
+    python tests/bench_calculated_times.py [events]
+"""
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_calculated_times import (as_log, features_manager, reference_evaluator_times,
+                                   reference_features_times, synthetic_log)
+
+
+def timed(function, log):
+    start = time.perf_counter()
+    function(log.copy())
+    return time.perf_counter() - start
+
+
+def main(events=1000000):
+    log = synthetic_log(events)
+    print('synthetic log of {} events in {} cases'.format(len(log), log.caseid.nunique()))
+    for one_timestamp in [True, False]:
+        data = as_log(log, one_timestamp)
+        label = 'one timestamp' if one_timestamp else 'two timestamps'
+        manager = features_manager(one_timestamp)
+        print('features, {}: {:.1f}s to {:.1f}s'.format(
+            label, timed(lambda x: reference_features_times(x, one_timestamp), data),
+            timed(manager.add_calculated_times, data)))
+        try:
+            from model_prediction.analyzers import sim_evaluator as sim
+        except ImportError as error:
+            print('evaluator not timed:', error)
+            continue
+        evaluator = SimpleNamespace(one_timestamp=one_timestamp)
+        print('evaluator, {}: {:.1f}s to {:.1f}s'.format(
+            label, timed(lambda x: reference_evaluator_times(x, one_timestamp), data),
+            timed(lambda x: sim.Evaluator.add_calculated_times(evaluator, x), data)))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+# the modules are imported from the root of the repository, as the
+# dashboard does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
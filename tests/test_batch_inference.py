@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from model_prediction import batch_inference as bi
+from model_prediction.next_event_samples_creator import NextEventSamplesCreator
+
+AC_INDEX = {'start': 0, 'a': 1, 'b': 2, 'c': 3, 'd': 4, 'end': 5}
+RL_INDEX = {'start': 0, 'r1': 1, 'r2': 2, 'end': 3}
+
+
+class FixtureModel():
+    """Tiny model whose outputs of a row only depend on that row"""
+
+    def __init__(self, time_features=1):
+        self.time_features = time_features
+
+    def predict(self, inputs, batch_size=None):
+        ac, rl, tm = [np.asarray(x, dtype=float) for x in inputs[:3]]
+        state = np.zeros(len(ac))
+        for t in range(ac.shape[1]):
+            state = state * 0.7 + ac[:, t] * 0.9 + rl[:, t] * 0.4 + tm[:, t, 0] * 3.0
+        ac_probs = self.softmax(np.sin(state[:, None] * np.arange(1, len(AC_INDEX) + 1)) * 3)
+        rl_probs = self.softmax(np.cos(state[:, None] * np.arange(1, len(RL_INDEX) + 1)) * 2)
+        times = np.abs(np.sin(state[:, None] + np.arange(self.time_features))) * 0.2
+        return [ac_probs, rl_probs, times]
+
+    @staticmethod
+    def softmax(x):
+        x = np.exp(x - x.max(axis=1, keepdims=True))
+        return x / x.sum(axis=1, keepdims=True)
+
+
+def fixture_log(one_timestamp=True, cases=12):
+    rng = np.random.default_rng(3)
+    rows = list()
+    for case in range(cases):
+        for num in range(1 + case % 8):
+            rows.append({'caseid': 'case{:02d}'.format(case), 'end_timestamp': num,
+                         'start_timestamp': num, 'ac_index': rng.integers(1, 5),
+                         'rl_index': rng.integers(1, 3), 'dur_norm': rng.random() * 0.2,
+                         'wait_norm': rng.random() * 0.2})
+    log = pd.DataFrame(rows)
+    if one_timestamp:
+        log = log.drop(columns=['start_timestamp', 'wait_norm'])
+    return log
+
+
+def fixture_parms(log, one_timestamp=True, prefix_num=1, seed=1):
+    parms = {'model_type': 'fixture', 'mode': 'batch', 'batch_mode': 'pre_prefix',
+             'batchprefixnum': prefix_num, 'one_timestamp': one_timestamp,
+             'dim': {'time_dim': 4}, 'multiprednum': 2, 'inference_batch_size': 16,
+             'max_trace_size': 100, 'rng': bi.CaseStreams(seed),
+             'index_ac': {v: k for k, v in AC_INDEX.items()}}
+    # caseid of every prefix, as ModelPredictor.batch_caseids
+    parms['caseid'] = np.array(log.drop(log.sort_values(['caseid']).groupby('caseid')
+                                        .head(prefix_num).index).caseid)
+    return parms
+
+
+def fixture_prefixes(log, parms):
+    sampler = NextEventSamplesCreator()
+    sampler.register_sampler('fixture', 'basic')
+    return sampler.create_samples(parms, log, AC_INDEX, RL_INDEX, list())['prefixes']
+
+
+def shards(log):
+    caseids = np.sort(log.caseid.unique())
+    return [log[log.caseid.isin(x)] for x in np.array_split(caseids, 3)]
+
+
+@pytest.mark.parametrize('imp', ['random_choice', 'multi_pred_rand'])
+def test_repetitions_draw_the_same_events_in_shards(imp):
+    log = fixture_log()
+    parms = fixture_parms(log)
+    rng = np.random.default_rng(0)
+    preds = [FixtureModel.softmax(rng.random((len(parms['caseid']), x)) * 4) for x in [6, 4]]
+    whole = bi.select_repetitions(preds, imp, 2, 3, bi.CaseStreams(5).rows(parms['caseid']))
+    start, sharded = 0, [list() for _ in range(3)]
+    for shard in shards(log):
+        rows = slice(start, start + len(fixture_parms(shard)['caseid']))
+        start = rows.stop
+        runs = bi.select_repetitions([x[rows] for x in preds], imp, 2, 3,
+                                     bi.CaseStreams(5).rows(parms['caseid'][rows]))
+        for run, selected in zip(sharded, runs):
+            run.extend(selected)
+    assert str(whole) == str(sharded)
+
+
+@pytest.mark.parametrize('imp', ['random_choice', 'multi_pred_rand'])
+@pytest.mark.parametrize('generative', [False, True])
+def test_rollout_draws_the_same_events_in_shards(imp, generative):
+    log = fixture_log()
+    parms = fixture_parms(log)
+    whole = bi.rollout(FixtureModel(), fixture_prefixes(log, parms), parms, imp, generative)
+    sharded = list()
+    for shard in shards(log):
+        shard_parms = fixture_parms(shard)
+        sharded.extend(bi.rollout(FixtureModel(), fixture_prefixes(shard, shard_parms),
+                                  shard_parms, imp, generative))
+    assert str(whole) == str(sharded)
+
+
+def reference_rollout(model, prefixes, parms, imp, generative):
+    """Rollout of one case and step at a time, as the serial predictor"""
+    multi = imp in ['multi_pred', 'multi_pred_rand']
+    nx = parms['multiprednum'] if multi else 1
+    chain_imp = 'random_choice' if imp in ['random_choice', 'multi_pred_rand'] else 'arg_max'
+    end = AC_INDEX['end']
+    sizes = prefixes.sizes()
+    starts = list(np.where(sizes == parms['batchprefixnum'] + 1)[0]) + [len(sizes)]
+    results = [None] * len(sizes)
+    for first, last in zip(starts[:-1], starts[1:]):
+        stream = parms['rng'].get(parms['caseid'][first])
+        inputs = prefixes.inputs([first])
+        preds = model.predict(inputs)
+        pos, pos1, pos_prob, pos1_prob = bi.select_next_events(preds, imp, nx, [stream])[0]
+        tm = preds[2][0]
+        results[first] = [pos, pos1, [tm[0]] * nx if multi else tm[0], pos_prob, pos1_prob]
+        if not parms['one_timestamp']:
+            results[first].append(tm[1])
+        chains = [{'ac': x, 'rl': y, 'tm': tm, 'window': [w.copy() for w in inputs]}
+                  for x, y in zip(pos if multi else [pos], pos1 if multi else [pos1])]
+        for chain in chains:
+            chain['done'] = chain['ac'] == end or sizes[first] >= parms['max_trace_size']
+        for row in range(first + 1, last):
+            live = [i for i, x in enumerate(chains) if not x['done']]
+            for chain in chains:
+                if generative:
+                    for window, value in zip(chain['window'],
+                                             [chain['ac'], chain['rl'], chain['tm']]):
+                        window[0, :-1] = window[0, 1:].copy()
+                        window[0, -1] = value
+                else:
+                    chain['window'] = prefixes.inputs([row])
+                    chain['window'][0][0, -1] = chain['ac']
+                    chain['window'][1][0, -1] = chain['rl']
+                    chain['window'][2][0, -1] = chain['tm']
+            if live:
+                preds = model.predict([np.concatenate(x) for x in
+                                       zip(*[chains[i]['window'] for i in live])])
+                selected = bi.select_next_events(preds, chain_imp, 1, [stream] * len(live))
+            for i, chain in enumerate(chains):
+                if chain['done']:
+                    chain.update({'ac': end, 'prob': 1.0, 'prob1': 1.0,
+                                  'tm': np.zeros(len(chain['tm']))})
+                else:
+                    num = live.index(i)
+                    chain['ac'], chain['rl'], chain['prob'], chain['prob1'] = selected[num]
+                    chain['tm'] = preds[2][num]
+                chain['done'] = (chain['done'] or chain['ac'] == end
+                                 or sizes[row] >= parms['max_trace_size'])
+            record = [[x[key] for x in chains] for key in ['ac', 'rl']]
+            record += [[x['tm'][0] for x in chains], [x['prob'] for x in chains],
+                       [x['prob1'] for x in chains]]
+            results[row] = record if multi else [x[0] for x in record]
+            if not parms['one_timestamp']:
+                results[row].append(chains[-1]['tm'][1])
+    return results
+
+
+def plain(values):
+    """Nested lists of python numbers"""
+    if isinstance(values, (list, tuple, np.ndarray)):
+        return [plain(x) for x in values]
+    return values.item() if isinstance(values, np.generic) else values
+
+
+@pytest.mark.parametrize('imp', ['arg_max', 'random_choice', 'multi_pred', 'multi_pred_rand'])
+@pytest.mark.parametrize('generative', [False, True])
+@pytest.mark.parametrize('one_timestamp', [True, False])
+@pytest.mark.parametrize('max_trace_size', [100, 5])
+def test_rollout_matches_case_by_case(imp, generative, one_timestamp, max_trace_size):
+    log = fixture_log(one_timestamp)
+    parms = fixture_parms(log, one_timestamp)
+    parms['max_trace_size'] = max_trace_size
+    model = FixtureModel(1 if one_timestamp else 2)
+    prefixes = fixture_prefixes(log, parms)
+    expected = reference_rollout(model, prefixes, dict(parms, rng=bi.CaseStreams(1)),
+                                 imp, generative)
+    results = bi.rollout(model, prefixes, parms, imp, generative)
+    assert plain(results) == plain(expected)
+
+
+@pytest.mark.parametrize('imp', ['arg_max', 'multi_pred', 'beam'])
+def test_ended_chains_are_not_predicted(imp):
+    log = fixture_log()
+    parms = fixture_parms(log)
+    parms['max_trace_size'] = 0
+    rows = list()
+
+    class Counter(FixtureModel):
+        def predict(self, inputs, batch_size=None):
+            rows.append(len(inputs[0]))
+            return super().predict(inputs, batch_size)
+    results = bi.rollout(Counter(), fixture_prefixes(log, parms), parms, imp)
+    # only the first prefix of every case reaches the model
+    assert sum(rows) == len(set(parms['caseid']))
+    sizes = fixture_prefixes(log, parms).sizes()
+    for result, size in zip(results, sizes):
+        if size > parms['batchprefixnum'] + 1:
+            assert plain(result[0]) in [AC_INDEX['end'], [AC_INDEX['end']] * 2]
+
+
+def test_expand_beams_keeps_the_best_joint_sequences():
+    rng = np.random.default_rng(2)
+    cases, beams, nx = 3, 2, 4
+    preds = [FixtureModel.softmax(rng.random((cases * beams, x)) * 3) for x in [5, 3]]
+    scores = np.log(rng.random((cases, beams)))
+    parent, kept, pos, pos1 = bi.expand_beams(preds, scores, nx)
+    for case in range(cases):
+        candidates = sorted(
+            ((scores[case, b] + np.log(preds[0][case * beams + b][a])
+              + np.log(preds[1][case * beams + b][r]), b, a, r)
+             for b in range(beams) for a in range(5) for r in range(3)),
+            key=lambda x: -x[0])[:nx]
+        np.testing.assert_allclose(kept[case], [x[0] for x in candidates])
+        assert list(zip(parent[case], pos[case], pos1[case])) == [x[1:] for x in candidates]
+
+
+def test_repetitions_of_deterministic_variants_are_equal():
+    rng = np.random.default_rng(0)
+    preds = [FixtureModel.softmax(rng.random((10, x))) for x in [6, 4]]
+    runs = bi.select_repetitions(preds, 'arg_max', 1, 3)
+    assert len(runs) == 3 and runs[0] == runs[1] == runs[2]
+    assert [x[0] for x in runs[0]] == list(preds[0].argmax(axis=1))
+
+
+def test_repetitions_of_random_variants_follow_the_probabilities():
+    probs = np.array([[0.7, 0.2, 0.1]] * 2000)
+    runs = bi.select_repetitions([probs, probs], 'random_choice', 1, 2,
+                                 bi.CaseStreams(0).rows(np.arange(2000) % 50))
+    assert runs[0] != runs[1]
+    drawn = np.bincount([x[0] for run in runs for x in run], minlength=3) / 4000
+    np.testing.assert_allclose(drawn, [0.7, 0.2, 0.1], atol=0.03)
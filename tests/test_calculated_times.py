@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import itertools
+from operator import itemgetter
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from support_modules import features_manager as feat
+
+
+def reference_features_times(log, one_timestamp):
+    """FeaturesMannager.add_calculated_times as it was, case by case"""
+    log['dur'] = 0
+    log['acc_cycle'] = 0
+    log['daytime'] = 0
+    log = log.to_dict('records')
+    log = sorted(log, key=lambda x: x['caseid'])
+    for _, group in itertools.groupby(log, key=lambda x: x['caseid']):
+        events = list(group)
+        ordk = 'end_timestamp' if one_timestamp else 'start_timestamp'
+        events = sorted(events, key=itemgetter(ordk))
+        for i in range(0, len(events)):
+            if one_timestamp:
+                if i == 0:
+                    dur = 0
+                    acc = 0
+                else:
+                    dur = (events[i]['end_timestamp'] -
+                           events[i-1]['end_timestamp']).total_seconds()
+                    acc = (events[i]['end_timestamp'] -
+                           events[0]['end_timestamp']).total_seconds()
+            else:
+                dur = (events[i]['end_timestamp'] -
+                       events[i]['start_timestamp']).total_seconds()
+                acc = (events[i]['end_timestamp'] -
+                       events[0]['start_timestamp']).total_seconds()
+                if i == 0:
+                    wit = 0
+                else:
+                    wit = (events[i]['start_timestamp'] -
+                           events[i-1]['end_timestamp']).total_seconds()
+                events[i]['wait'] = wit if wit >= 0 else 0
+            events[i]['dur'] = dur
+            events[i]['acc_cycle'] = acc
+            time = events[i][ordk].time()
+            time = time.second + time.minute*60 + time.hour*3600
+            events[i]['daytime'] = time
+            events[i]['weekday'] = events[i]['end_timestamp'].weekday()
+    return pd.DataFrame.from_dict(log)
+
+
+def reference_evaluator_times(log, one_timestamp):
+    """Evaluator.add_calculated_times as it was, case by case"""
+    log['dur'] = 0
+    log = log.to_dict('records')
+    log = sorted(log, key=lambda x: x['caseid'])
+    for _, group in itertools.groupby(log, key=lambda x: x['caseid']):
+        events = list(group)
+        ordk = 'end_timestamp' if one_timestamp else 'start_timestamp'
+        events = sorted(events, key=itemgetter(ordk))
+        for i in range(0, len(events)):
+            if one_timestamp:
+                if i == 0:
+                    dur = 0
+                else:
+                    dur = (events[i]['end_timestamp'] -
+                           events[i-1]['end_timestamp']).total_seconds()
+            else:
+                dur = (events[i]['end_timestamp'] -
+                       events[i]['start_timestamp']).total_seconds()
+                if i == 0:
+                    wit = 0
+                else:
+                    wit = (events[i]['start_timestamp'] -
+                           events[i-1]['end_timestamp']).total_seconds()
+                events[i]['wait'] = wit
+            events[i]['dur'] = dur
+    return pd.DataFrame.from_dict(log)
+
+
+def synthetic_log(events, seed=0, single=0.2, ties=0.3):
+    """Interleaved cases, some of a single event, with tied and
+    overlapping timestamps and fractional seconds"""
+    rng = np.random.default_rng(seed)
+    cases = max(events // 2, 1)
+    sizes = np.where(rng.random(cases) < single, 1, rng.integers(2, 8, cases))
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), events) + 1]
+    sizes[-1] -= sizes.sum() - events
+    caseids = np.repeat(['c{}'.format(x) for x in range(len(sizes))], sizes)
+    gaps = pd.to_timedelta(rng.integers(0, 600, len(caseids)), unit='m')
+    # ties within the cases repeat the previous timestamp
+    gaps = gaps.where(rng.random(len(caseids)) >= ties, pd.Timedelta(0))
+    offsets = pd.Series(gaps).groupby(caseids).cumsum().values
+    base = pd.Timestamp('2021-03-01') + pd.to_timedelta(rng.integers(0, 60 * 24 * 90, len(sizes)),
+                                                        unit='m')
+    start = np.repeat(base.values, sizes) + offsets
+    start += pd.to_timedelta(rng.integers(0, 10**6, len(caseids)) * (rng.random(len(caseids)) < 0.5),
+                             unit='us').values
+    # durations longer than the gaps make the events overlap
+    end = start + pd.to_timedelta(rng.integers(0, 900, len(caseids)), unit='m').values
+    log = pd.DataFrame({'caseid': caseids, 'task': rng.choice(list('ABCDE'), len(caseids)),
+                        'user': rng.choice(list('xyz'), len(caseids)),
+                        'start_timestamp': start, 'end_timestamp': end})
+    return log.iloc[rng.permutation(len(log))].reset_index(drop=True)
+
+
+def features_manager(one_timestamp):
+    return feat.FeaturesMannager({'rp_sim': 0.85, 'model_type': 'concatenated_inter',
+                                  'one_timestamp': one_timestamp, 'norm_method': 'max',
+                                  'file_name': 'test_log.csv', 'activity': 'predict_next'})
+
+
+def as_log(log, one_timestamp):
+    return log.drop(columns='start_timestamp') if one_timestamp else log
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('one_timestamp', [True, False])
+def test_features_times_match_reference(one_timestamp, seed):
+    log = as_log(synthetic_log(500, seed), one_timestamp)
+    expected = reference_features_times(log.copy(), one_timestamp)
+    result = features_manager(one_timestamp).add_calculated_times(log.copy())
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('one_timestamp', [True, False])
+def test_features_times_of_single_events_and_ties(one_timestamp):
+    log = pd.DataFrame({'caseid': ['b', 'a', 'b', 'b', 'c', 'a'],
+                        'task': list('PQRSTU'),
+                        'start_timestamp': pd.to_datetime(['2021-01-01 10:00', '2021-01-01 09:00',
+                                                           '2021-01-01 10:00', '2021-01-01 09:30',
+                                                           '2021-01-02 00:00', '2021-01-01 09:00']),
+                        'end_timestamp': pd.to_datetime(['2021-01-01 10:05', '2021-01-01 09:10',
+                                                         '2021-01-01 10:05', '2021-01-01 09:45',
+                                                         '2021-01-02 00:00', '2021-01-01 09:20'])})
+    log = as_log(log, one_timestamp)
+    expected = reference_features_times(log.copy(), one_timestamp)
+    result = features_manager(one_timestamp).add_calculated_times(log.copy())
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('one_timestamp', [True, False])
+def test_evaluator_times_match_reference(one_timestamp, seed):
+    pytest.importorskip('swifter')
+    pytest.importorskip('jellyfish')
+    from model_prediction.analyzers import sim_evaluator as sim
+    log = as_log(synthetic_log(500, seed), one_timestamp)
+    expected = reference_evaluator_times(log.copy(), one_timestamp)
+    evaluator = SimpleNamespace(one_timestamp=one_timestamp)
+    result = sim.Evaluator.add_calculated_times(evaluator, log.copy())
+    pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from support_modules import features_manager as feat
+
+
+def manager(folder=None):
+    return feat.FeaturesMannager({'rp_sim': 0.85, 'model_type': 'concatenated_inter',
+                                  'one_timestamp': True, 'norm_method': 'max',
+                                  'file_name': 'test_log.csv', 'activity': 'predict_next',
+                                  'folder': folder})
+
+
+def scale(manager, values):
+    log = pd.DataFrame({'dur': np.arange(len(values), dtype=float), 'Diagnose': values})
+    log, _ = manager._scale_inter(log, ['Diagnose_ord'])
+    return log
+
+
+def test_ordinal_features_keep_their_scale_across_logs():
+    fitted = manager()
+    first = scale(fitted, ['b', 'a', 'c', None])
+    np.testing.assert_allclose(first.Diagnose_ord_norm, [2/3, 1/3, 1, 0])
+    # a later log with less categories and an unseen one
+    later = scale(fitted, ['b', 'd', 'b'])
+    np.testing.assert_allclose(later.Diagnose_ord_norm, [2/3, 0, 2/3])
+
+
+def test_encoders_are_fitted_on_the_whole_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = os.path.join('output_files', 'model', 'parameters', 'encoders.json')
+    log = pd.DataFrame({'caseid': [1, 1, 2, 3], 'Diagnose': ['b', 'a', 'c', 'a']})
+    first = manager('model')
+    first.fit_encoders(log, ['Diagnose_ord', 'open_cases'])
+    # a single case view gets the codes of the whole log
+    np.testing.assert_allclose(scale(first, ['c']).Diagnose_ord_norm, [1])
+    with open(path) as file:
+        assert json.load(file) == {'Diagnose': ['a', 'b', 'c']}
+    # the stored categories are kept by the next managers
+    later = manager('model')
+    later.fit_encoders(log[log.caseid == 1], ['Diagnose_ord'])
+    np.testing.assert_allclose(scale(later, ['b', 'a']).Diagnose_ord_norm, [2/3, 1/3])
+
+
+def test_views_do_not_store_encoders(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scale(manager('model'), ['b'])
+    assert not os.path.exists(os.path.join('output_files', 'model', 'parameters',
+                                           'encoders.json'))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from model_prediction import inference_server as isv
+from model_prediction.numpy_model import load_numpy_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FOLDER = '20210926_42671FEF_0DDC_4E55_82C8_0653FEC85037'
+MODEL_FILE = 'model_concatenated_inter_55-1.50.h5'
+
+
+def test_message_round_trip():
+    arrays = [np.arange(6, dtype=np.float32).reshape(2, 3), np.zeros((0, 4))]
+    data = isv.encode_message({'op': 'predict', 'arrays': arrays})
+    size = isv.header_size(data[:isv.HEADER.size])
+    header, shapes = isv.decode_header(data[isv.HEADER.size:isv.HEADER.size + size])
+    assert header == {'op': 'predict'}
+    assert shapes == [[2, 3], [0, 4]]
+    assert len(data) == isv.HEADER.size + size + sum(isv.array_size(x) for x in shapes)
+
+
+@pytest.mark.parametrize('header', [b'[]', b'{"op": "stats"}', b'{"shapes": [[-1]]}',
+                                    b'{"shapes": [["2"]]}'])
+def test_rejects_malformed_headers(header):
+    with pytest.raises(ValueError):
+        isv.decode_header(header)
+
+
+def test_only_binds_loopback_addresses():
+    isv.check_loopback('127.0.0.1', 8765)
+    isv.check_loopback('localhost', 8765)
+    for host in ['0.0.0.0', '']:
+        with pytest.raises(ValueError):
+            isv.check_loopback(host, 8765)
+
+
+def test_rejects_oversized_requests():
+    isv.check_limits([[10, 5], [10, 5, 2]], 10, 600)
+    with pytest.raises(ValueError):
+        isv.check_limits([[11, 5]], 10, 1 << 20)
+    with pytest.raises(ValueError):
+        isv.check_limits([[10, 5], [10, 5, 2]], 10, 599)
+
+
+def test_only_serves_models_of_output_files(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    assert isv.resolve_model([FOLDER, MODEL_FILE]) == (FOLDER, MODEL_FILE)
+    for model in [[FOLDER, 'missing.h5'], [FOLDER, 'parameters/model_parameters.json'],
+                  ['..', os.path.join('output_files', FOLDER, MODEL_FILE)],
+                  [ROOT, MODEL_FILE], [FOLDER, MODEL_FILE, 'keras'], (FOLDER, MODEL_FILE),
+                  None]:
+        with pytest.raises(ValueError):
+            isv.resolve_model(model)
+
+
+def test_batcher_survives_cancelled_requests():
+    class Model():
+        def predict(self, inputs, batch_size=None):
+            return [inputs[0] * 2]
+
+    async def scenario():
+        batcher = isv.MicroBatcher(Model(), 1024, 0.01, {'batches': 0, 'batched_rows': 0,
+                                                         'max_batch_size': 0})
+        task = asyncio.get_running_loop().create_task(batcher.run())
+        # a request whose client went away before its batch was flushed
+        abandoned = asyncio.get_running_loop().create_task(
+            batcher.predict([np.ones((1, 2), dtype=np.float32)]))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        outputs = await asyncio.wait_for(
+            batcher.predict([np.full((1, 2), 3, dtype=np.float32)]), 1)
+        task.cancel()
+        return outputs
+    outputs = asyncio.run(scenario())
+    np.testing.assert_array_equal(outputs[0], [[6, 6]])
+
+
+def test_client_predicts_through_server(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    address = str(tmp_path / 'inference.sock')
+    server = isv.InferenceServer(max_delay=0.001)
+    threading.Thread(target=server.serve, args=(address,), daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(address):
+            break
+        time.sleep(0.05)
+    client = isv.InferenceClient(address, FOLDER, MODEL_FILE)
+    model = load_numpy_model(os.path.join('output_files', FOLDER, MODEL_FILE))
+    assert client.input_shape == model.input_shape
+    rng = np.random.default_rng(0)
+    inputs = [rng.integers(0, 9, (5, 10)), rng.integers(0, 9, (5, 10)),
+              rng.random((5, 10, 1)), rng.random((5, 10, 2))]
+    for received, expected in zip(client.predict(inputs), model.predict(inputs)):
+        np.testing.assert_allclose(received, expected, rtol=1e-6)
+    assert client.stats()['requests'] == 1
+    # unknown models are answered with an error, oversized requests
+    # are dropped before their buffers are read
+    with pytest.raises(RuntimeError):
+        isv.InferenceClient(address, '..', MODEL_FILE).input_shape
+    server.max_rows = 4
+    with pytest.raises(ConnectionError):
+        isv.InferenceClient(address, FOLDER, MODEL_FILE).predict(inputs)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import os
+import gzip
+import json
+import shutil
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from support_modules.readers import log_reader as lr
+from support_modules import role_discovery as rl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARAMETERS = os.path.join(ROOT, 'output_files', '20210926_42671FEF_0DDC_4E55_82C8_0653FEC85037',
+                          'parameters')
+
+
+def read_options():
+    with open(os.path.join(PARAMETERS, 'model_parameters.json')) as file:
+        return json.load(file)['read_options']
+
+
+@pytest.fixture(scope='module')
+def events():
+    return pd.read_csv(os.path.join(PARAMETERS, 'test_log.csv'))
+
+
+@pytest.fixture(scope='module')
+def sorted_log(events, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('logs') / 'sorted.csv')
+    events.sort_values('caseid', kind='mergesort').to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def marked_log(events, tmp_path_factory):
+    """Traces interleaved at random, each closed by an End event"""
+    rng = np.random.default_rng(0)
+    traces = [x for _, x in events.groupby('caseid', sort=False)]
+    next_event = [0] * len(traces)
+    rows, open_traces = list(), list(range(len(traces)))
+    while open_traces:
+        i = open_traces[rng.integers(len(open_traces))]
+        if next_event[i] < len(traces[i]):
+            rows.append(traces[i].iloc[next_event[i]])
+            next_event[i] += 1
+        else:
+            end = traces[i].iloc[-1].copy()
+            end['task'] = 'End'
+            rows.append(end)
+            open_traces.remove(i)
+    path = str(tmp_path_factory.mktemp('logs') / 'marked.csv')
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def one_shot_traces(path):
+    log = lr.LogReader(path, read_options()).get_dataframe()
+    return {c: x.reset_index(drop=True) for c, x in log.groupby('caseid', sort=False)}
+
+
+@pytest.mark.parametrize('chunksize', [7, 1000, 100000])
+@pytest.mark.parametrize('log, end_marker', [('sorted_log', False), ('marked_log', True)])
+def test_chunked_traces_match_one_shot(log, end_marker, chunksize, request):
+    path = request.getfixturevalue(log)
+    expected = one_shot_traces(path)
+    reader = lr.ChunkedLogReader(path, read_options(), chunksize, end_marker)
+    traces = list(reader)
+    assert len(traces) == len(expected)
+    for trace in traces:
+        pd.testing.assert_frame_equal(trace.reset_index(drop=True),
+                                      expected[trace.caseid.iloc[0]], check_dtype=False)
+
+
+def test_batches_hold_complete_traces(sorted_log):
+    expected = one_shot_traces(sorted_log)
+    reader = lr.ChunkedLogReader(sorted_log, read_options(), 100)
+    batches = list(reader.iter_batches(500))
+    assert len(batches) > 1
+    assert sum(len(x) for x in batches) == sum(len(x) for x in expected.values())
+    caseids = [set(x.caseid) for x in batches]
+    assert sum(len(x) for x in caseids) == len(set().union(*caseids))
+
+
+def test_unsorted_log_raises(events, tmp_path):
+    path = str(tmp_path / 'unsorted.csv')
+    events.to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        list(lr.ChunkedLogReader(path, read_options(), 100))
+
+
+def test_resource_pool_from_chunks(sorted_log):
+    chunked = rl.ResourcePoolAnalyser(lr.ChunkedLogReader(sorted_log, read_options(), 100))
+    one_shot = rl.ResourcePoolAnalyser(lr.LogReader(sorted_log, read_options()))
+    assert chunked.roles == one_shot.roles
+
+
+def test_unwritable_cache_folder_is_skipped(sorted_log, tmp_path):
+    path = str(tmp_path / 'sorted.csv')
+    pd.read_csv(sorted_log).to_csv(path, index=False)
+    # a file in place of the cache folder fails the write even as root
+    (tmp_path / 'parsed_logs').write_text('')
+    log = lr.LogReader(path, read_options()).get_dataframe()
+    pd.testing.assert_frame_equal(log, lr.LogReader(sorted_log, read_options()).get_dataframe())
+    assert (tmp_path / 'parsed_logs').is_file()
+
+
+XES_EVENTS = [('c1', 'Register', 'Ann', '2021-03-01T08:00:00.000+01:00', '2021-03-01T08:30:00.000+01:00', 3),
+              ('c1', 'Check', 'Bob', '2021-03-01T09:00:00.000+01:00', '2021-03-01T11:15:30.500+01:00', 1),
+              ('c1', 'Check', None, '2021-03-01T12:00:00.000+01:00', '2021-03-01T12:10:00.000+01:00', 2),
+              ('c2', 'Register', 'Ann', '2021-03-28T00:30:00.000Z', '2021-03-28T03:45:00.000+02:00', 5),
+              ('c2', 'Pay', 'Cid', '2021-03-28T04:00:00.000+02:00', '2021-03-28T05:00:00.000+02:00', 4)]
+
+
+def xes_settings(one_timestamp):
+    return {'timeformat': '%Y-%m-%dT%H:%M:%S.%f',
+            'column_names': {'Case ID': 'caseid', 'Activity': 'task', 'Resource': 'user'},
+            'one_timestamp': one_timestamp, 'ns_include': True, 'filter_d_attrib': False}
+
+
+def write_xes(path):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<log xmlns="http://www.xes-standard.org/">']
+    for caseid in dict.fromkeys(x[0] for x in XES_EVENTS):
+        lines += ['<trace>', '<string key="concept:name" value="{}"/>'.format(caseid)]
+        for _, task, user, start, end, amount in [x for x in XES_EVENTS if x[0] == caseid]:
+            for transition, time in [('start', start), ('complete', end)]:
+                lines.append('<event>')
+                lines.append('<string key="concept:name" value="{}"/>'.format(task))
+                if user is not None:
+                    lines.append('<string key="org:resource" value="{}"/>'.format(user))
+                lines.append('<string key="lifecycle:transition" value="{}"/>'.format(transition))
+                lines.append('<date key="time:timestamp" value="{}"/>'.format(time))
+                if transition == 'complete':
+                    lines.append('<int key="amount" value="{}"/>'.format(amount))
+                lines.append('</event>')
+        lines.append('</trace>')
+    lines.append('</log>')
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines))
+
+
+def write_csv(path):
+    # the same events with their times in UTC
+    utc = lambda x: pd.Timestamp(x).tz_convert(None).strftime('%Y-%m-%dT%H:%M:%S.%f')
+    pd.DataFrame([{'Case ID': c, 'Activity': t, 'Resource': u, 'Start Timestamp': utc(s),
+                   'Complete Timestamp': utc(e), 'amount': a}
+                  for c, t, u, s, e, a in XES_EVENTS]).to_csv(path, index=False)
+
+
+@pytest.mark.parametrize('one_timestamp', [True, False])
+def test_xes_frame_matches_csv(one_timestamp, tmp_path):
+    write_xes(str(tmp_path / 'log.xes'))
+    write_csv(str(tmp_path / 'log.csv'))
+    # the readers add the timestamp columns to their column names
+    xes = lr.LogReader(str(tmp_path / 'log.xes'), xes_settings(one_timestamp))
+    csv = lr.LogReader(str(tmp_path / 'log.csv'), xes_settings(one_timestamp))
+    expected = csv.get_dataframe()
+    if one_timestamp:
+        expected = expected.drop(columns='Start Timestamp')
+    log = xes.get_dataframe()[list(expected.columns)]
+    pd.testing.assert_frame_equal(log, expected)
+    assert log.end_timestamp.dt.tz is None
+
+
+def compressed_copies(path, folder):
+    """gz and zip copies of a log, the zip holding it under another name"""
+    name = os.path.basename(path)
+    with open(path, 'rb') as source, gzip.open(os.path.join(folder, name + '.gz'), 'wb') as target:
+        shutil.copyfileobj(source, target)
+    with zipfile.ZipFile(os.path.join(folder, name + '.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(path, name)
+    with zipfile.ZipFile(os.path.join(folder, 'archive.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(path, 'logs/' + name)
+        archive.writestr('README.txt', 'not a log')
+    return [os.path.join(folder, x) for x in [name + '.gz', name + '.zip', 'archive.zip']]
+
+
+def test_compressed_csv_matches_plain(sorted_log, tmp_path):
+    expected = lr.LogReader(sorted_log, read_options()).get_dataframe()
+    for path in compressed_copies(sorted_log, str(tmp_path)):
+        log = lr.LogReader(path, read_options()).get_dataframe()
+        pd.testing.assert_frame_equal(log, expected)
+
+
+def test_compressed_chunks_match_plain(sorted_log, tmp_path):
+    expected = one_shot_traces(sorted_log)
+    for path in compressed_copies(sorted_log, str(tmp_path)):
+        traces = list(lr.ChunkedLogReader(path, read_options(), 100))
+        assert len(traces) == len(expected)
+        for trace in traces:
+            pd.testing.assert_frame_equal(trace.reset_index(drop=True),
+                                          expected[trace.caseid.iloc[0]], check_dtype=False)
+
+
+def test_compressed_xes_matches_plain(tmp_path):
+    path = str(tmp_path / 'log.xes')
+    write_xes(path)
+    expected = lr.LogReader(path, xes_settings(False)).get_dataframe()
+    for compressed in compressed_copies(path, str(tmp_path)):
+        log = lr.LogReader(compressed, xes_settings(False)).get_dataframe()
+        pd.testing.assert_frame_equal(log, expected)
+
+
+def test_zip_without_a_single_log_raises(sorted_log, tmp_path):
+    path = str(tmp_path / 'logs.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.write(sorted_log, 'first.csv')
+        archive.write(sorted_log, 'second.csv')
+    with pytest.raises(IOError):
+        lr.LogReader(path, read_options())
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+import pandas as pd
+import pytest
+
+from support_modules.readers import log_store as ls
+
+
+@pytest.fixture
+def stored():
+    log = pd.DataFrame({'caseid': [1, 1, 2], 'task': ['a', 'b', 'a']})
+    return ls.StoredLog(log, dict(), max_derived=2)
+
+
+def test_concurrent_callers_calculate_once(stored):
+    calls = list()
+
+    def calculate():
+        calls.append(1)
+        time.sleep(0.05)
+        return len(calls)
+    results = list()
+    threads = [threading.Thread(target=lambda: results.append(stored.derived('a', calculate)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [1] * 8
+
+
+def test_other_keys_are_not_blocked(stored):
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'slow'
+    thread = threading.Thread(target=stored.derived, args=('slow', slow))
+    thread.start()
+    started.wait(5)
+    assert stored.derived('fast', lambda: 'fast') == 'fast'
+    release.set()
+    thread.join()
+
+
+def test_least_recently_used_keys_are_evicted(stored):
+    calls = list()
+
+    def calculate(key):
+        calls.append(key)
+        return key
+    for key in ['a', 'b', 'a', 'c', 'a', 'b']:
+        stored.derived(key, lambda: calculate(key))
+    assert calls == ['a', 'b', 'c', 'b']
+
+
+def test_failures_are_not_kept(stored):
+    def fail():
+        raise ValueError('a')
+    with pytest.raises(ValueError):
+        stored.derived('a', fail)
+    assert stored.derived('a', lambda: 1) == 1
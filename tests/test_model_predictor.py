@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('streamlit')
+pytest.importorskip('st_aggrid')
+from model_prediction import model_predictor as pr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Predictor(pr.ModelPredictor):
+    """Predictor without the dashboard and the evaluation"""
+
+    def execute_predictive_task(self):
+        self.calculate_features()
+        if self.parms['workers'] > 1:
+            self.predict_parallel()
+        else:
+            self.predict_log()
+
+
+def parameters(**kwargs):
+    parms = {'folder': '20210926_42671FEF_0DDC_4E55_82C8_0653FEC85037',
+             'model_file': 'model_concatenated_inter_55-1.50.h5',
+             'activity': 'predict_next', 'mode': 'batch', 'one_timestamp': True,
+             'read_options': {'timeformat': '%Y-%m-%dT%H:%M:%S.%f',
+                              'column_names': {'Case ID': 'caseid', 'Activity': 'task',
+                                               'lifecycle:transition': 'event_type',
+                                               'Resource': 'user'},
+                              'one_timestamp': True, 'ns_include': True},
+             'batchlogrange': (1, 60), 'batch_mode': 'pre_prefix', 'batchprefixnum': 1,
+             'multiprednum': 3, 'rep': 2, 'seed': 7, 'inference_batch_size': 1024,
+             'inference_server': None, 'inference_engine': 'numpy',
+             'prediction_table': False, 'sample_cache': False,
+             'sample_cache_size': 2 ** 30, 'stream_batch_size': None,
+             'role_discovery': 'full', 'is_single_exec': True, 'next_mode': '',
+             'predchoice': ''}
+    parms.update(kwargs)
+    return parms
+
+
+@pytest.mark.parametrize('choice, variant', [('SME', 'multi_pred_rand'),
+                                             ('Prediction', 'random_choice'),
+                                             ('Generative', 'multi_pred_rand')])
+def test_workers_predict_the_same_events(monkeypatch, choice, variant):
+    monkeypatch.chdir(ROOT)
+    single, sharded = [Predictor(parameters(batchpredchoice=choice, variant=variant,
+                                            workers=x)).predictions for x in [1, 3]]
+    assert len(single) == len(sharded)
+    for column in ['caseid', 'run_num', 'ac_pred', 'rl_pred']:
+        assert single[column].tolist() == sharded[column].tolist()
+    # the float32 outputs change in the last bits with the batch size
+    np.testing.assert_allclose(np.hstack(single.tm_pred), np.hstack(sharded.tm_pred), atol=1)
+    np.testing.assert_allclose(np.hstack(single.ac_prob), np.hstack(sharded.ac_prob), rtol=1e-4)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from model_prediction import model_registry as mr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FOLDER = '20210926_42671FEF_0DDC_4E55_82C8_0653FEC85037'
+MODEL_FILE = 'model_concatenated_inter_55-1.50.h5'
+
+
+def test_failed_loads_are_not_kept(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    registry = mr.ModelRegistry()
+
+    def fail(*args):
+        raise OSError('a')
+    monkeypatch.setattr(registry, '_load', fail)
+    with pytest.raises(OSError):
+        registry.get(FOLDER, MODEL_FILE)
+    assert registry._loading == dict()
+    monkeypatch.undo()
+    monkeypatch.chdir(ROOT)
+    entry = registry.get(FOLDER, MODEL_FILE)
+    assert registry.get(FOLDER, MODEL_FILE) is entry
+    assert registry._loading == dict()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from model_prediction.next_event_samples_creator import NextEventSamplesCreator
+
+
+def reference_index(inputs):
+    """Deduplication of the windows one row at a time"""
+    index, unique = dict(), list()
+    inverse = np.zeros(len(inputs[0]), dtype=int)
+    for i in range(len(inputs[0])):
+        key = b''.join(x[i].tobytes() for x in inputs)
+        if key not in index:
+            index[key] = len(unique)
+            unique.append(i)
+        inverse[i] = index[key]
+    return unique, inverse
+
+
+@pytest.mark.parametrize('num', [0, 1, 500])
+def test_index_windows_matches_row_by_row(num):
+    rng = np.random.default_rng(0)
+    inputs = [rng.integers(0, 3, (num, 5)), rng.integers(0, 2, (num, 5)),
+              rng.integers(0, 2, (num, 5, 1)).astype(np.float32), rng.random((num, 5, 2)).round()]
+    windows = NextEventSamplesCreator.index_windows(inputs)
+    unique, inverse = reference_index(inputs)
+    np.testing.assert_array_equal(windows['inverse'], inverse)
+    for received, expected in zip(windows['inputs'], inputs):
+        np.testing.assert_array_equal(received, expected[unique])
+    assert windows['stats']['unique_windows'] == len(unique)
+
+
+@pytest.mark.parametrize('batch_size', [1, 5, 12, 1000])
+def test_case_groups_hold_whole_cases_up_to_the_batch_size(batch_size):
+    sizes = [3, 1, 7, 4, 4, 12, 2, 5]
+    log = pd.DataFrame({'caseid': np.repeat(np.arange(len(sizes))[::-1], sizes),
+                        'task': np.arange(sum(sizes))})
+    groups = list(NextEventSamplesCreator.case_groups(log, batch_size))
+    assert sum(len(x) for x in groups) == len(log)
+    caseids = [set(x.caseid) for x in groups]
+    assert sum(len(x) for x in caseids) == len(sizes)
+    for group in groups:
+        assert len(group) <= batch_size or group.caseid.nunique() == 1
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Parity of the numpy engine with keras on prefixes of test_log.csv.
+
+data/numpy_model_reference.npz holds 400 unique prefix windows of the
+test log, as built by TablePredictor, and the outputs of tf.keras
+predicting them one row per call.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from model_prediction.numpy_model import load_numpy_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = os.path.join(ROOT, 'output_files', '20210926_42671FEF_0DDC_4E55_82C8_0653FEC85037',
+                     'model_concatenated_inter_55-1.50.h5')
+REFERENCE = os.path.join(ROOT, 'tests', 'data', 'numpy_model_reference.npz')
+
+
+@pytest.fixture(scope='module')
+def reference():
+    data = np.load(REFERENCE)
+    inputs = [data['input_{}'.format(i)] for i in range(4)]
+    outputs = [data['output_{}'.format(i)] for i in range(3)]
+    return inputs, outputs
+
+
+def assert_parity(outputs, expected):
+    ac_probs, rl_probs, times = outputs
+    np.testing.assert_allclose(ac_probs, expected[0], rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(rl_probs, expected[1], rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(times, expected[2], rtol=1e-4, atol=1e-7)
+    np.testing.assert_array_equal(ac_probs.argmax(axis=1), expected[0].argmax(axis=1))
+    np.testing.assert_array_equal(rl_probs.argmax(axis=1), expected[1].argmax(axis=1))
+
+
+@pytest.mark.parametrize('batch_size', [None, 1, 64])
+def test_matches_keras_reference(reference, batch_size):
+    inputs, expected = reference
+    model = load_numpy_model(MODEL)
+    assert_parity(model.predict(inputs, batch_size=batch_size), expected)
+
+
+def test_matches_live_keras(reference):
+    # Keras 3 doesn't read the .h5 files of Keras 2, newer tensorflow
+    # versions load them through tf_keras
+    os.environ.setdefault('TF_USE_LEGACY_KERAS', '1')
+    keras = pytest.importorskip('tensorflow.keras')
+    inputs, _ = reference
+    model = keras.models.load_model(MODEL)
+    expected = model.predict(inputs, batch_size=len(inputs[0]), verbose=0)
+    assert_parity(load_numpy_model(MODEL).predict(inputs), expected)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+from model_prediction import prediction_table as pt
+
+FOLDER = 'model'
+MODEL_FILE = 'model.h5'
+
+
+class Model():
+    """Model whose outputs of a row only depend on that row"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, inputs, batch_size=None):
+        self.calls += 1
+        state = sum(np.asarray(x, dtype=np.float32).reshape((len(x), int(np.prod(np.shape(x)[1:]))))
+                    .sum(axis=1) for x in inputs)
+        return [np.stack([np.sin(state), np.cos(state)], axis=1).astype(np.float32),
+                np.stack([state, -state, 2 * state], axis=1).astype(np.float32),
+                np.abs(np.sin(state))[:, None].astype(np.float32)]
+
+
+def windows(num, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 5, (num, 4)), rng.integers(0, 3, (num, 4)),
+            rng.random((num, 4, 1))]
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.join('output_files', FOLDER, 'parameters'))
+    with open(os.path.join('output_files', FOLDER, MODEL_FILE), 'wb') as file:
+        file.write(b'weights')
+    pt._TABLES.clear()
+    return tmp_path
+
+
+def build(inputs):
+    assert pt.save_table(FOLDER, MODEL_FILE, inputs, Model().predict(inputs))
+    return pt.PredictionTable.load(FOLDER, MODEL_FILE)
+
+
+def assert_same(outputs, expected):
+    for output, value in zip(outputs, expected):
+        np.testing.assert_array_equal(output, value)
+
+
+def test_hits_and_misses_match_the_model(folder):
+    stored, new = windows(50), windows(20, seed=1)
+    inputs = [np.concatenate([x[::2], y]) for x, y in zip(stored, new)]
+    model = pt.TableModel(Model(), build(stored))
+    assert_same(model.predict(inputs), Model().predict(inputs))
+    assert (model.hits, model.misses) == (25, 20)
+
+
+def test_empty_table_calls_the_model(folder):
+    table = build(windows(0))
+    assert len(table) == 0
+    model = pt.TableModel(Model(), table)
+    inputs = windows(10)
+    assert_same(model.predict(inputs), Model().predict(inputs))
+    assert (model.hits, model.misses) == (0, 10)
+
+
+def test_stale_tables_are_ignored(folder):
+    build(windows(10))
+    with open(os.path.join('output_files', FOLDER, MODEL_FILE), 'wb') as file:
+        file.write(b'retrained weights')
+    assert pt.PredictionTable.load(FOLDER, MODEL_FILE) is None
+
+
+def test_digest_collisions_are_misses(folder, monkeypatch):
+    stored = windows(30)
+    table = build(stored)
+    # every window collides with every other one
+    monkeypatch.setattr(pt, 'window_digests', lambda inputs: np.zeros(len(inputs[0]), dtype=np.uint64))
+    table = pt.PredictionTable({'ac_probs': table.outputs[0], 'rl_probs': table.outputs[1],
+                                'times': table.outputs[2], 'windows': table.windows,
+                                'digests': np.zeros(30, dtype=np.uint64)})
+    model = pt.TableModel(Model(), table)
+    inputs = windows(30, seed=1)
+    assert_same(model.predict(inputs), Model().predict(inputs))
+    assert model.hits == 0
+
+
+def test_unwritable_folders_are_skipped(folder):
+    # a folder that can't hold the table, as a read only deployment
+    parameters = os.path.join('output_files', FOLDER, 'parameters')
+    os.rmdir(parameters)
+    with open(parameters, 'w') as file:
+        file.write('')
+    inputs = windows(5)
+    assert not pt.save_table(FOLDER, MODEL_FILE, inputs, Model().predict(inputs))
+    assert pt.PredictionTable.load(FOLDER, MODEL_FILE) is None
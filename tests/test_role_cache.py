@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+
+import pandas as pd
+import pytest
+
+from support_modules import role_cache as rc
+from support_modules import role_discovery as rl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARAMETERS = os.path.join(ROOT, 'output_files', '20210926_42671FEF_0DDC_4E55_82C8_0653FEC85037',
+                          'parameters')
+FOLDER = 'model'
+NEW_USERS = ['K', 'U', 'J', 'V', 'T']
+
+
+@pytest.fixture(scope='module')
+def events():
+    return pd.read_csv(os.path.join(PARAMETERS, 'test_log.csv'))[['caseid', 'task', 'user']]
+
+
+@pytest.fixture
+def output_files(tmp_path, monkeypatch):
+    # the cache is written under output_files of the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / 'output_files' / FOLDER / 'parameters' / 'roles'
+
+
+def entries(output_files):
+    return sorted(os.path.basename(x) for x in glob.glob(str(output_files / '*.json')))
+
+
+def known_log(events):
+    return events[~events.user.isin(NEW_USERS)]
+
+
+def test_cached_roles_match_discovery(events, output_files):
+    expected = rl.ResourcePoolAnalyser(events, sim_threshold=0.85).resource_table
+    assert rc.discover_resources(events, 0.85, FOLDER) == expected
+    written = entries(output_files)
+    assert rc.discover_resources(events, 0.85, FOLDER) == expected
+    assert entries(output_files) == written
+
+
+def test_thresholds_have_their_own_entries(events, output_files):
+    for sim_threshold in [0.85, 0.5, 0.85, 0.5]:
+        expected = rl.ResourcePoolAnalyser(events, sim_threshold=sim_threshold).resource_table
+        assert rc.discover_resources(events, sim_threshold, FOLDER) == expected
+    fingerprint = rc.fingerprint(rl.ResourcePoolAnalyser.read_resource_pool(events))
+    assert entries(output_files) == sorted([rc.entry_key(fingerprint, 0.85) + '.json',
+                                            rc.entry_key(fingerprint, 0.5) + '.json',
+                                            rc.base_key(0.85) + '.json',
+                                            rc.base_key(0.5) + '.json'])
+
+
+def test_incremental_roles_join_the_base(events, output_files):
+    base = rc.discover_resources(known_log(events), 0.85, FOLDER, incremental=True)
+    # a later discovery of another log does not replace the base
+    other = events[events.user.isin(['A', 'B', 'C', 'K'])]
+    rc.discover_resources(other, 0.85, FOLDER)
+    table = rc.discover_resources(events, 0.85, FOLDER, incremental=True)
+    roles = {x['resource']: x['role'] for x in table}
+    assert {x['resource']: roles[x['resource']] for x in base} == {
+        x['resource']: x['role'] for x in base}
+    assert set(roles) == set(events.user)
+    known = rc.read_entry(rc.cache_path(FOLDER, rc.base_key(0.85)))
+    expected = rl.ResourcePoolAnalyser(events, sim_threshold=0.85, known=known).resource_table
+    assert table == expected
+
+
+def test_incremental_base_is_kept_per_threshold(events, output_files):
+    rc.discover_resources(known_log(events), 0.85, FOLDER, incremental=True)
+    table = rc.discover_resources(events, 0.5, FOLDER, incremental=True)
+    assert table == rl.ResourcePoolAnalyser(events, sim_threshold=0.5).resource_table
+
+
+def test_unwritable_cache_is_skipped(events, output_files):
+    # a file in place of the cache folder fails the write even as root
+    output_files.parent.mkdir(parents=True)
+    output_files.write_text('')
+    expected = rl.ResourcePoolAnalyser(events, sim_threshold=0.85).resource_table
+    assert rc.discover_resources(events, 0.85, FOLDER, incremental=True) == expected
+    assert output_files.is_file()